@@ -0,0 +1,75 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import argparse
+import time
+import cv2
+from uap_tracker.blob_detector import BlobDetector
+from uap_tracker.background_subtractor_factory import BackgroundSubtractorFactory
+from wmv_benchmark import read_grey_frames
+
+try:
+    import pysky360
+except ImportError:
+    pysky360 = None
+
+# Benchmark of the blob detectors. The grey frames of a video are background subtracted with MOG2 and the same masked
+# background frames are then handed to each of the blob detectors, the time each of them takes is reported along with the
+# number of blobs they find.
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Compare the blob detectors on the masked background of a video.')
+
+    parser.add_argument('-f', '--file', help='Path to the video file to read the frames from')
+    parser.add_argument('--frames', type=int, default=300, help='Max number of frames to process')
+    parser.add_argument('--dimension', type=int, default=0, help='Resize the frames so that the largest dimension is this size')
+    parser.add_argument('--sensitivity', type=int, default=2, help='Detection sensitivity, 1, 2 or 3')
+    parser = parser.parse_args(args)
+
+    if parser.file is None:
+        raise ValueError('Must provide --file to read the frames from,')
+
+    frames = read_grey_frames(parser.file, parser.frames, parser.dimension)
+    if len(frames) == 0:
+        raise ValueError(f'Unable to read any frames from {parser.file}')
+    print(f"Read {len(frames)} frames of h x w = {frames[0].shape[0]} x {frames[0].shape[1]}")
+
+    masked_background_frames = masked_backgrounds(frames, parser.sensitivity)
+
+    detector_types = ['simple', 'connected_components']
+    if pysky360 is not None:
+        detector_types.append('sky360')
+    else:
+        print('pysky360 is not installed, the sky360 blob detector can not be compared.')
+
+    for detector_type in detector_types:
+        settings = {'blob_detector_type': detector_type, 'detection_sensitivity': parser.sensitivity, 'bbox_fixed_size': False, 'bbox_size': 64}
+        blob_detector = BlobDetector.Select(settings)
+        blob_detector.initialise(frames[0])
+
+        blobs = 0
+        start = time.perf_counter()
+        for frame in masked_background_frames:
+            blobs += len(blob_detector.detect(frame))
+        seconds = time.perf_counter() - start
+        print(f"{detector_type}: {seconds * 1000 / len(frames):0.2f} ms per frame, {blobs} blobs")
+
+# Utility function to work out the masked background of the frames with MOG2
+def masked_backgrounds(frames, sensitivity):
+    background_subtractor = BackgroundSubtractorFactory.create('MOG2', {'detection_sensitivity': sensitivity})
+    masked_background_frames = []
+    for frame in frames:
+        foreground_mask = background_subtractor.apply(frame)
+        masked_background_frames.append(cv2.bitwise_and(frame, frame, mask=foreground_mask))
+    return masked_background_frames
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
 #!/bin/bash
 
 conda install pytorch torchvision cudatoolkit=11.3 -c pytorch
-conda install -c conda-forge dynaconf
\ No newline at end of file
+conda install -c conda-forge dynaconf scipy
\ No newline at end of file
@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+
+from config import settings
+from uap_tracker.app_settings import AppSettings
+from uap_tracker.controller import VideoController
+from uap_tracker.event_publisher import EventPublisher
+from uap_tracker.video_tracker import VideoTracker
+
+# Settings that only depend on OpenCV, so that the end to end tests run without pybgs / pysky360
+DEFAULT_OVERRIDES = {
+    'controller': 'video',
+    'detection_mode': 'background_subtraction',
+    'blob_detector_type': 'simple',
+    'background_subtractor_type': 'MOG2',
+    'mask_type': 'no_op',
+    'enable_track_validation': False,
+}
+
+# function to create the application settings the way main.py does, with overrides applied before validation
+def make_settings(**overrides):
+    app_settings = AppSettings.Get(settings)
+    app_settings.update(DEFAULT_OVERRIDES)
+    app_settings.update(overrides)
+    AppSettings.Validate(app_settings)
+    # Report every tracker from the frame it is created in
+    app_settings['tracker_wait_seconds_threshold'] = -1
+    return app_settings
+
+# function to write a video of small bright targets moving over a noisy grey background
+def write_video(path, frame_count=60, size=(320, 240), target_count=4, fps=30):
+    width, height = size
+    rng = np.random.default_rng(0)
+    targets = [(30 + i * 70, 40 + (i % 3) * 60, 1.5 - (i % 3), 1.0 + (i % 2)) for i in range(target_count)]
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    for i in range(frame_count):
+        frame = np.full((height, width, 3), 90, np.uint8) + rng.integers(0, 3, (height, width, 3), dtype=np.uint8)
+        for x, y, vx, vy in targets:
+            cv2.circle(frame, (int(x + vx * i) % width, int(y + vy * i) % height), 5, (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return str(path)
+
+##############################################################################################
+# Listener that records the live trackers of every frame so that two runs can be compared #
+##############################################################################################
+class TrackerRecorder():
+
+    def __init__(self):
+        self.frames = []
+        self.totals = None
+
+    def trackers_updated_callback(self, video_tracker):
+        trackers = sorted((tracker.id, tuple(int(v) for v in tracker.get_bbox()), tracker.tracking_state)
+                          for tracker in video_tracker.get_live_trackers())
+        self.frames.append((video_tracker.get_frame_count(), trackers))
+
+    def finish(self, total_trackers_started, total_trackers_finished):
+        self.totals = (total_trackers_started, total_trackers_finished)
+
+# function to run a video (file or capture) through the video controller, cv2.waitKey is patched out as it needs a highgui build
+def run_video(monkeypatch, app_settings, video, recorder=None):
+    monkeypatch.setattr(cv2, 'waitKey', lambda delay: -1)
+    events = EventPublisher()
+    if recorder is None:
+        recorder = TrackerRecorder()
+    events.listen(recorder)
+    video_tracker = VideoTracker(app_settings, events, None)
+    capture = cv2.VideoCapture(video) if isinstance(video, str) else video
+    VideoController(capture, video_tracker).run()
+    return recorder
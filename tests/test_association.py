@@ -0,0 +1,121 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import uap_tracker.association as association
+import uap_tracker.utils as utils
+from tests.helpers import make_settings, run_video, write_video
+
+def random_bboxes(rng, count):
+    return [(int(rng.integers(0, 300)), int(rng.integers(0, 200)), int(rng.integers(0, 60)), int(rng.integers(0, 60))) for _ in range(count)]
+
+@pytest.fixture
+def greedy(monkeypatch):
+    monkeypatch.setattr(association, 'linear_sum_assignment', None)
+
+@pytest.fixture
+def optimal():
+    pytest.importorskip('scipy')
+    assert association.linear_sum_assignment is not None
+
+# function to find the best assignment by trying them all, the most pairs inside the gate and then the lowest total cost
+def brute_force_assign(cost, gate):
+    rows, cols = cost.shape
+    best = (0, 0.0)
+    for perm in itertools.permutations(range(max(rows, cols)), rows):
+        pairs = [(row, col) for row, col in enumerate(perm) if col < cols and gate[row, col]]
+        score = (len(pairs), -sum(cost[row, col] for row, col in pairs))
+        best = max(best, score)
+    return best[0], -best[1]
+
+def assignment_score(cost, matches):
+    return len(matches), sum(cost[row, col] for row, col in matches)
+
+def test_empty_bbox_array():
+    assert association.as_bbox_array([]).shape == (0, 4)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matrices_match_utils(seed):
+    rng = np.random.default_rng(seed)
+    bboxes1, bboxes2 = random_bboxes(rng, 7), random_bboxes(rng, 9)
+    boxes1, boxes2 = association.as_bbox_array(bboxes1), association.as_bbox_array(bboxes2)
+
+    distance = association.centre_distance_matrix(boxes1, boxes2)
+    iou = association.iou_matrix(boxes1, boxes2)
+    intersects = association.intersects_matrix(boxes1, boxes2)
+    for i, bbox1 in enumerate(bboxes1):
+        for j, bbox2 in enumerate(bboxes2):
+            assert distance[i, j] == utils.calc_centre_point_distance(bbox1, bbox2)
+            assert iou[i, j] == pytest.approx(utils.bbox_overlap(bbox1, bbox2))
+            assert intersects[i, j] == (utils.bbox_overlap(bbox1, bbox2) > 0)
+
+def test_assign_nothing_in_the_gate():
+    assert association.assign(np.ones((2, 3)), np.zeros((2, 3), bool)) == []
+
+def test_greedy_assignment_is_one_to_one_and_gated(greedy):
+    cost = np.array([[1.0, 2.0, 9.0],
+                     [1.5, 8.0, 9.0],
+                     [9.0, 9.0, 9.0]])
+    gate = cost < 5
+    # row 0 takes its cheapest column first, which leaves row 1 without a column in its gate
+    assert sorted(association.assign(cost, gate)) == [(0, 0)]
+    gate[1, 1] = True
+    assert sorted(association.assign(cost, gate)) == [(0, 0), (1, 1)]
+
+def test_optimal_assignment_beats_greedy(optimal, monkeypatch):
+    cost = np.array([[1.0, 2.0],
+                     [2.0, 100.0]])
+    gate = np.ones((2, 2), bool)
+    assert sorted(association.assign(cost, gate)) == [(0, 1), (1, 0)]
+    monkeypatch.setattr(association, 'linear_sum_assignment', None)
+    # greedy takes the cheapest pair first and is left with the most expensive one
+    assert sorted(association.assign(cost, gate)) == [(0, 0), (1, 1)]
+
+@pytest.mark.parametrize('seed', range(20))
+def test_assignment_with_and_without_scipy(optimal, monkeypatch, seed):
+    rng = np.random.default_rng(seed)
+    cost = np.floor(rng.uniform(0, 50, (int(rng.integers(1, 6)), int(rng.integers(1, 6)))))
+    gate = cost < 30
+    best = brute_force_assign(cost, gate)
+
+    matches = association.assign(cost, gate)
+    assert assignment_score(cost, matches) == best
+
+    monkeypatch.setattr(association, 'linear_sum_assignment', None)
+    greedy_matches = association.assign(cost, gate)
+    # greedy is one to one and gated, but can end up with fewer pairs or a higher cost
+    assert len({row for row, _ in greedy_matches}) == len({col for _, col in greedy_matches}) == len(greedy_matches)
+    assert all(gate[row, col] for row, col in greedy_matches)
+    greedy_count, greedy_cost = assignment_score(cost, greedy_matches)
+    assert greedy_count < best[0] or (greedy_count == best[0] and greedy_cost >= best[1])
+
+def test_tracks_the_same_with_and_without_scipy(optimal, monkeypatch, tmp_path):
+    # With targets well apart every tracker has one detection in its gate, there both assignments agree
+    video = write_video(tmp_path / 'targets.avi', frame_count=30)
+    expected = run_video(monkeypatch, make_settings(track_association='global'), video)
+    monkeypatch.setattr(association, 'linear_sum_assignment', None)
+    results = run_video(monkeypatch, make_settings(track_association='global'), video)
+    assert results.frames == expected.frames
+    assert results.totals == expected.totals
+
+def test_associate_without_trackers_or_detections():
+    matches, unmatched = association.associate(association.as_bbox_array([]), association.as_bbox_array([(0, 0, 4, 4)]), 10)
+    assert matches == [] and list(unmatched) == [0]
+    matches, unmatched = association.associate(association.as_bbox_array([(0, 0, 4, 4)]), association.as_bbox_array([]), 10)
+    assert matches == [] and list(unmatched) == []
+
+def test_associate_absorbs_fragments_and_leaves_far_detections_unmatched(greedy):
+    trackers = association.as_bbox_array([(10, 10, 10, 10), (100, 100, 10, 10)])
+    detections = association.as_bbox_array([(102, 101, 10, 10), (12, 11, 10, 10), (14, 14, 10, 10), (200, 10, 10, 10)])
+    matches, unmatched = association.associate(trackers, detections, 20)
+    assert sorted(matches) == [(0, 1), (1, 0)]
+    # detection 2 is near tracker 0, which already has a detection, so it is absorbed rather than unmatched
+    assert list(unmatched) == [3]
+
+def test_associate_only_assigns_trackers_that_can_match(greedy):
+    trackers = association.as_bbox_array([(10, 10, 10, 10), (100, 100, 10, 10)])
+    detections = association.as_bbox_array([(12, 11, 10, 10), (102, 101, 10, 10)])
+    matches, unmatched = association.associate(trackers, detections, 20, can_match=[False, True])
+    assert matches == [(1, 1)]
+    assert list(unmatched) == []
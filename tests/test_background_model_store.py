@@ -0,0 +1,125 @@
+import cv2
+import numpy as np
+import pytest
+
+from uap_tracker.background_model_store import BackgroundModelStore
+from uap_tracker.background_subtractor_factory import BackgroundSubtractorFactory
+from uap_tracker.frame_processor import FrameProcessor
+from tests.helpers import make_settings, write_video
+
+META = {'frame_size': [320, 240], 'mask_type': 'no_op', 'roi': None}
+
+def make_store(tmp_path, history=3, max_age=600):
+    return BackgroundModelStore({
+        'bg_model_store_path': str(tmp_path / 'models' / 'background.npz'),
+        'bg_model_store_history': history,
+        'bg_model_store_max_age': max_age,
+    })
+
+# Background subtractor that exposes its model, like the NumPy background subtractors
+class StatefulBackgroundSubtractor():
+
+    def __init__(self, value=0):
+        self.mean = np.full((4, 5), value, np.float32)
+        self.count = np.array(value)
+
+    def get_state(self):
+        return {'mean': self.mean, 'count': self.count}
+
+    def set_state(self, state):
+        self.mean = state['mean']
+        self.count = state['count']
+
+# Background subtractor that does not expose its model, like the OpenCV background subtractors
+class OpaqueBackgroundSubtractor():
+    pass
+
+def make_frame(value):
+    return np.full((4, 5), value, np.uint8)
+
+def test_nothing_to_load(tmp_path):
+    assert not make_store(tmp_path).load(META, [StatefulBackgroundSubtractor()], None)
+
+def test_nothing_to_save(tmp_path):
+    store = make_store(tmp_path)
+    assert not store.save(META, [OpaqueBackgroundSubtractor()])
+    assert not (tmp_path / 'models').exists()
+
+def test_state_round_trip(tmp_path):
+    store = make_store(tmp_path)
+    assert store.save(META, [StatefulBackgroundSubtractor(3), StatefulBackgroundSubtractor(7)])
+
+    restored = [StatefulBackgroundSubtractor(), StatefulBackgroundSubtractor()]
+    assert make_store(tmp_path).load(dict(META), restored, None)
+    assert (restored[0].mean == 3).all() and restored[0].mean.dtype == np.float32 and restored[0].count == 3
+    assert (restored[1].mean == 7).all() and restored[1].count == 7
+
+def test_history_is_replayed_oldest_frame_first(tmp_path):
+    store = make_store(tmp_path, history=3)
+    for value in range(5):
+        store.record(make_frame(value))
+    assert store.save(META, [OpaqueBackgroundSubtractor()])
+
+    replayed = []
+    assert make_store(tmp_path).load(META, [OpaqueBackgroundSubtractor()], lambda frame: replayed.append(int(frame[0, 0])))
+    assert replayed == [2, 3, 4]
+
+def test_history_restarts_when_the_frame_size_changes(tmp_path):
+    store = make_store(tmp_path, history=3)
+    store.record(make_frame(1))
+    store.record(np.zeros((2, 2), np.uint8))
+    assert store.history_count == 1
+
+def test_snapshot_of_other_settings_is_ignored(tmp_path):
+    store = make_store(tmp_path)
+    store.save(META, [StatefulBackgroundSubtractor(3)])
+    restored = StatefulBackgroundSubtractor()
+    assert not store.load(dict(META, mask_type='fish_eye'), [restored], None)
+    assert (restored.mean == 0).all()
+
+def test_old_snapshot_is_ignored(tmp_path):
+    make_store(tmp_path).save(META, [StatefulBackgroundSubtractor(3)])
+    assert not make_store(tmp_path, max_age=-1).load(META, [StatefulBackgroundSubtractor()], None)
+
+def test_state_snapshot_needs_stateful_subtractors(tmp_path):
+    make_store(tmp_path).save(META, [StatefulBackgroundSubtractor(3)])
+    assert not make_store(tmp_path).load(META, [OpaqueBackgroundSubtractor()], None)
+
+# function to run the frames through a frame processor that stores its background model, returns whether it was warm started
+# and the masked background of every frame after the first
+def process_frames(app_settings, frames):
+    processor = FrameProcessor.Select(app_settings, None, BackgroundSubtractorFactory.Select(app_settings))
+    masked_backgrounds = []
+    with processor:
+        processor.initialise(frames[0])
+        for frame_count, frame in enumerate(frames[1:], 1):
+            frame_result = processor.detect_frame(processor.preprocess_frame(frame, frame_count))
+            masked_backgrounds.append(frame_result.get_frame_masked_background().copy())
+            frame_result.release_buffers()
+    return processor.warm_started, masked_backgrounds
+
+def store_settings(tmp_path, background_subtractor_type):
+    app_settings = make_settings(background_subtractor_type=background_subtractor_type, bg_model_store_history=30,
+                                 bg_model_store_path=str(tmp_path / 'background.npz'))
+    # The store is only enabled with the camera controller, the processor doesn't care where its frames come from
+    app_settings['bg_model_store_enabled'] = True
+    return app_settings
+
+# The NumPy background subtractors export their model, the OpenCV ones are rebuilt from the frames fed to them. The history
+# covers the whole first run here, so both carry on as if the processor had never been closed.
+@pytest.mark.parametrize('background_subtractor_type', ['NP_WMV', 'MOG2'])
+def test_processor_round_trip(tmp_path, background_subtractor_type):
+    capture = cv2.VideoCapture(write_video(tmp_path / 'targets.avi', frame_count=20))
+    frames = [capture.read()[1] for _ in range(20)]
+    app_settings = store_settings(tmp_path, background_subtractor_type)
+    _, uninterrupted = process_frames(dict(app_settings, bg_model_store_enabled=False), frames)
+
+    warm_started, _ = process_frames(app_settings, frames[:10])
+    assert not warm_started
+    assert (tmp_path / 'background.npz').exists()
+
+    warm_started, restored = process_frames(app_settings, frames[9:])
+    assert warm_started
+    assert any(masked_background.any() for masked_background in restored)
+    for masked_background, expected in zip(restored, uninterrupted[9:]):
+        assert np.array_equal(masked_background, expected)
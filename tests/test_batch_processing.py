@@ -0,0 +1,51 @@
+import os
+
+import cv2
+import pytest
+
+import uap_tracker.main as main
+from uap_tracker.controller import VideoController
+from tests.helpers import make_settings, write_video
+
+# The workers run the video controller, which polls cv2.waitKey, so processing a video needs an OpenCV build with highgui
+def has_highgui():
+    try:
+        cv2.waitKey(1)
+        return True
+    except cv2.error:
+        return False
+
+@pytest.fixture
+def batch_dirs(tmp_path, monkeypatch):
+    input_dir, processed_dir, output_dir = tmp_path / 'input', tmp_path / 'processed', tmp_path / 'output'
+    for directory in (input_dir, processed_dir, output_dir):
+        directory.mkdir()
+    monkeypatch.setattr(main.settings, 'input_dir', str(input_dir))
+    return input_dir, processed_dir, output_dir
+
+def write_broken_video(path):
+    path.write_text('not a video')
+    return path.name
+
+def test_failed_files_are_left_in_the_input_dir(batch_dirs):
+    input_dir, processed_dir, output_dir = batch_dirs
+    files = sorted([write_broken_video(input_dir / 'a.avi'), write_broken_video(input_dir / 'b.avi')])
+
+    main._process_files_parallel(VideoController, files, str(processed_dir), str(output_dir), make_settings(batch_workers=2))
+
+    assert sorted(os.listdir(input_dir)) == files
+    assert os.listdir(processed_dir) == []
+    # each worker writes to a sub directory named after its file
+    assert sorted(os.listdir(output_dir)) == files
+
+@pytest.mark.skipif(not has_highgui(), reason='the video controller needs an OpenCV build with highgui')
+def test_processed_files_are_moved(batch_dirs):
+    input_dir, processed_dir, output_dir = batch_dirs
+    write_video(input_dir / 'a.avi', frame_count=10)
+    write_video(input_dir / 'b.avi', frame_count=10)
+    files = sorted(['a.avi', 'b.avi', write_broken_video(input_dir / 'c.avi')])
+
+    main._process_files_parallel(VideoController, files, str(processed_dir), str(output_dir), make_settings(batch_workers=2))
+
+    assert os.listdir(input_dir) == ['c.avi']
+    assert sorted(os.listdir(processed_dir)) == ['a.avi', 'b.avi']
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from uap_tracker.background_subtractor_factory import BackgroundSubtractorFactory
+from uap_tracker.frame_processor import FrameProcessor, FrameResult
+from tests.helpers import make_settings, run_video, write_video
+
+def make_frame_processor(**overrides):
+    settings = make_settings(cascade_enabled=True, **overrides)
+    return FrameProcessor.Select(settings=settings, dense_optical_flow=None, background_subtractor=BackgroundSubtractorFactory.Select(settings))
+
+def centre(bbox):
+    x, y, w, h = bbox
+    return np.array([x + w / 2, y + h / 2])
+
+def test_candidates_are_verified_by_their_contrast():
+    frame_processor = make_frame_processor(cascade_contrast_threshold=20)
+    frame_grey = np.full((100, 100), 80, np.uint8)
+    frame_grey[20:24, 20:24] = 110
+    frame_grey[60:64, 60:64] = 90
+    frame_grey[60:64, 20:24] = 50
+    candidates = [(18, 18, 8, 8), (58, 58, 8, 8), (18, 58, 8, 8), (200, 200, 8, 8)]
+    # the bright and the dark target stand out, the faint one and the one outside of the frame do not
+    assert frame_processor._verify_candidates(frame_grey, candidates) == [(18, 18, 8, 8), (18, 58, 8, 8)]
+
+def test_cascade_is_disabled_for_small_frames():
+    frame_processor = make_frame_processor(cascade_detection_dimension=960)
+    frame_processor.initialise(np.zeros((240, 320, 3), np.uint8))
+    assert frame_processor.cascade_size is None
+
+@pytest.mark.parametrize('bbox_fixed_size, expected', [(False, [(20, 20, 32, 32)]), (True, [(24, 24, 24, 24)])])
+def test_candidates_are_scaled_up_to_the_full_resolution(bbox_fixed_size, expected):
+    frame_processor = make_frame_processor(cascade_detection_dimension=240, cascade_contrast_threshold=0,
+                                           bbox_fixed_size=bbox_fixed_size, bbox_size=24)
+    frame_processor.initialise(np.zeros((480, 640, 3), np.uint8))
+    frame_result = FrameResult(0, frame_grey=np.zeros((480, 640), np.uint8), buffer_pool=frame_processor.buffer_pool)
+    # The candidate is proposed on the 320 x 240 frame, its centre (18, 18) is (36, 36) at full resolution
+    frame_processor.bboxes_from_bg_subtraction = lambda frame_grey, stream, dst: ([(10, 10, 16, 16)], dst)
+    frame_processor._detect_cascade(frame_result, None)
+    assert frame_result.bboxes == expected
+
+def test_cascade_tracks_like_the_full_resolution_detection(monkeypatch, tmp_path):
+    video = write_video(tmp_path / 'targets.avi', frame_count=20, size=(640, 480))
+    expected = run_video(monkeypatch, make_settings(), video)
+    results = run_video(monkeypatch, make_settings(cascade_enabled=True, cascade_detection_dimension=320), video)
+    assert len(results.frames) == len(expected.frames)
+    # the trackers can be created in another order, but they follow the same targets at full resolution
+    expected_trackers, trackers = expected.frames[-1][1], results.frames[-1][1]
+    assert len(expected_trackers) > 0 and len(trackers) == len(expected_trackers)
+    for _, expected_bbox, _ in expected_trackers:
+        assert min(np.abs(centre(bbox) - centre(expected_bbox)).max() for _, bbox, _ in trackers) <= 6
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+import uap_tracker.association as association
+from uap_tracker.blob_detector import BlobDetector
+from tests.helpers import make_settings, write_video, run_video
+
+def make_detector(sensitivity=1, bbox_fixed_size=False, bbox_size=64, shape=(200, 400)):
+    detector = BlobDetector.Select({
+        'blob_detector_type': 'connected_components',
+        'detection_sensitivity': sensitivity,
+        'bbox_fixed_size': bbox_fixed_size,
+        'bbox_size': bbox_size,
+    })
+    detector.initialise(np.zeros(shape, np.uint8))
+    return detector
+
+# function to work out the bbox of a solid rectangular blob (x1,y1,w,h) the way kp_to_bbox would size it, 6 times its diameter
+# around its centre
+def scaled(x, y, w, h):
+    half_size = 6 * (w + h) / 2 / 2
+    cx, cy = x + (w - 1) / 2, y + (h - 1) / 2
+    return (int(cx - half_size), int(cy - half_size), int(cx + half_size) - int(cx - half_size), int(cy + half_size) - int(cy - half_size))
+
+def test_select():
+    assert type(make_detector()).__name__ == 'ConnectedComponentsBlobDetector'
+
+def test_min_distance():
+    assert make_detector(shape=(200, 400)).min_distance == 20
+    assert make_detector(bbox_fixed_size=True, bbox_size=64).min_distance == 32
+
+def test_empty_frame():
+    bboxes = make_detector().detect(np.zeros((200, 400), np.uint8))
+    assert bboxes.shape == (0, 4)
+
+def test_blobs_are_thresholded_and_labelled():
+    frame = np.zeros((200, 400), np.uint8)
+    frame[10:14, 20:25] = 200
+    # darker than the threshold, this is background
+    frame[100:110, 100:110] = 2
+    # touching diagonally, that's the same blob
+    frame[50:53, 300:303] = 50
+    frame[53:56, 303:306] = 50
+    bboxes = make_detector().detect(frame)
+    # The first blob is clipped to the top of the frame
+    assert association.as_bbox_tuples(bboxes) == [(8, 0, 27, 25), (284, 34, 36, 36)]
+
+@pytest.mark.parametrize('sensitivity, big_enough, too_small', [(2, (2, 5), (3, 3)), (3, (5, 5), (4, 6))])
+def test_small_blobs_are_dropped(sensitivity, big_enough, too_small):
+    frame = np.zeros((200, 400), np.uint8)
+    frame[100:100 + big_enough[1], 100:100 + big_enough[0]] = 255
+    frame[100:100 + too_small[1], 300:300 + too_small[0]] = 255
+    bboxes = make_detector(sensitivity).detect(frame)
+    assert association.as_bbox_tuples(bboxes) == [scaled(100, 100, *big_enough)]
+
+def test_blobs_need_a_width_and_height_of_two():
+    frame = np.zeros((200, 400), np.uint8)
+    frame[10, 10:60] = 255
+    frame[100, 100] = frame[101, 101] = 255
+    bboxes = make_detector(1).detect(frame)
+    assert association.as_bbox_tuples(bboxes) == [scaled(100, 100, 2, 2)]
+
+def test_blobs_near_a_bigger_blob_are_dropped():
+    frame = np.zeros((200, 400), np.uint8)
+    frame[50:56, 50:56] = 255
+    # within 20 pixels of the bigger blob
+    frame[60:63, 60:63] = 255
+    # far enough away
+    frame[50:53, 80:83] = 255
+    bboxes = make_detector().detect(frame)
+    assert association.as_bbox_tuples(bboxes) == [scaled(50, 50, 6, 6), scaled(80, 50, 3, 3)]
+
+def test_blobs_near_a_dropped_blob_are_kept():
+    frame = np.zeros((200, 400), np.uint8)
+    frame[50:56, 50:56] = 255
+    # within 20 pixels of the biggest blob
+    frame[50:55, 65:70] = 255
+    # within 20 pixels of the second blob but not of the biggest one
+    frame[50:53, 80:83] = 255
+    bboxes = make_detector().detect(frame)
+    assert association.as_bbox_tuples(bboxes) == [scaled(50, 50, 6, 6), scaled(80, 50, 3, 3)]
+
+def test_offset_is_added():
+    frame = np.zeros((200, 400), np.uint8)
+    frame[10:14, 20:25] = 200
+    frame[100:104, 100:105] = 200
+    bboxes = make_detector(shape=(300, 500)).detect(frame, (7, 9))
+    assert association.as_bbox_tuples(bboxes) == [(15, 7, 27, 27), scaled(107, 109, 5, 4)]
+
+def test_bboxes_are_clipped_to_the_init_frame():
+    frame = np.zeros((50, 100), np.uint8)
+    frame[0:3, 97:100] = 255
+    frame[47:50, 0:3] = 255
+    # The frame is the bottom right region of the init frame
+    bboxes = make_detector(shape=(200, 400)).detect(frame, (300, 150))
+    assert association.as_bbox_tuples(bboxes) == [(389, 142, 11, 18), (292, 189, 18, 11)]
+
+def test_video_tracker_runs_on_blobs_at_the_edges(tmp_path, monkeypatch):
+    # The targets wrap around the edges of the frame, so there are tiny blobs cut off by the edges
+    video = write_video(tmp_path / 'targets.avi', frame_count=60, target_count=6)
+    recorder = run_video(monkeypatch, make_settings(blob_detector_type='connected_components', tracker_type='CSRT'), video)
+    assert recorder.totals[0] > 0
+    for _, trackers in recorder.frames:
+        for _, (x, y, w, h), _ in trackers:
+            assert w >= 12 and h >= 12
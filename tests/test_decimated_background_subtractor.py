@@ -0,0 +1,81 @@
+import cv2
+import numpy as np
+
+from uap_tracker.background_subtractor_factory import BackgroundSubtractorFactory
+from uap_tracker.decimated_background_subtractor import DecimatedBackgroundSubtractor
+from tests.helpers import make_settings
+
+SETTINGS = {
+    'bg_decimation_max_interval': 4,
+    'bg_decimation_diff_threshold': 15,
+    'bg_decimation_change_threshold': 0.01,
+}
+
+# Background subtractor that records the frames it has been applied to, everything brighter than 150 is foreground
+class FakeBackgroundSubtractor():
+
+    def __init__(self):
+        self.frame_counts = []
+
+    def apply(self, frame):
+        self.frame_counts.append(int(frame[0, 0]))
+        return np.where(frame > 150, 255, 0).astype(np.uint8)
+
+# a frame with its frame count in the top left corner, so that the fake subtractor knows which frame it has been given
+def make_frame(frame_count, value=100):
+    frame = np.full((40, 50), value, np.uint8)
+    frame[0, 0] = frame_count
+    return frame
+
+def test_model_updates_are_decimated():
+    background_subtractor = FakeBackgroundSubtractor()
+    decimated = DecimatedBackgroundSubtractor(SETTINGS, background_subtractor)
+    for frame_count in range(1, 24):
+        decimated.apply(make_frame(frame_count))
+    # every frame of the warm-up, after which the interval grows by one per update up to the max interval
+    assert background_subtractor.frame_counts == [1, 2, 3, 4, 5, 6, 8, 11, 15, 19, 23]
+
+def test_frames_in_between_are_differenced_with_the_background():
+    decimated = DecimatedBackgroundSubtractor(SETTINGS, FakeBackgroundSubtractor())
+    for frame_count in range(1, 7):
+        decimated.apply(make_frame(frame_count))
+
+    frame = make_frame(7)
+    frame[10, 10] = 120
+    frame[20, 20] = 110
+    foreground_mask = decimated.apply(frame)
+    expected = np.zeros(frame.shape, np.uint8)
+    expected[10, 10] = 255
+    assert np.array_equal(foreground_mask, expected)
+
+def test_targets_do_not_leave_ghosts_in_the_background():
+    decimated = DecimatedBackgroundSubtractor(SETTINGS, FakeBackgroundSubtractor())
+    decimated.apply(make_frame(1))
+    for frame_count in range(2, 7):
+        frame = make_frame(frame_count)
+        # a target that the model sees as foreground is not copied into the background
+        frame[30:33, 30:33] = 200
+        decimated.apply(frame)
+    assert (decimated.background[30:33, 30:33] == 100).all()
+    assert (decimated.apply(make_frame(7))[30:33, 30:33] == 0).all()
+
+def test_scene_changes_update_the_model_more_often():
+    background_subtractor = FakeBackgroundSubtractor()
+    decimated = DecimatedBackgroundSubtractor(SETTINGS, background_subtractor)
+    for frame_count in range(1, 16):
+        decimated.apply(make_frame(frame_count))
+    assert decimated.interval == 4
+
+    # the light changes on frame 16, the model is updated on the next frame and the interval is halved
+    decimated.apply(make_frame(16, value=130))
+    decimated.apply(make_frame(17, value=130))
+    assert background_subtractor.frame_counts[-1] == 17
+    assert decimated.interval == 2
+
+def test_factory_wraps_the_background_subtractor():
+    settings = make_settings(background_subtractor_type='MOG2', bg_decimation_enabled=True)
+    background_subtractor = BackgroundSubtractorFactory.Select(settings)
+    assert isinstance(background_subtractor, DecimatedBackgroundSubtractor)
+    assert isinstance(background_subtractor.background_subtractor, cv2.BackgroundSubtractorMOG2)
+    settings['bg_decimation_enabled'] = False
+    assert isinstance(BackgroundSubtractorFactory.Select(settings), cv2.BackgroundSubtractorMOG2)
@@ -0,0 +1,98 @@
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from uap_tracker.ffmpeg_capture import DecodedFrame, FFmpegPipeCapture, _is_number, _parse_frame_rate
+from uap_tracker.frame_processor import LUMA_TO_GREY
+from tests.helpers import make_settings, run_video, write_video
+
+def decode(frame):
+    height, width = frame.shape[:2]
+    return DecodedFrame(cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420), width, height)
+
+# Capture that hands out the frames of a video the way they come out of the ffmpeg pipe capture
+class DecodedCapture():
+
+    def __init__(self, path):
+        self.capture = cv2.VideoCapture(path)
+
+    def read(self):
+        success, frame = self.capture.read()
+        if not success:
+            return False, None
+        return True, decode(frame)
+
+    def get(self, property_id):
+        return self.capture.get(property_id)
+
+def random_frame(seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (24, 32, 3), dtype=np.uint8)
+
+def test_decoded_frame():
+    frame = random_frame()
+    yuv = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+    decoded = DecodedFrame(yuv, 32, 24)
+    assert decoded.shape == (24, 32, 3) and decoded.dtype == np.uint8
+    # the luma plane is a view of the start of the buffer
+    assert np.shares_memory(decoded.luma, yuv)
+    assert decoded.luma.shape == (24, 32)
+    expected = cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420)
+    assert np.array_equal(decoded.to_bgr(), expected)
+    dst = np.empty(decoded.shape, np.uint8)
+    assert decoded.to_bgr(dst) is dst
+    assert np.array_equal(dst, expected)
+
+def test_luma_to_grey_expands_the_limited_range():
+    assert LUMA_TO_GREY[0] == 0 and LUMA_TO_GREY[16] == 0
+    assert LUMA_TO_GREY[235] == 255 and LUMA_TO_GREY[255] == 255
+    assert (np.diff(LUMA_TO_GREY.astype(int)) >= 0).all()
+
+def test_luma_to_grey_is_close_to_the_grey_of_the_colour_frame():
+    # neutral greys in the limited range of a video
+    luma = np.tile(np.arange(16, 236, dtype=np.uint8), (4, 1))
+    yuv = np.concatenate([luma, np.full((luma.shape[0] // 2, luma.shape[1]), 128, np.uint8)])
+    grey = cv2.cvtColor(cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420), cv2.COLOR_BGR2GRAY)
+    assert np.abs(cv2.LUT(luma, LUMA_TO_GREY).astype(int) - grey.astype(int)).max() <= 2
+
+def test_parse_frame_rate():
+    assert _parse_frame_rate('30000/1001') == pytest.approx(29.97, abs=0.01)
+    assert _parse_frame_rate('25/1') == 25.0
+    assert _parse_frame_rate('0/0') == 0.0
+    assert _parse_frame_rate(None) == 0.0
+    assert _parse_frame_rate('N/A') == 0.0
+
+def test_is_number():
+    assert _is_number('12.5') and _is_number(3)
+    assert not _is_number('N/A') and not _is_number(None)
+
+def test_decoded_frames_are_tracked(monkeypatch, tmp_path):
+    video = write_video(tmp_path / 'targets.avi', frame_count=20)
+    expected = run_video(monkeypatch, make_settings(), video)
+    results = run_video(monkeypatch, make_settings(), DecodedCapture(video))
+    assert any(trackers for _, trackers in results.frames)
+    assert results.totals == expected.totals
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None, reason='needs ffmpeg and ffprobe')
+def test_pipe_capture_decodes_the_video(tmp_path):
+    video = write_video(tmp_path / 'targets.avi', frame_count=10)
+    capture = FFmpegPipeCapture(video, {'capture_max_dimension': 160})
+    assert capture.isOpened()
+    assert (capture.get(cv2.CAP_PROP_FRAME_WIDTH), capture.get(cv2.CAP_PROP_FRAME_HEIGHT)) == (160, 120)
+    assert capture.get(cv2.CAP_PROP_FPS) == 30
+    frames = []
+    while True:
+        success, frame = capture.read()
+        if not success:
+            break
+        frames.append(frame)
+    assert len(frames) == 10
+    assert frames[0].shape == (120, 160, 3)
+    assert capture.get(cv2.CAP_PROP_POS_MSEC) == pytest.approx(9 * 1000 / 30)
+
+    assert capture.set(cv2.CAP_PROP_POS_FRAMES, 5)
+    assert capture.get(cv2.CAP_PROP_POS_FRAMES) == 5
+    assert capture.read()[0]
+    capture.release()
+    assert not capture.isOpened()
@@ -0,0 +1,66 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import uap_tracker.utils as utils
+from uap_tracker.mask import Mask
+
+# The original fisheye mask, masks the whole frame and then clips it
+def reference_fisheye(frame, mask_pct):
+    height, width = frame.shape[:2]
+    mask_height = (100 - mask_pct) / 100.0
+    mask = np.zeros((height, width), dtype=np.uint8)
+    cv2.circle(mask, (int(width / 2), int(height / 2)), int(min(height, width) * mask_height / 2.0), 255, -1)
+    masked_frame = cv2.bitwise_and(frame, frame, mask=mask)
+    return utils.clip_at_center(masked_frame, (int(width / 2), int(height / 2)), width, height,
+                                int(mask_height * width), int(mask_height * height))
+
+def make_mask(mask_pct, cache_dir=None):
+    return Mask.Select({'mask_type': 'fish_eye', 'enable_cuda': False, 'mask_pct': mask_pct, 'mask_cache_dir': cache_dir})
+
+def random_frame(shape, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, shape, dtype=np.uint8)
+
+@pytest.mark.parametrize('shape', [(240, 320, 3), (241, 319, 3), (300, 200), (101, 101)])
+@pytest.mark.parametrize('mask_pct', [0, 10, 33])
+def test_matches_the_original_mask(shape, mask_pct):
+    mask = make_mask(mask_pct)
+    frame = random_frame(shape)
+    expected = reference_fisheye(frame, mask_pct)
+    assert mask.initialise(frame) == (int((100 - mask_pct) / 100.0 * shape[1]), int((100 - mask_pct) / 100.0 * shape[0]))
+    assert mask.get_output_shape(frame.shape) == expected.shape
+    assert np.array_equal(mask.apply(frame), expected)
+
+    # a dirty dst buffer is cleared outside of the circle
+    dst = np.full(expected.shape, 7, np.uint8)
+    assert mask.apply(random_frame(shape, 1), dst=dst) is dst
+    assert np.array_equal(mask.apply(frame, dst=dst), expected)
+
+def test_compiled_mask_is_cached(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    frame = random_frame((240, 320, 3))
+    make_mask(10, str(cache_dir)).initialise(frame)
+    cached = os.listdir(cache_dir)
+    assert len(cached) == 1 and cached[0].endswith('.png')
+
+    # a mask for another resolution or mask_pct gets its own file
+    make_mask(20, str(cache_dir)).initialise(frame)
+    make_mask(10, str(cache_dir)).initialise(random_frame((200, 320, 3)))
+    assert len(os.listdir(cache_dir)) == 3
+
+    mask = make_mask(10, str(cache_dir))
+    mask.initialise(frame)
+    assert np.array_equal(mask.apply(frame), reference_fisheye(frame, 10))
+
+def test_mismatched_cache_file_is_recompiled(tmp_path):
+    frame = random_frame((240, 320, 3))
+    make_mask(10, str(tmp_path)).initialise(frame)
+    filename = os.path.join(tmp_path, os.listdir(tmp_path)[0])
+    cv2.imwrite(filename, np.zeros((5, 5), np.uint8))
+
+    mask = make_mask(10, str(tmp_path))
+    mask.initialise(frame)
+    assert np.array_equal(mask.apply(frame), reference_fisheye(frame, 10))
+    assert cv2.imread(filename, cv2.IMREAD_GRAYSCALE).shape == mask.roi_mask.shape
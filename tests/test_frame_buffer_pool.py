@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from uap_tracker.frame_buffer_pool import FrameBufferPool
+from tests.helpers import TrackerRecorder, make_settings, run_video, write_video
+
+def test_released_buffers_are_reused():
+    pool = FrameBufferPool()
+    buffer = pool.acquire((4, 6, 3))
+    assert buffer.shape == (4, 6, 3) and buffer.dtype == np.uint8
+    pool.release(buffer)
+    assert pool.acquire((4, 6, 3)) is buffer
+    assert pool.allocated == 1
+
+def test_buffers_are_keyed_by_shape_and_dtype():
+    pool = FrameBufferPool()
+    buffer = pool.acquire((4, 6))
+    pool.release(buffer)
+    assert pool.acquire((6, 4)) is not buffer
+    assert pool.acquire((4, 6), np.float32).dtype == np.float32
+    assert pool.acquire([4, 6]) is buffer
+    assert pool.allocated == 3
+
+def test_prime_tops_up_the_free_buffers():
+    pool = FrameBufferPool()
+    pool.prime((4, 6), count=2)
+    assert pool.allocated == 2
+    pool.prime((4, 6), count=2)
+    assert pool.allocated == 2
+    buffers = [pool.acquire((4, 6)) for _ in range(3)]
+    assert len({id(buffer) for buffer in buffers}) == 3
+    assert pool.allocated == 3
+
+# Records how many buffers the frame processor has allocated after each frame
+class AllocationRecorder(TrackerRecorder):
+
+    def __init__(self):
+        super().__init__()
+        self.allocated = []
+
+    def trackers_updated_callback(self, video_tracker):
+        self.allocated.append(video_tracker.frame_proc.buffer_pool.allocated)
+
+@pytest.mark.parametrize('pipeline_enabled', [False, True])
+def test_frame_processing_stops_allocating(monkeypatch, tmp_path, pipeline_enabled):
+    video = write_video(tmp_path / 'targets.avi', frame_count=20)
+    recorder = run_video(monkeypatch, make_settings(pipeline_enabled=pipeline_enabled), video, AllocationRecorder())
+    assert len(recorder.allocated) == 19
+    # once every stage has seen a frame, each frame reuses the buffers released by the frames before it
+    assert len(set(recorder.allocated[5:])) == 1
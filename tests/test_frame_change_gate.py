@@ -0,0 +1,98 @@
+import cv2
+import numpy as np
+
+from uap_tracker.frame_change_gate import FrameChangeGate
+from tests.helpers import TrackerRecorder, make_settings, run_video
+
+SETTINGS = {
+    'frame_gate_dimension': 32,
+    'frame_gate_threshold': 8,
+    'frame_gate_refresh_interval': 10,
+}
+
+def make_gate(shape=(120, 160, 3), visibility=None):
+    gate = FrameChangeGate(SETTINGS)
+    gate.initialise(shape, visibility)
+    return gate
+
+def make_frame(value=100, shape=(120, 160, 3)):
+    return np.full(shape, value, np.uint8)
+
+def warm_up(gate, frame):
+    for _ in range(FrameChangeGate.WARMUP_FRAMES):
+        assert not gate.is_idle(frame, False)
+
+def test_thumbnail_size():
+    assert make_gate((1080, 1920, 3)).size == (32, 18)
+    assert make_gate((20, 10)).size == (10, 20)
+
+def test_unchanged_frames_are_idle_after_the_warm_up():
+    gate = make_gate()
+    warm_up(gate, make_frame())
+    assert gate.is_idle(make_frame(), False)
+    assert gate.is_idle(make_frame(105), False)
+
+def test_frames_are_never_idle_while_tracking():
+    gate = make_gate()
+    warm_up(gate, make_frame())
+    assert not gate.is_idle(make_frame(), True)
+
+def test_changed_frames_are_not_idle():
+    gate = make_gate()
+    warm_up(gate, make_frame())
+    frame = make_frame()
+    cv2.circle(frame, (80, 60), 10, (255, 255, 255), -1)
+    assert not gate.is_idle(frame, False)
+    # the changed frame is the new reference
+    assert gate.is_idle(frame, False)
+
+def test_slow_changes_build_up_against_the_last_processed_frame():
+    gate = make_gate()
+    warm_up(gate, make_frame(100))
+    assert [gate.is_idle(make_frame(100 + 3 * i), False) for i in range(1, 5)] == [True, True, False, True]
+
+def test_a_frame_is_processed_every_refresh_interval():
+    gate = make_gate()
+    warm_up(gate, make_frame())
+    idle = [gate.is_idle(make_frame(), False) for _ in range(22)]
+    assert idle == ([True] * 10 + [False]) * 2
+
+def test_changes_that_are_masked_out_are_ignored():
+    visibility = make_frame(0)
+    visibility[:, :80] = 255
+    gate = make_gate(visibility=visibility)
+    warm_up(gate, make_frame())
+    frame = make_frame()
+    frame[:, 100:] = 255
+    assert gate.is_idle(frame, False)
+    frame[:, 40:60] = 255
+    assert not gate.is_idle(frame, False)
+
+# Records which frames were idle
+class IdleRecorder(TrackerRecorder):
+
+    def __init__(self):
+        super().__init__()
+        self.idle = []
+
+    def trackers_updated_callback(self, video_tracker):
+        super().trackers_updated_callback(video_tracker)
+        self.idle.append(video_tracker.is_frame_idle())
+
+def test_idle_frames_are_skipped_until_a_target_appears(monkeypatch, tmp_path):
+    path = str(tmp_path / 'static.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (320, 240))
+    for i in range(30):
+        frame = make_frame(90, (240, 320, 3))
+        if i >= 15:
+            cv2.circle(frame, (40 + 6 * (i - 15), 100), 5, (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+    recorder = run_video(monkeypatch, make_settings(frame_gate_enabled=True), path, IdleRecorder())
+    # frame count 0 is the second frame of the video, the target appears on frame count 14
+    assert not any(recorder.idle[:FrameChangeGate.WARMUP_FRAMES])
+    assert all(recorder.idle[FrameChangeGate.WARMUP_FRAMES:14])
+    assert not recorder.idle[14]
+    assert any(trackers for _, trackers in recorder.frames[14:])
+    assert not any(trackers for _, trackers in recorder.frames[:14])
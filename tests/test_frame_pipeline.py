@@ -0,0 +1,105 @@
+import threading
+
+import cv2
+import pytest
+
+from uap_tracker.controller import VideoController
+from uap_tracker.event_publisher import EventPublisher
+from uap_tracker.frame_pipeline import FramePipeline
+from uap_tracker.video_tracker import VideoTracker
+from tests.helpers import TrackerRecorder, make_settings, run_video, write_video
+
+# Frame processor whose stages record the thread they ran on, and which can be made to fail on a given frame
+class FakeFrameProcessor():
+
+    def __init__(self, fail_frame_count=None):
+        self.fail_frame_count = fail_frame_count
+        self.threads = set()
+
+    def preprocess_frame(self, frame, frame_count, stream):
+        self.threads.add(threading.current_thread())
+        return [frame, frame_count]
+
+    def detect_frame(self, frame_result, stream):
+        self.threads.add(threading.current_thread())
+        if frame_result[1] == self.fail_frame_count:
+            raise ValueError(f'frame {frame_result[1]}')
+        return frame_result + ['detected']
+
+def test_frames_come_out_in_submission_order():
+    frame_proc = FakeFrameProcessor()
+    pipeline = FramePipeline(frame_proc, 2)
+    pipeline.start()
+    results = []
+    for frame_count in range(10):
+        pipeline.submit(f'frame {frame_count}', frame_count, 25.0, frame_count * 40.0)
+        if pipeline.is_full():
+            results.append(pipeline.collect())
+    while pipeline.has_pending():
+        results.append(pipeline.collect())
+    pipeline.stop()
+
+    assert results == [([f'frame {i}', i, 'detected'], 25.0, i * 40.0) for i in range(10)]
+    assert threading.current_thread() not in frame_proc.threads
+
+def test_depth_bounds_the_frames_in_flight():
+    pipeline = FramePipeline(FakeFrameProcessor(), 3)
+    pipeline.start()
+    for frame_count in range(3):
+        pipeline.submit(None, frame_count, 0, 0)
+        assert not pipeline.is_full()
+    pipeline.submit(None, 3, 0, 0)
+    assert pipeline.is_full()
+    pipeline.collect()
+    assert not pipeline.is_full()
+    pipeline.stop()
+    assert not pipeline.has_pending()
+
+def test_stage_exceptions_are_raised_on_collect():
+    pipeline = FramePipeline(FakeFrameProcessor(fail_frame_count=1), 2)
+    pipeline.start()
+    for frame_count in range(3):
+        pipeline.submit(None, frame_count, 0, 0)
+    assert pipeline.collect()[0][1] == 0
+    with pytest.raises(ValueError, match='frame 1'):
+        pipeline.collect()
+    # the stages carry on after a failed frame
+    assert pipeline.collect()[0][1] == 2
+    pipeline.stop()
+
+def test_stop_discards_uncollected_frames():
+    pipeline = FramePipeline(FakeFrameProcessor(), 1)
+    pipeline.start()
+    for frame_count in range(2):
+        pipeline.submit(None, frame_count, 0, 0)
+    pipeline.stop()
+    assert not pipeline.has_pending()
+    assert pipeline.threads == []
+
+def test_pipeline_tracks_like_the_serial_frame_processor(monkeypatch, tmp_path):
+    video = write_video(tmp_path / 'targets.avi', frame_count=30)
+    expected = run_video(monkeypatch, make_settings(pipeline_enabled=False), video)
+    results = run_video(monkeypatch, make_settings(pipeline_enabled=True, pipeline_depth=2), video)
+    assert any(trackers for _, trackers in expected.frames)
+    assert results.frames == expected.frames
+    assert results.totals == expected.totals
+
+# Like the camera controller, the same video tracker carries on with a new frame processor and pipeline in the next iteration
+@pytest.mark.parametrize('overrides', [{}, {'tracker_engine': 'process', 'tracker_process_workers': 2}, {'tracker_type': 'KALMAN'}])
+def test_finalise_ends_the_trackers_of_the_flushed_frames(monkeypatch, tmp_path, overrides):
+    monkeypatch.setattr(cv2, 'waitKey', lambda delay: -1)
+    video = write_video(tmp_path / 'targets.avi', frame_count=30)
+    events = EventPublisher()
+    recorder = TrackerRecorder()
+    events.listen(recorder)
+    video_tracker = VideoTracker(make_settings(pipeline_enabled=True, pipeline_depth=2, **overrides), events, None)
+
+    VideoController(cv2.VideoCapture(video), video_tracker).run()
+    started, finished = recorder.totals
+    assert started > 0 and started == finished
+    assert not video_tracker.is_tracking
+    assert not video_tracker.tracker_grid.is_bbox_being_tracked((0, 0, 320, 240))
+
+    VideoController(cv2.VideoCapture(video), video_tracker).run()
+    assert recorder.totals[0] > started
+    assert recorder.totals[0] == recorder.totals[1]
@@ -0,0 +1,87 @@
+import threading
+
+import cv2
+import pytest
+
+from uap_tracker.frame_reader import FrameReader
+from tests.helpers import make_settings, run_video, write_video
+
+# Capture that hands out numbered frames and records how many it has decoded
+class FakeCapture():
+
+    def __init__(self, frame_count):
+        self.frame_count = frame_count
+        self.reads = 0
+        self.read_event = threading.Event()
+
+    def read(self):
+        if self.reads >= self.frame_count:
+            return False, None
+        self.reads += 1
+        self.read_event.set()
+        return True, self.reads - 1
+
+    def get(self, prop):
+        assert prop == cv2.CAP_PROP_POS_MSEC
+        return self.reads * 40.0
+
+def read_all(reader):
+    results = []
+    with reader:
+        while True:
+            result = reader.read()
+            if not result[0]:
+                return results, result
+            results.append(result)
+
+@pytest.fixture(scope='module')
+def video(tmp_path_factory):
+    return write_video(tmp_path_factory.mktemp('video') / 'targets.avi', frame_count=30)
+
+def test_select():
+    assert type(FrameReader.Select({'frame_prefetch_enabled': False}, None)).__name__ == 'SynchronousFrameReader'
+    assert type(FrameReader.Select({'frame_prefetch_enabled': True, 'frame_prefetch_depth': 4}, None)).__name__ == 'PrefetchFrameReader'
+
+@pytest.mark.parametrize('depth', [1, 3, 100])
+def test_prefetch_reads_the_same_frames(depth):
+    expected, _ = read_all(FrameReader.Synchronous(FakeCapture(10), start_index=5))
+    results, end = read_all(FrameReader.Prefetch(FakeCapture(10), depth, start_index=5))
+    assert results == expected
+    assert [index for _, _, index, _ in results] == list(range(5, 15))
+    assert [timestamp for _, _, _, timestamp in results] == [40.0 * (i + 1) for i in range(10)]
+    assert not end[0]
+
+def test_prefetch_keeps_returning_the_end_of_the_stream():
+    reader = FrameReader.Prefetch(FakeCapture(2), 4)
+    with reader:
+        assert [reader.read()[0] for _ in range(5)] == [True, True, False, False, False]
+
+def test_prefetch_depth_bounds_the_decoded_frames():
+    capture = FakeCapture(100)
+    with FrameReader.Prefetch(capture, 3) as reader:
+        assert capture.read_event.wait(1.0)
+        # 3 frames fit in the queue and the decode thread holds on to the next one until there is room
+        for _ in range(50):
+            threading.Event().wait(0.01)
+        assert capture.reads <= 4
+        reader.read()
+        for _ in range(50):
+            if capture.reads == 5:
+                break
+            threading.Event().wait(0.01)
+        assert capture.reads == 5
+
+def test_prefetch_decodes_a_video_like_the_capture(video):
+    expected, _ = read_all(FrameReader.Synchronous(cv2.VideoCapture(video)))
+    results, _ = read_all(FrameReader.Prefetch(cv2.VideoCapture(video), 4))
+    assert len(results) == len(expected) == 30
+    for (_, expected_frame, expected_index, expected_timestamp), (_, frame, index, timestamp) in zip(expected, results):
+        assert (frame == expected_frame).all()
+        assert (index, timestamp) == (expected_index, expected_timestamp)
+
+def test_prefetch_tracks_like_the_synchronous_reader(monkeypatch, video):
+    expected = run_video(monkeypatch, make_settings(frame_prefetch_enabled=False), video)
+    results = run_video(monkeypatch, make_settings(frame_prefetch_enabled=True, frame_prefetch_depth=2), video)
+    assert any(trackers for _, trackers in expected.frames)
+    assert results.frames == expected.frames
+    assert results.totals == expected.totals
@@ -0,0 +1,124 @@
+import numpy as np
+
+from uap_tracker.tracker import Tracker
+from uap_tracker.tracker_engine import KalmanTrackerEngine
+
+def make_settings(**overrides):
+    settings = {
+        'kalman_process_noise': 1.0,
+        'kalman_measurement_noise': 4.0,
+        'kalman_min_hits': 3,
+        'kalman_max_misses': 5,
+        'enable_track_validation': False,
+        'track_prediction_enabled': False,
+        'track_plotting_enabled': False,
+        'track_history_max_length': 1000,
+        'track_history_decimation': 0,
+        'track_history_long_term_max_length': 1000,
+    }
+    settings.update(overrides)
+    return settings
+
+# The textbook kalman filter of a single track, one matrix operation at a time
+class ReferenceKalmanFilter():
+
+    F = np.array([[1, 0, 1, 0], [0, 1, 0, 1], [0, 0, 1, 0], [0, 0, 0, 1]], np.float64)
+    H = np.array([[1, 0, 0, 0], [0, 1, 0, 0]], np.float64)
+
+    def __init__(self, settings, bbox):
+        x, y, w, h = bbox
+        self.x = np.array([x + w / 2, y + h / 2, 0, 0], np.float64)
+        self.P = np.diag([settings['kalman_measurement_noise']] * 2 + [KalmanTrackerEngine.INITIAL_VELOCITY_VARIANCE] * 2)
+        self.Q = np.eye(4) * settings['kalman_process_noise']
+        self.R = np.eye(2) * settings['kalman_measurement_noise']
+
+    def predict(self):
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+
+    def correct(self, bbox):
+        x, y, w, h = bbox
+        z = np.array([x + w / 2, y + h / 2])
+        K = self.P @ self.H.T @ np.linalg.inv(self.H @ self.P @ self.H.T + self.R)
+        self.x = self.x + K @ (z - self.H @ self.x)
+        self.P = (np.eye(4) - K @ self.H) @ self.P
+
+def test_correct_matches_reference_filter():
+    settings = make_settings()
+    engine = KalmanTrackerEngine(settings)
+    first = engine.create_tracker(1, None, (10, 20, 8, 6))
+    second = engine.create_tracker(2, None, (200, 100, 4, 4))
+    references = [ReferenceKalmanFilter(settings, (10, 20, 8, 6)), ReferenceKalmanFilter(settings, (200, 100, 4, 4))]
+
+    rng = np.random.default_rng(0)
+    for i in range(1, 20):
+        engine.update_trackers([first, second], None)
+        for reference in references:
+            reference.predict()
+        detections = [(10 + 3 * i + int(rng.integers(-2, 3)), 20 + 2 * i + int(rng.integers(-2, 3)), 8, 6), (200 - i, 100, 4, 4)]
+        # Every third frame the second track goes without a detection
+        associations = [(first, detections[0])] if i % 3 == 0 else [(first, detections[0]), (second, detections[1])]
+        engine.apply_detections(associations)
+        for tracker, bbox in associations:
+            references[tracker.index].correct(bbox)
+
+        for index, reference in enumerate(references):
+            assert np.allclose(engine.states[index], reference.x)
+            assert np.allclose(engine.covariances[index], reference.P)
+
+def test_bbox_follows_the_detections():
+    engine = KalmanTrackerEngine(make_settings())
+    tracker = engine.create_tracker(1, None, (10, 10, 10, 10))
+    for i in range(1, 30):
+        engine.update_trackers([tracker], None)
+        engine.apply_detections([(tracker, (10 + 5 * i, 10, 10, 12))])
+    x, y, w, h = tracker.get_bbox()
+    assert abs(x - (10 + 5 * 29)) <= 1 and abs(y - 9) <= 1 and (w, h) == (10, 12)
+    # The velocity has been picked up, the prediction of the next frame is one step further along
+    (ok, (x, _, _, _)), = engine.update_trackers([tracker], None)
+    assert ok and abs(x - (10 + 5 * 30)) <= 1
+
+def test_tracking_states():
+    engine = KalmanTrackerEngine(make_settings(kalman_min_hits=3, kalman_max_misses=2))
+    tracker = engine.create_tracker(1, None, (10, 10, 10, 10))
+    states = []
+    for matched in (True, True, False, True, False, False):
+        results = engine.update_trackers([tracker], None)
+        engine.apply_detections([(tracker, (10, 10, 10, 10))] if matched else [])
+        states.append((results[0][0], tracker.tracking_state))
+    assert states == [
+        (True, Tracker.PROVISIONARY_TARGET),
+        (True, Tracker.ACTIVE_TARGET),
+        (True, Tracker.LOST_TARGET),
+        (True, Tracker.ACTIVE_TARGET),
+        (True, Tracker.LOST_TARGET),
+        (True, Tracker.LOST_TARGET)]
+    # Two misses in a row, the track has failed
+    assert engine.update_trackers([tracker], None) == [(False, (10, 10, 10, 10))]
+
+def test_track_validation_needs_the_target_to_move():
+    engine = KalmanTrackerEngine(make_settings(enable_track_validation=True, kalman_min_hits=2))
+    tracker = engine.create_tracker(1, None, (10, 10, 10, 10))
+    for x in (12, 14, 16, 18):
+        engine.update_trackers([tracker], None)
+        engine.apply_detections([(tracker, (x, 10, 10, 10))])
+        assert tracker.tracking_state == Tracker.PROVISIONARY_TARGET
+    for x in (40, 45):
+        engine.update_trackers([tracker], None)
+        engine.apply_detections([(tracker, (x, 10, 10, 10))])
+    assert tracker.tracking_state == Tracker.ACTIVE_TARGET
+
+def test_remove_trackers_keeps_the_other_tracks():
+    engines = [KalmanTrackerEngine(make_settings()), KalmanTrackerEngine(make_settings())]
+    trackers = [[engine.create_tracker(id, None, (id * 50, 10, 10, 10)) for id in range(3)] for engine in engines]
+    for engine, engine_trackers in zip(engines, trackers):
+        engine.update_trackers(engine_trackers, None)
+        engine.apply_detections([(tracker, (tracker.id * 50 + 2, 12, 10, 10)) for tracker in engine_trackers])
+
+    engines[0].remove_trackers([trackers[0][1]])
+    assert engines[0].trackers == [trackers[0][0], trackers[0][2]]
+    assert [tracker.index for tracker in engines[0].trackers] == [0, 1]
+    assert np.array_equal(engines[0].states, engines[1].states[[0, 2]])
+    assert np.array_equal(engines[0].covariances, engines[1].covariances[[0, 2]])
+    results = engines[1].update_trackers(trackers[1], None)
+    assert engines[0].update_trackers(engines[0].trackers, None) == [results[0], results[2]]
@@ -0,0 +1,83 @@
+import threading
+import time
+
+from uap_tracker.frame_reader import FrameReader
+
+# Camera that only delivers a frame when the test allows it to, so that the grabber thread can be controlled
+class FakeCamera():
+
+    def __init__(self):
+        self.allowed = threading.Semaphore(0)
+        self.delivered = 0
+
+    def deliver(self, count):
+        target = self.delivered + count
+        for _ in range(count):
+            self.allowed.release()
+        while self.delivered < target:
+            time.sleep(0.001)
+        # give the grabber thread the chance to put the last frame in the ring
+        time.sleep(0.05)
+
+    def read(self):
+        if not self.allowed.acquire(timeout=0.01):
+            return False, None
+        self.delivered += 1
+        return True, self.delivered - 1
+
+    def get(self, prop):
+        return self.delivered * 40.0
+
+def test_select_camera():
+    settings = {'camera_capture_mode': 'latest', 'camera_capture_ring_size': 2}
+    reader = FrameReader.SelectCamera(settings, None)
+    assert type(reader).__name__ == 'LatestFrameReader'
+    assert reader.ring_size == 2
+    settings['camera_capture_mode'] = 'sync'
+    assert type(FrameReader.SelectCamera(settings, None)).__name__ == 'SynchronousFrameReader'
+
+def test_read_times_out_without_frames():
+    with FrameReader.Latest(FakeCamera(), 1) as reader:
+        reader.read_timeout = 0.05
+        success, frame, _, _ = reader.read()
+        assert not success and frame is None
+
+def test_ring_of_one_returns_the_latest_frame_and_counts_the_dropped_frames():
+    camera = FakeCamera()
+    with FrameReader.Latest(camera, 1) as reader:
+        camera.deliver(5)
+        success, frame, frame_index, frame_timestamp = reader.read()
+        assert success
+        assert (frame, frame_index, frame_timestamp) == (4, 4, 200.0)
+        dropped_frames, avg_latency, max_latency = reader.get_stats()
+        assert dropped_frames == 4
+        assert 0 < avg_latency <= max_latency
+
+        camera.deliver(1)
+        assert reader.read()[1] == 5
+        assert reader.get_stats()[0] == 4
+
+        reader.reset_stats()
+        assert reader.get_stats() == (0, 0.0, 0.0)
+
+def test_frames_are_only_returned_once():
+    camera = FakeCamera()
+    with FrameReader.Latest(camera, 1) as reader:
+        reader.read_timeout = 0.05
+        camera.deliver(1)
+        assert reader.read()[0]
+        assert not reader.read()[0]
+
+def test_bigger_ring_returns_the_newest_frame_and_drops_the_older_ones():
+    camera = FakeCamera()
+    with FrameReader.Latest(camera, 3) as reader:
+        reader.read_timeout = 0.05
+        camera.deliver(5)
+        # frames 0 and 1 were pushed out of the ring, 2 and 3 are behind the newest frame
+        assert reader.read()[0:3] == (True, 4, 4)
+        assert reader.get_stats()[0] == 4
+        assert not reader.read()[0]
+
+        camera.deliver(2)
+        assert reader.read()[0:3] == (True, 6, 6)
+        assert reader.get_stats()[0] == 5
@@ -0,0 +1,98 @@
+import numpy as np
+
+from uap_tracker import non_max_suppression
+from uap_tracker.non_max_suppression import suppress_detections
+
+# Straightforward one pair at a time version of the fast NMS, a bbox is suppressed when more than the overlap threshold of it
+# is covered by any bigger bbox, whether or not that bbox is suppressed itself
+def reference_suppress_detections(bboxes, overlap_threshold, max_detections=0, merge=False):
+    order = sorted(range(len(bboxes)), key=lambda i: -(bboxes[i][2] + 1) * (bboxes[i][3] + 1))
+    boxes = [list(bboxes[i]) for i in order]
+    suppressed_by = []
+    for i, (x, y, w, h) in enumerate(boxes):
+        owners = []
+        for j in range(i):
+            bx, by, bw, bh = boxes[j]
+            intersection_w = min(x + w, bx + bw) - max(x, bx) + 1
+            intersection_h = min(y + h, by + bh) - max(y, by) + 1
+            if max(0, intersection_w) * max(0, intersection_h) / ((w + 1) * (h + 1)) > overlap_threshold:
+                owners.append(j)
+        suppressed_by.append(owners)
+
+    keep = [len(owners) == 0 for owners in suppressed_by]
+    if merge:
+        corners = [[x, y, x + w, y + h] for x, y, w, h in boxes]
+        for i, owners in enumerate(suppressed_by):
+            kept_owners = [j for j in owners if keep[j]]
+            if kept_owners:
+                owner = corners[kept_owners[0]]
+                x1, y1, w, h = boxes[i]
+                owner[0], owner[1] = min(owner[0], x1), min(owner[1], y1)
+                owner[2], owner[3] = max(owner[2], x1 + w), max(owner[3], y1 + h)
+        boxes = [[x1, y1, x2 - x1, y2 - y1] for x1, y1, x2, y2 in corners]
+
+    result = [box for box, kept in zip(boxes, keep) if kept]
+    if max_detections > 0:
+        result = result[:max_detections]
+    return result
+
+def random_bboxes(rng, count):
+    return [(int(x), int(y), int(w), int(h)) for x, y, w, h in zip(rng.integers(0, 200, count), rng.integers(0, 200, count), rng.integers(1, 40, count), rng.integers(1, 40, count))]
+
+def test_no_bboxes():
+    assert suppress_detections([], 0.5).shape == (0, 4)
+
+def test_sorted_from_big_to_small():
+    bboxes = [(0, 0, 5, 5), (100, 100, 20, 20), (50, 50, 10, 10)]
+    assert suppress_detections(bboxes, 0.5).tolist() == [[100, 100, 20, 20], [50, 50, 10, 10], [0, 0, 5, 5]]
+
+def test_equal_areas_keep_their_order():
+    bboxes = [(0, 0, 10, 10), (100, 0, 10, 10), (50, 0, 10, 10)]
+    assert suppress_detections(bboxes, 0.5).tolist() == [list(bbox) for bbox in bboxes]
+
+def test_bigger_bbox_suppresses_smaller_one():
+    bboxes = [(12, 12, 5, 5), (10, 10, 20, 20)]
+    assert suppress_detections(bboxes, 0.5).tolist() == [[10, 10, 20, 20]]
+
+def test_overlap_threshold():
+    # half of the small bbox (a 6 x 10 pixel area) is covered by the big one
+    bboxes = [(0, 0, 20, 20), (18, 0, 5, 9)]
+    assert len(suppress_detections(bboxes, 0.49)) == 1
+    assert len(suppress_detections(bboxes, 0.5)) == 2
+
+def test_suppressed_bbox_still_suppresses():
+    # the middle bbox is suppressed by the big one, and still suppresses the small one that the big one barely covers
+    bboxes = [(0, 0, 20, 20), (15, 0, 10, 10), (22, 0, 4, 4)]
+    assert suppress_detections(bboxes, 0.3).tolist() == [[0, 0, 20, 20]]
+
+def test_max_detections_keeps_the_biggest():
+    bboxes = [(0, 0, 5, 5), (100, 100, 20, 20), (50, 50, 10, 10)]
+    assert suppress_detections(bboxes, 0.5, max_detections=2).tolist() == [[100, 100, 20, 20], [50, 50, 10, 10]]
+
+def test_merge_grows_the_kept_bbox():
+    bboxes = [(10, 10, 20, 20), (22, 22, 10, 10)]
+    assert suppress_detections(bboxes, 0.3, merge=True).tolist() == [[10, 10, 22, 22]]
+
+def test_merge_into_the_biggest_owner():
+    bboxes = [(0, 0, 30, 30), (25, 0, 20, 20), (23, 5, 4, 4)]
+    assert suppress_detections(bboxes, 0.5, merge=True).tolist() == [[0, 0, 30, 30], [25, 0, 20, 20]]
+
+def test_merge_ignores_suppressed_owners():
+    # the small bbox is only covered by the middle bbox, which is suppressed itself, so there is nothing to merge it into
+    bboxes = [(0, 0, 20, 20), (15, 0, 10, 10), (22, 0, 4, 4)]
+    assert suppress_detections(bboxes, 0.3, merge=True).tolist() == [[0, 0, 25, 20]]
+
+def test_random_bboxes_match_reference():
+    rng = np.random.default_rng(0)
+    for count in (2, 10, 50):
+        for overlap_threshold in (0.0, 0.3, 0.7):
+            for merge in (False, True):
+                bboxes = random_bboxes(rng, count)
+                expected = reference_suppress_detections(bboxes, overlap_threshold, 5, merge)
+                assert suppress_detections(bboxes, overlap_threshold, 5, merge).tolist() == expected
+
+def test_more_bboxes_than_a_block_match_reference():
+    rng = np.random.default_rng(1)
+    bboxes = random_bboxes(rng, non_max_suppression.BLOCK_SIZE * 2 + 10)
+    for merge in (False, True):
+        assert suppress_detections(bboxes, 0.3, merge=merge).tolist() == reference_suppress_detections(bboxes, 0.3, merge=merge)
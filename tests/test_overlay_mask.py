@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+import pytest
+
+import uap_tracker.utils as utils
+from uap_tracker.mask import Mask
+from tests.helpers import make_settings, run_video, write_video
+
+# An overlay that keeps a rectangle with a soft (grey) edge and a hole in it
+def write_overlay(path, size=(320, 240)):
+    width, height = size
+    overlay = np.zeros((height, width), np.uint8)
+    overlay[30:200, 20:210] = 255
+    overlay[30:200, 20] = 100
+    overlay[100:120, 100:130] = 0
+    cv2.imwrite(str(path), overlay)
+    return str(path), overlay
+
+def make_mask(mask_type, overlay_path):
+    return Mask.Select({'mask_type': mask_type, 'enable_cuda': False, 'mask_overlay_image_path': overlay_path})
+
+@pytest.mark.parametrize('mask_type', ['overlay', 'overlay_inverse'])
+@pytest.mark.parametrize('channels', [(), (3,)])
+def test_matches_masking_the_whole_frame(tmp_path, mask_type, channels):
+    overlay_path, overlay = write_overlay(tmp_path / 'overlay.png')
+    if mask_type == 'overlay_inverse':
+        overlay = cv2.bitwise_not(overlay)
+    frame = np.random.default_rng(0).integers(0, 256, (240, 320) + channels, dtype=np.uint8)
+    expected = cv2.bitwise_and(frame, frame, mask=overlay)
+
+    mask = make_mask(mask_type, overlay_path)
+    assert mask.initialise(frame) == (320, 240)
+    assert np.array_equal(mask.apply(frame), expected)
+    dst = np.full(frame.shape, 7, np.uint8)
+    assert mask.apply(frame, dst=dst) is dst
+    assert np.array_equal(dst, expected)
+
+def test_roi_is_the_bounding_rectangle_of_the_overlay(tmp_path):
+    overlay_path, _ = write_overlay(tmp_path / 'overlay.png')
+    mask = make_mask('overlay', overlay_path)
+    mask.initialise(np.zeros((240, 320), np.uint8))
+    assert mask.get_roi() == (20, 30, 190, 170)
+
+    # the inverse keeps the edges of the frame, so it's the whole frame
+    mask = make_mask('overlay_inverse', overlay_path)
+    mask.initialise(np.zeros((240, 320), np.uint8))
+    assert mask.get_roi() == (0, 0, 320, 240)
+
+def test_overlay_is_resized_to_the_frame(tmp_path):
+    overlay_path, overlay = write_overlay(tmp_path / 'overlay.png', size=(160, 120))
+    frame = np.full((240, 320), 200, np.uint8)
+    mask = make_mask('overlay', overlay_path)
+    mask.initialise(frame)
+    resized = cv2.resize(overlay, (320, 240))
+    assert np.array_equal(mask.apply(frame) > 0, resized > 0)
+
+def test_blob_detection_offsets_the_keypoints_of_a_region():
+    kp = cv2.KeyPoint(10.0, 20.0, 4.0)
+    x, y, w, h = utils.kp_to_bbox(kp)
+    assert utils.kp_to_bbox(kp, (5, 7)) == (x + 5, y + 7, w, h)
+
+def test_zero_outside_roi():
+    frame = np.ones((6, 8), np.uint8)
+    utils.zero_outside_roi(frame, (2, 1, 3, 4))
+    expected = np.zeros((6, 8), np.uint8)
+    expected[1:5, 2:5] = 1
+    assert np.array_equal(frame, expected)
+
+@pytest.mark.parametrize('overrides', [{}, {'resize_frame': True, 'resize_dimension': 256}, {'blur_radius': 5}])
+def test_roi_tracks_like_the_whole_frame(monkeypatch, tmp_path, overrides):
+    overlay_path, _ = write_overlay(tmp_path / 'overlay.png')
+    video = write_video(tmp_path / 'targets.avi', frame_count=20)
+    settings = dict(mask_type='overlay', mask_overlay_image_path=overlay_path, **overrides)
+    expected = run_video(monkeypatch, make_settings(mask_roi_enabled=False, **settings), video)
+    results = run_video(monkeypatch, make_settings(mask_roi_enabled=True, **settings), video)
+    assert any(trackers for _, trackers in expected.frames)
+    assert results.frames == expected.frames
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+import uap_tracker.utils as utils
+from uap_tracker.spatial_grid import SpatialGrid
+from uap_tracker.tracker_engine import RemoteTracker
+
+SETTINGS = {
+    'track_history_max_length': 2,
+    'track_history_decimation': 0,
+    'track_history_long_term_max_length': 0,
+}
+
+# The remote tracker is a tracker without a cv2 tracker behind it, which is all the grid needs
+def make_tracker(id, bbox):
+    return RemoteTracker(SETTINGS, id, bbox)
+
+def random_bbox(rng):
+    return (int(rng.integers(0, 300)), int(rng.integers(0, 200)), int(rng.integers(0, 60)), int(rng.integers(0, 60)))
+
+def test_empty_grid():
+    assert not SpatialGrid(32).is_bbox_being_tracked((10, 10, 5, 5))
+
+def test_touching_bboxes_are_being_tracked():
+    grid = SpatialGrid(32)
+    grid.rebuild([make_tracker(1, (10, 10, 22, 22))])
+    # The corners are inclusive, so a bbox that starts on the edge of the tracker overlaps it
+    assert grid.is_bbox_being_tracked((32, 32, 5, 5))
+    assert not grid.is_bbox_being_tracked((33, 10, 5, 5))
+
+@pytest.mark.parametrize('cell_size', [1, 16, 64, 1000])
+def test_same_as_utils(cell_size):
+    rng = np.random.default_rng(cell_size)
+    for _ in range(20):
+        trackers = [make_tracker(id, random_bbox(rng)) for id in range(int(rng.integers(0, 15)))]
+        grid = SpatialGrid(cell_size)
+        grid.rebuild(trackers)
+        for _ in range(50):
+            bbox = random_bbox(rng)
+            assert grid.is_bbox_being_tracked(bbox) == utils.is_bbox_being_tracked(trackers, bbox)
+
+def test_inserted_trackers_are_found():
+    rng = np.random.default_rng(0)
+    trackers = [make_tracker(id, random_bbox(rng)) for id in range(5)]
+    grid = SpatialGrid(32)
+    grid.rebuild(trackers)
+    for id in range(5, 10):
+        tracker = make_tracker(id, random_bbox(rng))
+        grid.insert(tracker)
+        trackers.append(tracker)
+        for _ in range(50):
+            bbox = random_bbox(rng)
+            assert grid.is_bbox_being_tracked(bbox) == utils.is_bbox_being_tracked(trackers, bbox)
+
+def test_rebuild_forgets_the_old_bboxes():
+    grid = SpatialGrid(32)
+    grid.rebuild([make_tracker(1, (10, 10, 5, 5))])
+    grid.rebuild([make_tracker(2, (100, 100, 5, 5))])
+    assert not grid.is_bbox_being_tracked((10, 10, 5, 5))
+    assert grid.is_bbox_being_tracked((100, 100, 5, 5))
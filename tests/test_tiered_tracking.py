@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+import pytest
+
+import uap_tracker.tracker as tracker_module
+from uap_tracker.tracker import Tracker
+from uap_tracker.tracker_factory import TrackerFactory
+from tests.helpers import make_settings
+
+# function to draw a textured square target at x on a noisy background, so the correlation trackers have something to lock on
+def make_frame(x, y=100):
+    frame = np.random.default_rng(0).integers(60, 120, (240, 320, 3), dtype=np.uint8)
+    target = np.random.default_rng(1).integers(150, 255, (20, 20, 3), dtype=np.uint8)
+    frame[y:y + 20, x:x + 20] = target
+    return frame
+
+def tiered_settings(**overrides):
+    return make_settings(enable_track_validation=True, tracker_tiered_enabled=True, **overrides)
+
+def test_create_uses_the_configured_type_by_default():
+    app_settings = make_settings(tracker_type='KCF')
+    assert isinstance(TrackerFactory.create(app_settings), cv2.TrackerKCF)
+    assert isinstance(TrackerFactory.create(app_settings, 'CSRT'), cv2.TrackerCSRT)
+
+def test_create_mosse():
+    assert TrackerFactory.create(make_settings(), 'MOSSE') is not None
+
+@pytest.mark.parametrize('provisional_type', ['KCF', 'MOSSE'])
+def test_new_tracker_starts_with_the_provisional_type(provisional_type):
+    app_settings = tiered_settings(tracker_type='CSRT', tracker_provisional_type=provisional_type)
+    tracker = Tracker(app_settings, 1, make_frame(50), (50, 100, 20, 20))
+    assert tracker.provisional_tracker
+    assert not isinstance(tracker.cv2_tracker, cv2.TrackerCSRT)
+
+def test_without_tiering_the_configured_type_is_used():
+    tracker = Tracker(make_settings(tracker_type='CSRT'), 1, make_frame(50), (50, 100, 20, 20))
+    assert not tracker.provisional_tracker
+    assert isinstance(tracker.cv2_tracker, cv2.TrackerCSRT)
+
+def test_promoted_once_active(monkeypatch):
+    # Validation runs on the tick over of every second, so let a second pass between the frames
+    clock = iter(range(0, 1000, 2))
+    monkeypatch.setattr(tracker_module.time, 'time', lambda: next(clock))
+
+    app_settings = tiered_settings(tracker_type='CSRT')
+    tracker = Tracker(app_settings, 1, make_frame(50), (50, 100, 20, 20))
+    for x in range(55, 150, 5):
+        ok, bbox = tracker.update(make_frame(x))
+        assert ok
+        if tracker.is_tracking():
+            break
+
+    assert tracker.is_tracking()
+    assert not tracker.provisional_tracker
+    assert isinstance(tracker.cv2_tracker, cv2.TrackerCSRT)
+    # The promoted tracker was initialised on the latest frame and carries on following the target
+    promoted_bbox = bbox
+    ok, bbox = tracker.update(make_frame(x + 2))
+    assert ok
+    assert abs(bbox[0] - (promoted_bbox[0] + 2)) <= 1 and abs(bbox[1] - promoted_bbox[1]) <= 1
+
+def test_provisionary_target_is_not_promoted():
+    tracker = Tracker(tiered_settings(), 1, make_frame(50), (50, 100, 20, 20))
+    ok, bbox = tracker.update(make_frame(50))
+    assert ok
+    assert all(isinstance(v, int) for v in bbox)
+    assert tracker.provisional_tracker
+
+def test_tiering_needs_track_validation():
+    assert not make_settings(tracker_tiered_enabled=True)['tracker_tiered_enabled']
+    assert tiered_settings()['tracker_tiered_enabled']
+
+def test_unknown_provisional_type():
+    with pytest.raises(SystemExit):
+        tiered_settings(tracker_provisional_type='CSRT')
@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+
+from uap_tracker.tiled_background_subtraction import TiledBackgroundSubtraction, _union_bbox
+from tests.helpers import make_settings
+
+SIZE = (320, 240)
+
+def make_tiled(columns, rows, overlap, visibility=None, init_frame=None):
+    tiled = TiledBackgroundSubtraction(make_settings(bg_tile_columns=columns, bg_tile_rows=rows, bg_tile_overlap=overlap, bg_tile_workers=2))
+    if visibility is None:
+        visibility = np.full((SIZE[1], SIZE[0]), 255, np.uint8)
+    if init_frame is None:
+        init_frame = np.zeros((SIZE[1], SIZE[0]), np.uint8)
+    tiled.initialise(SIZE, visibility, init_frame)
+    return tiled
+
+# grey frames with a blob in each quarter of the frame, well away from the seams of a 2 x 2 grid
+def make_frames(count):
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        frame = (np.full((SIZE[1], SIZE[0]), 90, np.uint8) + rng.integers(0, 3, (SIZE[1], SIZE[0]), dtype=np.uint8))
+        for x, y in [(20, 50), (180, 60), (30, 170), (190, 180)]:
+            cv2.circle(frame, (x + 12 * i, y + i), 5, 255, -1)
+        frames.append(cv2.GaussianBlur(frame, (3, 3), 0))
+    return frames
+
+def test_tiles_cover_the_region():
+    tiled = make_tiled(3, 2, 10)
+    coverage = np.zeros((SIZE[1], SIZE[0]), np.uint8)
+    for tile in tiled.tiles:
+        x1, y1, x2, y2 = tile.core
+        coverage[y1:y2, x1:x2] += 1
+        bx1, by1, bx2, by2 = tile.bounds
+        assert (bx1, by1) == (max(0, x1 - 10), max(0, y1 - 10))
+        assert (bx2, by2) == (min(SIZE[0], x2 + 10), min(SIZE[1], y2 + 10))
+    assert len(tiled.tiles) == 6
+    assert (coverage == 1).all()
+    tiled.close()
+    assert tiled.executor is None
+
+def test_masked_out_tiles_are_skipped():
+    visibility = np.zeros((SIZE[1], SIZE[0]), np.uint8)
+    visibility[:, :100] = 255
+    tiled = make_tiled(2, 2, 8, visibility)
+    assert [tile.masked_out for tile in tiled.tiles] == [False, True, False, True]
+    assert tiled.tiles[1].background_subtractor is None
+
+    dst = np.full((SIZE[1], SIZE[0]), 7, np.uint8)
+    frames = make_frames(3)
+    for frame in frames:
+        tiled.detect(frame, dst)
+    assert (dst[:, 160:] == 0).all()
+    tiled.close()
+
+def test_tiles_find_the_same_blobs_as_a_single_tile():
+    single = make_tiled(1, 1, 0)
+    tiled = make_tiled(2, 2, 16)
+    single_dst = np.empty((SIZE[1], SIZE[0]), np.uint8)
+    tiled_dst = np.empty((SIZE[1], SIZE[0]), np.uint8)
+    found = 0
+    for frame in make_frames(8):
+        expected = single.detect(frame, single_dst, (5, 7))
+        bboxes = tiled.detect(frame, tiled_dst, (5, 7))
+        assert sorted(bboxes) == sorted(expected)
+        assert np.array_equal(tiled_dst, single_dst)
+        found += len(bboxes)
+    assert found > 0
+    single.close()
+    tiled.close()
+
+def test_seam_bboxes_of_different_tiles_are_merged():
+    tiled = make_tiled(2, 1, 4)
+    # the two halves of a blob cut by the seam, and a blob on the seam far away from them
+    merged = tiled._merge_seam_bboxes([[(150, 100, 10, 12)], [(160, 102, 8, 12), (160, 10, 6, 6)]])
+    assert sorted(merged) == [(150, 100, 18, 14), (160, 10, 6, 6)]
+    # bboxes of the same tile are never merged with each other
+    assert sorted(tiled._merge_seam_bboxes([[(150, 100, 10, 12), (155, 100, 10, 12)]])) == [(150, 100, 10, 12), (155, 100, 10, 12)]
+    tiled.close()
+
+def test_union_bbox():
+    assert _union_bbox((10, 10, 5, 5), (12, 8, 10, 4)) == (10, 8, 12, 7)
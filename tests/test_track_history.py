@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from uap_tracker.track_history import TrackHistory
+from tests.helpers import make_settings, write_video, run_video, TrackerRecorder
+
+def test_empty_history():
+    history = TrackHistory(3, 2)
+    assert len(history) == 0
+    assert history.values().shape == (0, 2)
+    with pytest.raises(IndexError):
+        history.last()
+
+def test_keeps_the_latest_rows_in_order():
+    history = TrackHistory(3, 2)
+    for i in range(5):
+        history.append((i, i * 10))
+        assert history.last() == (i, i * 10)
+    assert len(history) == 3
+    assert history.appended == 5
+    assert history.values().tolist() == [[2, 20], [3, 30], [4, 40]]
+
+def test_long_term_values_cover_the_older_rows():
+    history = TrackHistory(3, 1, decimation=2, long_term_max_length=10)
+    for i in range(9):
+        history.append((i,))
+    # Every second row is kept in the long term history, the rows still in the history come after the older ones
+    assert history.long_term_values()[:, 0].tolist() == [0, 2, 4, 6, 7, 8]
+
+def test_long_term_history_is_bounded_as_well():
+    history = TrackHistory(2, 1, decimation=3, long_term_max_length=2)
+    for i in range(20):
+        history.append((i,))
+    assert history.long_term_values()[:, 0].tolist() == [15, 18, 19]
+
+def test_without_long_term_history():
+    history = TrackHistory(3, 1, decimation=2, long_term_max_length=0)
+    for i in range(9):
+        history.append((i,))
+    assert history.long_term is None
+    assert history.long_term_values()[:, 0].tolist() == [6, 7, 8]
+
+def test_create_uses_the_settings():
+    settings = {'track_history_max_length': 4, 'track_history_decimation': 5, 'track_history_long_term_max_length': 6}
+    history = TrackHistory.Create(settings, 2, np.float32)
+    assert history.rows.shape == (4, 2) and history.rows.dtype == np.float32
+    assert history.decimation == 5
+    assert history.long_term.rows.shape == (6, 3)
+
+def test_max_length_is_reset():
+    assert make_settings(track_history_max_length=1)['track_history_max_length'] == 1000
+
+# Listener that records the longest tracker histories seen
+class HistoryRecorder(TrackerRecorder):
+
+    def __init__(self):
+        super().__init__()
+        self.max_lengths = (0, 0)
+
+    def trackers_updated_callback(self, video_tracker):
+        super().trackers_updated_callback(video_tracker)
+        for tracker in video_tracker.get_live_trackers():
+            self.max_lengths = (max(self.max_lengths[0], len(tracker.bboxes)), max(self.max_lengths[1], len(tracker.center_points)))
+
+def test_bounded_history_tracks_the_same(tmp_path, monkeypatch):
+    video = write_video(tmp_path / 'targets.avi', frame_count=40)
+    unbounded = run_video(monkeypatch, make_settings(track_plotting_enabled=True), video, HistoryRecorder())
+    bounded = run_video(monkeypatch, make_settings(track_plotting_enabled=True, track_history_max_length=5), video, HistoryRecorder())
+    assert bounded.frames == unbounded.frames
+    assert bounded.totals == unbounded.totals
+    assert bounded.max_lengths == (5, 5)
+    assert unbounded.max_lengths[0] > 5
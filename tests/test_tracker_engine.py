@@ -0,0 +1,56 @@
+import threading
+
+from uap_tracker.tracker_engine import TrackerEngine
+from tests.helpers import make_settings, run_video, write_video
+
+class FakeTracker():
+
+    def __init__(self, id):
+        self.id = id
+        self.thread = None
+
+    def update(self, frame):
+        self.thread = threading.current_thread()
+        return True, (self.id, frame, 1, 1)
+
+def test_select():
+    assert type(TrackerEngine.Select(make_settings(tracker_engine='thread'))).__name__ == 'ThreadTrackerEngine'
+    assert type(TrackerEngine.Select(make_settings(tracker_engine='process'))).__name__ == 'ProcessTrackerEngine'
+
+def test_few_trackers_are_updated_on_the_calling_thread():
+    engine = TrackerEngine.Thread(make_settings(tracker_update_workers=2, tracker_serial_threshold=2))
+    trackers = [FakeTracker(1), FakeTracker(2)]
+    assert engine.update_trackers(trackers, 7) == [(True, (1, 7, 1, 1)), (True, (2, 7, 1, 1))]
+    assert all(tracker.thread is threading.current_thread() for tracker in trackers)
+    assert engine.executor is None
+
+def test_batches_keep_the_order_of_the_trackers():
+    engine = TrackerEngine.Thread(make_settings(tracker_update_workers=3, tracker_serial_threshold=0))
+    trackers = [FakeTracker(i) for i in range(10)]
+    assert engine.update_trackers(trackers, 7) == [(True, (i, 7, 1, 1)) for i in range(10)]
+    workers = {tracker.thread for tracker in trackers}
+    assert threading.current_thread() not in workers
+    assert len(workers) <= 3
+
+    # the pool lives across frames and is shut down when the engine is closed
+    executor = engine.executor
+    engine.update_trackers(trackers, 8)
+    assert engine.executor is executor
+    engine.close()
+    assert engine.executor is None
+
+def test_thread_pool_tracks_like_the_serial_updates(monkeypatch, tmp_path):
+    video = write_video(tmp_path / 'targets.avi', frame_count=30)
+    expected = run_video(monkeypatch, make_settings(tracker_serial_threshold=100), video)
+    results = run_video(monkeypatch, make_settings(tracker_update_workers=3, tracker_serial_threshold=0), video)
+    assert any(len(trackers) > 1 for _, trackers in expected.frames)
+    assert results.frames == expected.frames
+    assert results.totals == expected.totals
+
+def test_process_engine_tracks_like_the_thread_engine(monkeypatch, tmp_path):
+    video = write_video(tmp_path / 'targets.avi', frame_count=30)
+    expected = run_video(monkeypatch, make_settings(tracker_engine='thread'), video)
+    results = run_video(monkeypatch, make_settings(tracker_engine='process', tracker_process_workers=2), video)
+    assert any(len(trackers) > 1 for _, trackers in expected.frames)
+    assert results.frames == expected.frames
+    assert results.totals == expected.totals
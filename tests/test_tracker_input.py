@@ -0,0 +1,115 @@
+import cv2
+import numpy as np
+import pytest
+
+from uap_tracker.tracker import Tracker
+from uap_tracker.video_tracker import VideoTracker
+from tests.helpers import make_settings, write_video, run_video
+
+# function to draw a textured square target on a noisy background, so the correlation trackers have something to lock on
+def make_frame(x, y=100, size=(640, 480)):
+    width, height = size
+    frame = np.random.default_rng(0).integers(60, 120, (height, width, 3), dtype=np.uint8)
+    frame[y:y + 20, x:x + 20] = np.random.default_rng(1).integers(150, 255, (20, 20, 3), dtype=np.uint8)
+    return frame
+
+def crop_settings(**overrides):
+    return make_settings(tracker_type='CSRT', tracker_crop_enabled=True, tracker_crop_padding=2.0, **overrides)
+
+def test_crop_window_is_padded_around_the_bbox():
+    tracker = Tracker(crop_settings(), 1, make_frame(300), (300, 100, 20, 20))
+    assert tracker.crop_window == (260, 60, 100, 100)
+
+def test_crop_window_is_clipped_to_the_frame():
+    frame = make_frame(0)
+    tracker = Tracker(crop_settings(), 1, frame, (0, 100, 20, 20))
+    assert tracker.crop_window == (0, 60, 60, 100)
+    assert tracker._get_crop_window(frame, (630, 470, 10, 10)) == (610, 450, 30, 30)
+
+def test_near_crop_edge():
+    frame = make_frame(300)
+    tracker = Tracker(crop_settings(), 1, frame, (300, 100, 20, 20))
+    assert not tracker._is_near_crop_edge(frame, (300, 100, 20, 20))
+    assert not tracker._is_near_crop_edge(frame, (280, 80, 20, 20))
+    assert tracker._is_near_crop_edge(frame, (279, 100, 20, 20))
+    assert tracker._is_near_crop_edge(frame, (300, 121, 20, 20))
+    # An edge of the crop that is the edge of the frame doesn't count
+    tracker = Tracker(crop_settings(), 1, frame, (0, 100, 20, 20))
+    assert not tracker._is_near_crop_edge(frame, (0, 100, 20, 20))
+
+def test_no_crop_window_without_crops():
+    tracker = Tracker(make_settings(tracker_type='CSRT'), 1, make_frame(300), (300, 100, 20, 20))
+    assert tracker.crop_window is None
+
+@pytest.mark.parametrize('tracker_input', ['colour', 'grey'])
+def test_cropped_tracker_follows_the_target_out_of_its_first_crop(tracker_input):
+    tracker = Tracker(crop_settings(tracker_input=tracker_input), 1, make_frame(100), (100, 100, 20, 20))
+    first_crop_window = tracker.crop_window
+    for x in range(102, 222, 2):
+        frame = make_frame(x)
+        if tracker_input == 'grey':
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        ok, bbox = tracker.update(frame)
+        assert ok
+        # Every new crop starts from the tracker's own estimate of the bbox, so it drifts a pixel or so per crop
+        assert abs(bbox[0] - x) <= 8 and abs(bbox[1] - 100) <= 8
+    assert tracker.crop_window != first_crop_window
+    assert tracker.crop_window[0] <= bbox[0] and bbox[0] + bbox[2] <= tracker.crop_window[0] + tracker.crop_window[2]
+
+def test_grey_input_is_reset_with_kcf():
+    assert make_settings(tracker_type='KCF', tracker_input='grey')['tracker_input'] == 'colour'
+    assert crop_settings(tracker_input='grey')['tracker_input'] == 'grey'
+    app_settings = make_settings(tracker_type='CSRT', tracker_input='grey', enable_track_validation=True,
+                                 tracker_tiered_enabled=True, tracker_provisional_type='KCF')
+    assert app_settings['tracker_input'] == 'colour'
+
+def test_grey_input_is_reset_with_csrt_on_the_whole_frame():
+    assert make_settings(tracker_type='CSRT', tracker_input='grey')['tracker_input'] == 'colour'
+    assert make_settings(tracker_type='MOSSE', tracker_input='grey')['tracker_input'] == 'grey'
+
+def test_unknown_tracker_input():
+    with pytest.raises(SystemExit):
+        make_settings(tracker_input='rgb')
+
+def test_crop_padding_is_reset():
+    assert make_settings(tracker_crop_enabled=True, tracker_crop_padding=0.5)['tracker_crop_padding'] == 2.0
+
+# function to run the video and record the frames handed to the trackers along with their frame count
+def run_video_recording_tracker_frames(monkeypatch, app_settings, video):
+    frames = []
+    update_trackers = VideoTracker.update_trackers
+    def record(video_tracker, bboxes, frame):
+        if frame is not None:
+            frames.append((video_tracker.get_frame_count(), frame.copy()))
+        return update_trackers(video_tracker, bboxes, frame)
+    monkeypatch.setattr(VideoTracker, 'update_trackers', record)
+    run_video(monkeypatch, app_settings, video)
+    monkeypatch.setattr(VideoTracker, 'update_trackers', update_trackers)
+    return frames
+
+def test_grey_frame_is_handed_to_the_trackers(tmp_path, monkeypatch):
+    video = write_video(tmp_path / 'targets.avi', frame_count=20)
+    grey = run_video_recording_tracker_frames(monkeypatch, crop_settings(tracker_input='grey'), video)
+    colour = run_video_recording_tracker_frames(monkeypatch, crop_settings(), video)
+    assert grey and all(frame.ndim == 2 for _, frame in grey)
+    assert colour and all(frame.ndim == 3 for _, frame in colour)
+
+def test_grey_frame_is_not_blurred(tmp_path, monkeypatch):
+    video = write_video(tmp_path / 'targets.avi', frame_count=20)
+    capture = cv2.VideoCapture(video)
+    video_frames_grey = [cv2.cvtColor(capture.read()[1], cv2.COLOR_BGR2GRAY) for _ in range(20)]
+    grey = run_video_recording_tracker_frames(monkeypatch, crop_settings(tracker_input='grey', noise_reduction=True), video)
+    assert grey
+    # The trackers get the grey frame from before the noise reduction, so it is the plain grey conversion of a video frame
+    for _, frame in grey:
+        assert any(np.array_equal(frame, video_frame_grey) for video_frame_grey in video_frames_grey)
+
+def test_cropped_trackers_track_like_full_frame_trackers(tmp_path, monkeypatch):
+    video = write_video(tmp_path / 'targets.avi', frame_count=40)
+    full = run_video(monkeypatch, make_settings(tracker_type='CSRT'), video)
+    cropped = run_video(monkeypatch, crop_settings(), video)
+    assert full.totals == cropped.totals
+    (_, full_trackers), (_, cropped_trackers) = full.frames[-1], cropped.frames[-1]
+    assert [id for id, _, _ in full_trackers] == [id for id, _, _ in cropped_trackers]
+    for (_, full_bbox, _), (_, cropped_bbox, _) in zip(full_trackers, cropped_trackers):
+        assert abs(full_bbox[0] - cropped_bbox[0]) <= 6 and abs(full_bbox[1] - cropped_bbox[1]) <= 6
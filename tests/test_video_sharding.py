@@ -0,0 +1,113 @@
+import cv2
+import pytest
+
+from uap_tracker.controller import ShardVideoController
+from uap_tracker.event_publisher import EventPublisher
+from uap_tracker.video_sharding import plan_shards, stitch_shards
+from uap_tracker.video_tracker import VideoTracker
+from tests.helpers import TrackerRecorder, make_settings, write_video
+
+STITCH_SETTINGS = {
+    'shard_merge_max_frame_gap': 5,
+    'min_centre_point_distance_between_bboxes': 64,
+    'shard_merge_min_iou': 0.1,
+}
+
+def make_track(frame_ids, x, y):
+    return [(frame_id, (x + frame_id, y, 8, 8), frame_id * 40.0) for frame_id in frame_ids]
+
+def annotations_by_track(annotations):
+    tracks = {}
+    for frame in annotations['frames']:
+        for annotation in frame['annotations']:
+            tracks.setdefault(annotation['track_id'], []).append(frame['frame'])
+    return tracks
+
+def test_plan_shards():
+    assert plan_shards(100, 1, 30) == [(0, 0, None)]
+    assert plan_shards(100, 4, 10) == [(0, 0, 25), (15, 25, 50), (40, 50, 75), (65, 75, None)]
+    # the warm-up never starts before the start of the video
+    assert plan_shards(100, 4, 40) == [(0, 0, 25), (0, 25, 50), (10, 50, 75), (35, 75, None)]
+    # never more shards than frames
+    assert plan_shards(3, 8, 0) == [(0, 0, 1), (1, 1, 2), (2, 2, None)]
+
+def test_stitch_a_single_shard():
+    annotations = stitch_shards([(0, 0, None)], [{3: make_track(range(-1, 5), 10, 10)}], STITCH_SETTINGS)
+    assert annotations['track_labels'] == {1: 'unknown'}
+    assert annotations_by_track(annotations) == {1: list(range(-1, 5))}
+    assert annotations['frames'][0]['annotations'][0]['bbox'] == (9, 10, 8, 8)
+
+def test_stitch_merges_the_tracks_that_cross_a_boundary():
+    shards = plan_shards(20, 2, 4)
+    shard_tracks = [
+        {1: make_track(range(2, 9), 10, 10), 2: make_track(range(0, 3), 100, 100)},
+        # 7 carries on track 1 and has seen frames 6 - 8 during the warm-up, 8 is a new target
+        {7: make_track(range(6, 19), 10, 10), 8: make_track(range(9, 13), 200, 200)},
+    ]
+    annotations = stitch_shards(shards, shard_tracks, STITCH_SETTINGS)
+    assert annotations_by_track(annotations) == {1: list(range(2, 19)), 2: [0, 1, 2], 3: [9, 10, 11, 12]}
+    assert annotations['track_labels'] == {1: 'unknown', 2: 'unknown', 3: 'unknown'}
+
+def test_stitch_does_not_merge_far_tracks_without_overlap():
+    shards = plan_shards(20, 2, 0)
+    shard_tracks = [{1: make_track(range(0, 9), 10, 10)}, {1: make_track(range(9, 15), 200, 200)}]
+    # The tracks don't overlap at all, they are not the same target even when any overlap is enough
+    annotations = stitch_shards(shards, shard_tracks, dict(STITCH_SETTINGS, shard_merge_min_iou=0.0))
+    assert annotations_by_track(annotations) == {1: list(range(0, 9)), 2: list(range(9, 15))}
+
+def test_stitch_does_not_merge_tracks_after_a_gap():
+    shards = plan_shards(40, 2, 0)
+    shard_tracks = [{1: make_track(range(0, 5), 10, 10)}, {1: make_track(range(19, 25), 10, 10)}]
+    annotations = stitch_shards(shards, shard_tracks, STITCH_SETTINGS)
+    assert annotations_by_track(annotations) == {1: list(range(0, 5)), 2: list(range(19, 25))}
+
+@pytest.fixture(scope='module')
+def video(tmp_path_factory):
+    return write_video(tmp_path_factory.mktemp('video') / 'targets.avi', frame_count=30)
+
+def test_shard_reports_the_frame_counts_of_the_whole_video(video):
+    events = EventPublisher()
+    recorder = TrackerRecorder()
+    events.listen(recorder)
+    video_tracker = VideoTracker(make_settings(), events, None)
+    ShardVideoController(cv2.VideoCapture(video), video_tracker, 5, 12, 24).run()
+    # the init frame is the first warm-up frame, and the frame count of capture frame index i is i - 1
+    assert [frame_count for frame_count, _ in recorder.frames] == list(range(5, 23))
+    assert any(trackers for _, trackers in recorder.frames)
+
+# function to run a shard of the video and return its tracks the way the shard task does, all the live trackers are recorded
+# as track validation is off in the tests
+def run_shard(video, shard):
+    events = EventPublisher()
+    recorder = TrackerRecorder()
+    events.listen(recorder)
+    video_tracker = VideoTracker(make_settings(), events, None)
+    ShardVideoController(cv2.VideoCapture(video), video_tracker, *shard).run()
+    tracks = {}
+    for frame_count, trackers in recorder.frames:
+        for id, bbox, _ in trackers:
+            tracks.setdefault(id, []).append((frame_count, bbox, 0.0))
+    return recorder, tracks
+
+def test_shard_warms_up_on_its_own_frames(video):
+    recorder, _ = run_shard(video, (12, 14, 24))
+    # Like a run from the start of the video, the background subtractor gets 5 frames before anything is tracked
+    assert [trackers for _, trackers in recorder.frames[:5]] == [[]] * 5
+    assert any(trackers for _, trackers in recorder.frames[5:])
+
+def test_stitch_two_shards(tmp_path):
+    video = write_video(tmp_path / 'targets.avi', frame_count=60)
+    shards = plan_shards(60, 2, 12)
+    shard_tracks = [run_shard(video, shard)[1] for shard in shards]
+    annotations = stitch_shards(shards, shard_tracks, make_settings())
+
+    # The frame count of the first frame the second shard owns
+    boundary = shards[1][1] - 1
+    continued = [entries for entries in shard_tracks[1].values() if entries[0][0] < boundary]
+    tracks = annotations_by_track(annotations)
+    crossing = [frames for frames in tracks.values() if frames[0] < boundary <= frames[-1]]
+    assert len(continued) > 0
+    # Every track the second shard picked up during its warm-up carries on a track of the first shard
+    assert len(crossing) == len(continued)
+    assert not any(boundary <= frames[0] < boundary + 5 for frames in tracks.values())
+    assert len(tracks) == len(shard_tracks[0]) + len(shard_tracks[1]) - len(continued)
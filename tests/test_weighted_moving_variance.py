@@ -0,0 +1,94 @@
+import cv2
+import numpy as np
+import pytest
+
+from uap_tracker.weighted_moving_variance import WeightedMovingVariance
+
+# Port of the WeightedMovingVariance of the bgslibrary, it works out the weighted mean, variance and standard deviation of the
+# last three frames in float32 with OpenCV, converts the standard deviation to 8 bit and thresholds it
+class ReferenceWeightedMovingVariance():
+
+    def __init__(self, threshold=15):
+        self.threshold = threshold
+        self.previous_frames = []
+
+    def apply(self, frame):
+        if len(self.previous_frames) < 2:
+            self.previous_frames.insert(0, frame.copy())
+            return np.zeros_like(frame)
+
+        frames = [f.astype(np.float32) for f in [frame] + self.previous_frames]
+        mean = frames[0] * 0.5 + frames[1] * 0.3 + frames[2] * 0.2
+        variance = (frames[0] - mean) ** 2 * 0.5 + (frames[1] - mean) ** 2 * 0.3 + (frames[2] - mean) ** 2 * 0.2
+        standard_deviation = cv2.convertScaleAbs(cv2.sqrt(variance))
+        _, foreground_mask = cv2.threshold(standard_deviation, self.threshold, 255, cv2.THRESH_BINARY)
+        self.previous_frames = [frame.copy(), self.previous_frames[0]]
+        return foreground_mask
+
+# A noisy grey background with a bright target moving across it, the noise is around the threshold so that a lot of the
+# pixels are close to the rounding boundary of the standard deviation
+def make_frames(count, shape=(72, 96), seed=0):
+    rng = np.random.default_rng(seed)
+    background = rng.integers(40, 200, shape)
+    frames = []
+    for i in range(count):
+        frame = background + rng.integers(-40, 41, shape)
+        frame[20:30, 5 + i * 4:15 + i * 4] = 250
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return frames
+
+def test_empty_mask_until_three_frames():
+    wmv = WeightedMovingVariance()
+    for frame in make_frames(2):
+        mask = wmv.apply(frame)
+        assert mask.shape == frame.shape and mask.dtype == np.uint8
+        assert np.count_nonzero(mask) == 0
+
+@pytest.mark.parametrize('threshold', [15, 5, 40])
+def test_same_masks_as_bgslibrary(threshold):
+    wmv = WeightedMovingVariance(threshold)
+    reference = ReferenceWeightedMovingVariance(threshold)
+    foreground = 0
+    for frame in make_frames(20):
+        expected = reference.apply(frame)
+        assert np.array_equal(wmv.apply(frame), expected)
+        foreground += np.count_nonzero(expected)
+    assert foreground > 0
+
+# The standard deviation of the frames 31, 31, 0 is exactly 15.5 and of 33, 33, 0 it's 16.5, both round to 16
+@pytest.mark.parametrize('previous, threshold, foreground', [(31, 15, True), (31, 16, False), (33, 15, True), (33, 16, False)])
+def test_standard_deviation_rounds_half_to_even(previous, threshold, foreground):
+    wmv = WeightedMovingVariance(threshold)
+    reference = ReferenceWeightedMovingVariance(threshold)
+    for value in (previous, previous, 0):
+        frame = np.full((4, 4), value, np.uint8)
+        mask = wmv.apply(frame)
+        assert np.array_equal(mask, reference.apply(frame))
+    assert np.all(mask == (255 if foreground else 0))
+
+def test_frame_size_change_starts_over():
+    wmv = WeightedMovingVariance()
+    for frame in make_frames(5):
+        wmv.apply(frame)
+    reference = ReferenceWeightedMovingVariance()
+    for frame in make_frames(5, shape=(40, 50), seed=1):
+        assert np.array_equal(wmv.apply(frame), reference.apply(frame))
+
+def test_restored_state_gives_the_same_masks():
+    frames = make_frames(20)
+    wmv = WeightedMovingVariance()
+    for frame in frames[:10]:
+        wmv.apply(frame)
+    restored = WeightedMovingVariance()
+    restored.set_state(wmv.get_state())
+    for frame in frames[10:]:
+        assert np.array_equal(restored.apply(frame), wmv.apply(frame))
+
+@pytest.mark.parametrize('module_name', ['pybgs', 'pysky360'])
+def test_same_masks_as_library(module_name):
+    library = pytest.importorskip(module_name)
+    wmv = WeightedMovingVariance()
+    library_wmv = library.WeightedMovingVariance()
+    for frame in make_frames(20):
+        # The libraries don't all use 255 for the foreground
+        assert np.array_equal(wmv.apply(frame) > 0, library_wmv.apply(frame) > 0)
@@ -12,6 +12,7 @@
 
 import sys
 import os
+import shutil
 from config import settings
 
 ##################################################################################################
@@ -26,10 +27,18 @@ class AppSettings():
         app_settings = {}
 
         app_settings['controller'] = settings.get('controller', None)
+        app_settings['batch_workers'] = settings.get('batch_workers', 1)
+        app_settings['batch_worker_cv_threads'] = settings.get('batch_worker_cv_threads', 1)
+        app_settings['shard_count'] = settings.get('shard_count', 1)
+        app_settings['shard_warmup_seconds'] = settings.get('shard_warmup_seconds', 10)
+        app_settings['shard_merge_min_iou'] = settings.get('shard_merge_min_iou', 0.1)
+        app_settings['shard_merge_max_frame_gap'] = settings.get('shard_merge_max_frame_gap', 5)
 
         app_settings['camera_mode'] = settings.Camera.get('camera_mode', 'rtsp')
         app_settings['camera_uri'] = settings.Camera.get('camera_uri', None)
         app_settings['camera_iteration_interval'] = settings.Camera.get('camera_iteration_interval', 10)
+        app_settings['camera_capture_mode'] = settings.Camera.get('capture_mode', 'sync')
+        app_settings['camera_capture_ring_size'] = settings.Camera.get('capture_ring_size', 1)
 
         #Visualisers
         app_settings['font_size'] = settings.Visualizer.get('font_size', 0.75)
@@ -48,15 +57,79 @@ class AppSettings():
         app_settings['calculate_optical_flow'] = settings.VideoTracker.get('calculate_optical_flow', False)
         app_settings['max_active_trackers'] = settings.VideoTracker.get('max_active_trackers', 10)
         app_settings['tracker_type'] = settings.VideoTracker.get('tracker_type', 'CSRT')
+        app_settings['tracker_tiered_enabled'] = settings.VideoTracker.get('tracker_tiered_enabled', False)
+        app_settings['tracker_provisional_type'] = settings.VideoTracker.get('tracker_provisional_type', 'KCF')
+        app_settings['tracker_input'] = settings.VideoTracker.get('tracker_input', 'colour')
+        app_settings['tracker_crop_enabled'] = settings.VideoTracker.get('tracker_crop_enabled', False)
+        app_settings['tracker_crop_padding'] = settings.VideoTracker.get('tracker_crop_padding', 2.0)
+        app_settings['tracker_engine'] = settings.VideoTracker.get('tracker_engine', 'thread')
+        app_settings['kalman_process_noise'] = settings.VideoTracker.get('kalman_process_noise', 1.0)
+        app_settings['kalman_measurement_noise'] = settings.VideoTracker.get('kalman_measurement_noise', 4.0)
+        app_settings['kalman_min_hits'] = settings.VideoTracker.get('kalman_min_hits', 3)
+        app_settings['kalman_max_misses'] = settings.VideoTracker.get('kalman_max_misses', 5)
+        app_settings['tracker_update_workers'] = settings.VideoTracker.get('tracker_update_workers', 0)
+        app_settings['tracker_process_workers'] = settings.VideoTracker.get('tracker_process_workers', 0)
+        app_settings['tracker_serial_threshold'] = settings.VideoTracker.get('tracker_serial_threshold', 2)
         app_settings['background_subtractor_type'] = settings.VideoTracker.get('background_subtractor_type', 'KNN')
         app_settings['background_subtractor_learning_rate'] = settings.VideoTracker.get('background_subtractor_learning_rate', 0.05)
         app_settings['tracker_wait_seconds_threshold'] = 0
 
+        # Tiled background subtraction section
+        app_settings['bg_tiling_enabled'] = settings.VideoTracker.get('bg_tiling_enabled', False)
+        app_settings['bg_tile_columns'] = settings.VideoTracker.get('bg_tile_columns', 2)
+        app_settings['bg_tile_rows'] = settings.VideoTracker.get('bg_tile_rows', 2)
+        app_settings['bg_tile_overlap'] = settings.VideoTracker.get('bg_tile_overlap', 32)
+        app_settings['bg_tile_workers'] = settings.VideoTracker.get('bg_tile_workers', 0)
+
+        # Background model update decimation section
+        app_settings['bg_decimation_enabled'] = settings.VideoTracker.get('bg_decimation_enabled', False)
+        app_settings['bg_decimation_max_interval'] = settings.VideoTracker.get('bg_decimation_max_interval', 4)
+        app_settings['bg_decimation_diff_threshold'] = settings.VideoTracker.get('bg_decimation_diff_threshold', 15)
+        app_settings['bg_decimation_change_threshold'] = settings.VideoTracker.get('bg_decimation_change_threshold', 0.002)
+
+        # Frame change gate section
+        app_settings['frame_gate_enabled'] = settings.VideoTracker.get('frame_gate_enabled', False)
+        app_settings['frame_gate_dimension'] = settings.VideoTracker.get('frame_gate_dimension', 64)
+        app_settings['frame_gate_threshold'] = settings.VideoTracker.get('frame_gate_threshold', 8)
+        app_settings['frame_gate_refresh_interval'] = settings.VideoTracker.get('frame_gate_refresh_interval', 30)
+
+        # Background model store section
+        app_settings['bg_model_store_enabled'] = settings.VideoTracker.get('bg_model_store_enabled', False)
+        app_settings['bg_model_store_path'] = settings.VideoTracker.get('bg_model_store_path', 'bg_model.npz')
+        app_settings['bg_model_store_history'] = settings.VideoTracker.get('bg_model_store_history', 10)
+        app_settings['bg_model_store_max_age'] = settings.VideoTracker.get('bg_model_store_max_age', 600)
+
+        # Cascade detection section
+        app_settings['cascade_enabled'] = settings.VideoTracker.get('cascade_enabled', False)
+        app_settings['cascade_detection_dimension'] = settings.VideoTracker.get('cascade_detection_dimension', 960)
+        app_settings['cascade_contrast_threshold'] = settings.VideoTracker.get('cascade_contrast_threshold', 10)
+
+        # Detection non max suppression section
+        app_settings['detection_nms_enabled'] = settings.VideoTracker.get('detection_nms_enabled', False)
+        app_settings['detection_nms_overlap_threshold'] = settings.VideoTracker.get('detection_nms_overlap_threshold', 0.3)
+        app_settings['detection_nms_merge'] = settings.VideoTracker.get('detection_nms_merge', False)
+        app_settings['detection_nms_max_detections'] = settings.VideoTracker.get('detection_nms_max_detections', 25)
+
+        # Frame reader section
+        app_settings['frame_prefetch_enabled'] = settings.VideoTracker.get('frame_prefetch_enabled', False)
+        app_settings['frame_prefetch_depth'] = settings.VideoTracker.get('frame_prefetch_depth', 8)
+        app_settings['capture_backend'] = settings.VideoTracker.get('capture_backend', 'opencv')
+        app_settings['capture_max_dimension'] = settings.VideoTracker.get('capture_max_dimension', 0)
+
+        # Frame pipeline section
+        app_settings['pipeline_enabled'] = settings.VideoTracker.get('pipeline_enabled', False)
+        app_settings['pipeline_depth'] = settings.VideoTracker.get('pipeline_depth', 2)
+
         # Tracker section
+        app_settings['track_association'] = settings.VideoTracker.get('track_association', 'global')
         app_settings['min_centre_point_distance_between_bboxes'] = settings.VideoTracker.get('min_centre_point_distance_between_bboxes', 64)
         app_settings['enable_track_validation'] = settings.VideoTracker.get('enable_track_validation', True)
         app_settings['stationary_track_threshold'] = settings.VideoTracker.get('stationary_track_threshold', 5)
-        app_settings['orphaned_track_threshold'] = settings.VideoTracker.get('orphaned_track_threshold', 20)        
+        app_settings['orphaned_track_threshold'] = settings.VideoTracker.get('orphaned_track_threshold', 20)
+        app_settings['tracker_grid_cell_size'] = settings.VideoTracker.get('tracker_grid_cell_size', 128)
+        app_settings['track_history_max_length'] = settings.VideoTracker.get('track_history_max_length', 1000)
+        app_settings['track_history_decimation'] = settings.VideoTracker.get('track_history_decimation', 0)
+        app_settings['track_history_long_term_max_length'] = settings.VideoTracker.get('track_history_long_term_max_length', 1000)
 
         # BBox section
         app_settings['bbox_fixed_size'] = settings.VideoTracker.get('bbox_fixed_size', False)
@@ -73,6 +146,8 @@ class AppSettings():
         app_settings['mask_type'] = settings.Mask.get('type', 'fish_eye')
         app_settings['mask_pct'] = settings.Mask.get('mask_pct', 10)
         app_settings['mask_overlay_image_path'] = settings.Mask.get('overlay_image_path', None)
+        app_settings['mask_cache_dir'] = settings.Mask.get('cache_dir', None)
+        app_settings['mask_roi_enabled'] = settings.Mask.get('roi_enabled', True)
 
         # Dense optical flow
         app_settings['dense_optical_flow_height'] = 480
@@ -97,11 +172,25 @@ class AppSettings():
             if app_settings['camera_uri'] == None:
                 print(f"Controller is set to Camera but camera_uri is None")
                 sys.exit(2)
+
+            camera_capture_mode = app_settings['camera_capture_mode']
+            camera_capture_modes = ['sync', 'latest']
+            if not camera_capture_mode in camera_capture_modes:
+                print(f"Unknown camera capture mode ({camera_capture_mode}). {camera_capture_modes} are supported.")
+                sys.exit(1)
         
         # Mike: The tracker threshold does not apply to video files
         if controller == 'video':
             app_settings['tracker_wait_seconds_threshold'] = 0
 
+        if app_settings['shard_count'] > 1 and controller != 'video':
+            print(f"Sharded processing is only supported by the video controller, shard_count will be reset to 1.")
+            app_settings['shard_count'] = 1
+
+        if app_settings['batch_workers'] < 1:
+            print(f"The number of batch workers ({app_settings['batch_workers']}) has to be at least 1, it will be reset to 1.")
+            app_settings['batch_workers'] = 1
+
         detection_mode = app_settings['detection_mode']
         detection_modes = ['background_subtraction', 'optical_flow', 'none']
         if not detection_mode:
@@ -112,10 +201,10 @@ class AppSettings():
             print(f"Detection Mode: {detection_mode}")
 
         blob_detector_type = app_settings['blob_detector_type']
-        supported_blob_detector_types = ['simple', 'sky360']
+        supported_blob_detector_types = ['simple', 'sky360', 'connected_components']
         if not blob_detector_type in supported_blob_detector_types:
             print(
-                f"Unknown blob detector type ({blob_detector_type}). 'simple' an 'sky360' are supported not {blob_detector_type}.")
+                f"Unknown blob detector type ({blob_detector_type}). {supported_blob_detector_types} are supported not {blob_detector_type}.")
             sys.exit(1)
         else:
             print(f"Blob Detector Type: {blob_detector_type}")
@@ -139,13 +228,153 @@ class AppSettings():
                 app_settings['mask_type'] = 'no_op'                
                 print(f"You have selected an {mask_type} mask type but the masking image '{overlay_image_path}' can't be found, a no_op mask will be used.")
 
+        capture_backend = app_settings['capture_backend']
+        capture_backends = ['opencv', 'ffmpeg_pipe']
+        if not capture_backend in capture_backends:
+            print(f"Unknown capture backend ({capture_backend}). {capture_backends} are supported.")
+            sys.exit(1)
+
+        # The frames of the ffmpeg pipe are preprocessed from their luma plane, which is only done by the CPU frame processor
+        if capture_backend == 'ffmpeg_pipe' or app_settings['camera_mode'] == 'ffmpeg_pipe':
+            if app_settings['enable_cuda']:
+                print(f"The ffmpeg pipe capture does not support CUDA, OpenCV will be used to capture frames.")
+                app_settings['capture_backend'] = 'opencv'
+                if app_settings['camera_mode'] == 'ffmpeg_pipe':
+                    app_settings['camera_mode'] = 'ffmpeg'
+            elif shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None:
+                print(f"The ffmpeg pipe capture needs ffmpeg and ffprobe on the path, OpenCV will be used to capture frames.")
+                app_settings['capture_backend'] = 'opencv'
+                if app_settings['camera_mode'] == 'ffmpeg_pipe':
+                    app_settings['camera_mode'] = 'ffmpeg'
+
+        if app_settings['frame_prefetch_depth'] < 1:
+            print(f"The frame prefetch depth ({app_settings['frame_prefetch_depth']}) has to be at least 1, it will be reset to 1.")
+            app_settings['frame_prefetch_depth'] = 1
+
+        if app_settings['pipeline_enabled'] and app_settings['enable_cuda']:
+            print(f"The frame pipeline does not support CUDA, frames will be processed one at a time.")
+            app_settings['pipeline_enabled'] = False
+
+        if app_settings['bg_tiling_enabled'] and app_settings['enable_cuda']:
+            print(f"Tiled background subtraction does not support CUDA, it will be disabled.")
+            app_settings['bg_tiling_enabled'] = False
+
+        if app_settings['bg_tile_columns'] < 1 or app_settings['bg_tile_rows'] < 1:
+            print(f"The background subtraction tile grid ({app_settings['bg_tile_columns']} x {app_settings['bg_tile_rows']}) needs at least 1 column and row, it will be reset to 1 x 1.")
+            app_settings['bg_tile_columns'] = max(1, app_settings['bg_tile_columns'])
+            app_settings['bg_tile_rows'] = max(1, app_settings['bg_tile_rows'])
+
+        if app_settings['bg_decimation_enabled'] and app_settings['enable_cuda']:
+            print(f"Background model update decimation does not support CUDA, it will be disabled.")
+            app_settings['bg_decimation_enabled'] = False
+
+        if app_settings['bg_decimation_max_interval'] < 1:
+            print(f"The background model update max interval ({app_settings['bg_decimation_max_interval']}) has to be at least 1, it will be reset to 1.")
+            app_settings['bg_decimation_max_interval'] = 1
+
+        if app_settings['frame_gate_enabled'] and app_settings['enable_cuda']:
+            print(f"The frame change gate does not support CUDA, it will be disabled.")
+            app_settings['frame_gate_enabled'] = False
+
+        if app_settings['bg_model_store_enabled']:
+            if app_settings['enable_cuda']:
+                print(f"The background model store does not support CUDA, it will be disabled.")
+                app_settings['bg_model_store_enabled'] = False
+            elif app_settings['controller'] != 'camera':
+                # The background of one video has nothing to do with the background of the next one
+                print(f"The background model store is only supported by the camera controller, it will be disabled.")
+                app_settings['bg_model_store_enabled'] = False
+
+        if app_settings['bg_model_store_history'] < 1:
+            print(f"The background model store history ({app_settings['bg_model_store_history']}) has to be at least 1 frame, it will be reset to 1.")
+            app_settings['bg_model_store_history'] = 1
+
+        nms_overlap_threshold = app_settings['detection_nms_overlap_threshold']
+        if nms_overlap_threshold <= 0 or nms_overlap_threshold > 1:
+            print(f"The detection non max suppression overlap threshold ({nms_overlap_threshold}) has to be between 0 and 1, it will be reset to 0.3.")
+            app_settings['detection_nms_overlap_threshold'] = 0.3
+
+        if app_settings['cascade_enabled']:
+            if app_settings['enable_cuda']:
+                print(f"Cascade detection does not support CUDA, it will be disabled.")
+                app_settings['cascade_enabled'] = False
+            else:
+                # The cascade detects on a scaled down frame itself and tracks on the full resolution frame
+                if app_settings['resize_frame']:
+                    print(f"Cascade detection tracks at full resolution, resize_frame will be disabled.")
+                    app_settings['resize_frame'] = False
+                if app_settings['bg_tiling_enabled']:
+                    print(f"Cascade detection does not support tiled background subtraction, it will be disabled.")
+                    app_settings['bg_tiling_enabled'] = False
+
+        if app_settings['tracker_type'] == 'KALMAN':
+            # There are no OpenCV trackers with the kalman engine, so there is nothing to tier
+            if app_settings['tracker_tiered_enabled']:
+                print(f"Tiered tracking is not supported by the KALMAN tracker type, it will be disabled.")
+                app_settings['tracker_tiered_enabled'] = False
+            if app_settings['kalman_min_hits'] < 1:
+                print(f"The kalman min hits ({app_settings['kalman_min_hits']}) must be at least 1, it will be reset to 3.")
+                app_settings['kalman_min_hits'] = 3
+            if app_settings['kalman_max_misses'] < 1:
+                print(f"The kalman max misses ({app_settings['kalman_max_misses']}) must be at least 1, it will be reset to 5.")
+                app_settings['kalman_max_misses'] = 5
+
+        if app_settings['tracker_tiered_enabled']:
+            tracker_provisional_type = app_settings['tracker_provisional_type']
+            tracker_provisional_types = ['KCF', 'MOSSE']
+            if not tracker_provisional_type in tracker_provisional_types:
+                print(f"Unknown provisional tracker type ({tracker_provisional_type}). {tracker_provisional_types} are supported.")
+                sys.exit(1)
+            # Targets only become active through track validation, without it they would never get the configured tracker
+            if not app_settings['enable_track_validation']:
+                print(f"Tiered tracking requires track validation, it will be disabled.")
+                app_settings['tracker_tiered_enabled'] = False
+
+        tracker_input = app_settings['tracker_input']
+        tracker_inputs = ['colour', 'grey']
+        if not tracker_input in tracker_inputs:
+            print(f"Unknown tracker input ({tracker_input}). {tracker_inputs} are supported.")
+            sys.exit(1)
+        # The OpenCV KCF tracker can't deal with a grey frame, it either loses the target straight away or throws
+        tracker_types = [app_settings['tracker_type']]
+        if app_settings['tracker_tiered_enabled']:
+            tracker_types.append(app_settings['tracker_provisional_type'])
+        if tracker_input == 'grey' and 'KCF' in tracker_types:
+            print(f"The grey tracker input is not supported by the KCF tracker, it will be reset to colour.")
+            app_settings['tracker_input'] = 'colour'
+        # OpenCV's CSRT converts a grey frame back to colour, on the whole frame that is more work rather than less
+        elif tracker_input == 'grey' and 'CSRT' in tracker_types and not app_settings['tracker_crop_enabled']:
+            print(f"The grey tracker input only helps the CSRT tracker together with tracker crops, it will be reset to colour.")
+            app_settings['tracker_input'] = 'colour'
+
+        # The cv2 trackers search around the target by about its own size, so the crop has to leave at least that much room
+        if app_settings['tracker_crop_enabled'] and app_settings['tracker_crop_padding'] < 1.0:
+            print(f"The tracker crop padding ({app_settings['tracker_crop_padding']}) must be at least 1.0, it will be reset to 2.0.")
+            app_settings['tracker_crop_padding'] = 2.0
+
+        tracker_engine = app_settings['tracker_engine']
+        tracker_engines = ['thread', 'process']
+        if not tracker_engine in tracker_engines:
+            print(f"Unknown tracker engine ({tracker_engine}). {tracker_engines} are supported.")
+            sys.exit(1)
+
+        track_association = app_settings['track_association']
+        track_associations = ['global', 'legacy']
+        if not track_association in track_associations:
+            print(f"Unknown track association ({track_association}). {track_associations} are supported.")
+            sys.exit(1)
+
+        if app_settings['track_history_max_length'] < 2:
+            print(f"The track history max length ({app_settings['track_history_max_length']}) must be at least 2, it will be reset to 1000.")
+            app_settings['track_history_max_length'] = 1000
+
         track_plotting_type = app_settings['track_plotting_type']
         if not track_plotting_type == 'line' or track_plotting_type == 'dot':
             print(f"You have selected an unsupported track plotting type {track_plotting_type}, it will be reset to line.")
             app_settings['track_plotting_type'] = 'line'
 
         background_subtractor_type = app_settings['background_subtractor_type']
-        supported_bgsubtractors = {'KNN', 'MOG', 'MOG2', 'BGS_FD', 'BGS_SFD', 'BGS_WMM', 'BGS_WMV', 'BGS_ABL', 'BGS_ASBL', 'BGS_MOG2', 'BGS_PBAS', 'BGS_SD', 'BGS_SuBSENSE', 'BGS_LOBSTER', 'BGS_PAWCS', 'BGS_TP', 'BGS_VB', 'BGS_CB', 'SKY_WMV', 'SKY_VIBE'}
+        supported_bgsubtractors = {'KNN', 'MOG', 'MOG2', 'BGS_FD', 'BGS_SFD', 'BGS_WMM', 'BGS_WMV', 'BGS_ABL', 'BGS_ASBL', 'BGS_MOG2', 'BGS_PBAS', 'BGS_SD', 'BGS_SuBSENSE', 'BGS_LOBSTER', 'BGS_PAWCS', 'BGS_TP', 'BGS_VB', 'BGS_CB', 'SKY_WMV', 'SKY_VIBE', 'NP_WMV'}
         supported_cuda_bgsubtractors = {'MOG2_CUDA', 'MOG_CUDA'}
         supported = False
         if app_settings['enable_cuda']:
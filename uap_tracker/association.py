@@ -0,0 +1,116 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import numpy as np
+
+# scipy is optional, if it's not installed we fall back to a greedy assignment which is good enough for the number of
+# trackers we tend to have alive at any one time
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+#####################################################################################################################################
+# This code file contains the vectorised functions used to associate detections with trackers. Rather than comparing each tracker #
+# with each detection in python, the costs of all the tracker / detection pairs are calculated in one go as a NumPy matrix with a #
+# row per tracker and a column per detection. The functions follow the same conventions as their counterparts in utils, so the    #
+# results are the same as utils.calc_centre_point_distance, utils.bbox_overlap etc.                                               #
+#####################################################################################################################################
+
+# Utility function to convert a list of bboxes in the format (x1,y1,w,h) into a (n, 4) array
+def as_bbox_array(bboxes):
+    if len(bboxes) == 0:
+        return np.empty((0, 4), np.float64)
+    return np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+
+# Utility function to convert bboxes into a list of (x1,y1,w,h) tuples of ints, some blob detectors return an (n, 4) array
+# but the trackers and listeners need tuples
+def as_bbox_tuples(bboxes):
+    if isinstance(bboxes, np.ndarray):
+        return [tuple(bbox) for bbox in bboxes.astype(int).tolist()]
+    return bboxes
+
+# Utility function to calculate the (integer) centre points of an array of bboxes, the same as Tracker.get_center
+def centre_points(boxes):
+    return np.trunc(boxes[:, 0:2] + (boxes[:, 2:4] / 2))
+
+# The centre point distance between all pairs of boxes, truncated to an integer like utils.calc_centre_point_distance
+def centre_distance_matrix(boxes1, boxes2):
+    delta = centre_points(boxes1)[:, np.newaxis, :] - centre_points(boxes2)[np.newaxis, :, :]
+    return np.floor(np.sqrt(np.sum(delta * delta, axis=2)))
+
+# The corners of the intersection rectangles of all pairs of boxes, (x2, y2) is inclusive like in utils.bbox_overlap
+def _intersection(boxes1, boxes2):
+    x_left = np.maximum(boxes1[:, np.newaxis, 0], boxes2[np.newaxis, :, 0])
+    y_top = np.maximum(boxes1[:, np.newaxis, 1], boxes2[np.newaxis, :, 1])
+    x_right = np.minimum((boxes1[:, 0] + boxes1[:, 2])[:, np.newaxis], (boxes2[:, 0] + boxes2[:, 2])[np.newaxis, :])
+    y_bottom = np.minimum((boxes1[:, 1] + boxes1[:, 3])[:, np.newaxis], (boxes2[:, 1] + boxes2[:, 3])[np.newaxis, :])
+    return x_left, y_top, x_right, y_bottom
+
+# The intersection over union of all pairs of boxes
+def iou_matrix(boxes1, boxes2):
+    x_left, y_top, x_right, y_bottom = _intersection(boxes1, boxes2)
+    intersection_area = np.clip(x_right - x_left + 1, 0, None) * np.clip(y_bottom - y_top + 1, 0, None)
+    area1 = (boxes1[:, 2] + 1) * (boxes1[:, 3] + 1)
+    area2 = (boxes2[:, 2] + 1) * (boxes2[:, 3] + 1)
+    return intersection_area / (area1[:, np.newaxis] + area2[np.newaxis, :] - intersection_area)
+
+# True for all pairs of boxes that overlap, the same as utils.bbox_overlap(bbox1, bbox2) > 0
+def intersects_matrix(boxes1, boxes2):
+    x_left, y_top, x_right, y_bottom = _intersection(boxes1, boxes2)
+    return (x_right >= x_left) & (y_bottom >= y_top)
+
+# Solve the one to one assignment of rows to columns with the lowest total cost, only pairs inside the gate can be assigned.
+# Returns a list of (row, col) tuples.
+def assign(cost, gate):
+    if not gate.any():
+        return []
+
+    if linear_sum_assignment is not None:
+        # pairs outside the gate get a cost that is higher than any combination of pairs inside of it
+        large_cost = (np.abs(cost[gate]).max() + 1) * (min(cost.shape) + 1)
+        rows, cols = linear_sum_assignment(np.where(gate, cost, large_cost))
+        return [(int(row), int(col)) for row, col in zip(rows, cols) if gate[row, col]]
+
+    # Greedy one to one assignment, lowest cost pairs first
+    rows, cols = np.nonzero(gate)
+    order = np.argsort(cost[rows, cols], kind='stable')
+    assigned_rows = set()
+    assigned_cols = set()
+    matches = []
+    for row, col in zip(rows[order], cols[order]):
+        if row in assigned_rows or col in assigned_cols:
+            continue
+        matches.append((int(row), int(col)))
+        assigned_rows.add(row)
+        assigned_cols.add(col)
+    return matches
+
+# Associate the detections with the trackers by centre point distance. Each tracker that can be matched (see can_match) is
+# assigned at most one detection. The detections that are not assigned but are still within the gate of a tracker are
+# fragments of a target that is already being tracked so they are absorbed rather than left unmatched.
+# Returns a tuple of (matches, unmatched) where matches is a list of (tracker_index, detection_index) tuples and unmatched
+# is an array of the indices of the detections that are not near any tracker.
+def associate(tracker_boxes, detection_boxes, max_distance, can_match=None):
+    if len(tracker_boxes) == 0 or len(detection_boxes) == 0:
+        return [], np.arange(len(detection_boxes))
+
+    distance = centre_distance_matrix(tracker_boxes, detection_boxes)
+    gate = distance < max_distance
+
+    assign_gate = gate
+    if can_match is not None:
+        assign_gate = gate & np.asarray(can_match, dtype=bool)[:, np.newaxis]
+
+    matches = assign(distance, assign_gate)
+    unmatched = np.flatnonzero(~gate.any(axis=0))
+    return matches, unmatched
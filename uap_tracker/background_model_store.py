@@ -0,0 +1,113 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import os
+import json
+import time
+import zipfile
+import numpy as np
+
+######################################################################################################################################
+# The background model store snapshots the background model to disk so that a new camera iteration, or a restart, can pick up where #
+# the previous one left off rather than having to learn the background all over again. Background subtractors that implement       #
+# get_state() (returning a dict of numpy arrays) and set_state(state) are snapshotted directly. The OpenCV, pybgs and pysky360      #
+# subtractors don't expose their model, so for those the store keeps a short history of the frames that were fed to the model and   #
+# replays them into the new model on restore.                                                                                       #
+# The snapshot carries the derived state of the frame processor (frame size, scaling, mask, region of interest etc.), a snapshot    #
+# is only restored when that matches and when it is not older than the max age, an old model would not match the light anymore.    #
+######################################################################################################################################
+class BackgroundModelStore():
+
+    def __init__(self, settings):
+        self.path = settings['bg_model_store_path']
+        self.history_length = max(1, settings['bg_model_store_history'])
+        self.max_age = settings['bg_model_store_max_age']
+        self.history = None
+        self.history_count = 0
+        self.history_index = 0
+
+    # record a frame that was fed to the background model, the history only keeps the most recent frames
+    def record(self, frame):
+        if self.history is None or self.history.shape[1:] != frame.shape:
+            self.history = np.empty((self.history_length,) + frame.shape, frame.dtype)
+            self.history_count = 0
+            self.history_index = 0
+        np.copyto(self.history[self.history_index], frame)
+        self.history_index = (self.history_index + 1) % self.history_length
+        self.history_count = min(self.history_count + 1, self.history_length)
+
+    # save a snapshot of the background subtractors, the meta is a dict of the derived state of the frame processor
+    def save(self, meta, background_subtractors):
+        arrays = {}
+        if _support_state(background_subtractors):
+            kind = 'state'
+            for i, background_subtractor in enumerate(background_subtractors):
+                for name, value in background_subtractor.get_state().items():
+                    arrays[f'state_{i}_{name}'] = value
+        elif self.history_count > 0:
+            kind = 'history'
+            # oldest frame first, that is the order they are replayed in
+            order = [(self.history_index - self.history_count + i) % self.history_length for i in range(self.history_count)]
+            arrays['history'] = self.history[order]
+        else:
+            return False
+
+        snapshot_meta = dict(meta, kind=kind, saved_at=time.time())
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file first so that a crash half way through never leaves a broken snapshot behind
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(snapshot_meta)), **arrays)
+        os.replace(temp_path, self.path)
+        print(f"Saved the background model ({kind}) to {self.path}")
+        return True
+
+    # restore the snapshot into the background subtractors if it matches the meta, replay is called with each frame of the
+    # history for the subtractors that don't support state. Returns true if the model was restored.
+    def load(self, meta, background_subtractors, replay):
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            with np.load(self.path) as snapshot:
+                snapshot_meta = json.loads(str(snapshot['meta']))
+                kind = snapshot_meta.pop('kind')
+                age = time.time() - snapshot_meta.pop('saved_at')
+                if snapshot_meta != json.loads(json.dumps(meta)):
+                    print(f"Ignoring the background model in {self.path}, it does not match the current settings.")
+                    return False
+                if age > self.max_age:
+                    print(f"Ignoring the background model in {self.path}, it is {int(age)} seconds old.")
+                    return False
+
+                if kind == 'state':
+                    if not _support_state(background_subtractors):
+                        return False
+                    for i, background_subtractor in enumerate(background_subtractors):
+                        prefix = f'state_{i}_'
+                        background_subtractor.set_state({key[len(prefix):]: snapshot[key] for key in snapshot.files if key.startswith(prefix)})
+                else:
+                    for frame in snapshot['history']:
+                        replay(frame)
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            print(f"Unable to restore the background model from {self.path}: {e}")
+            return False
+
+        print(f"Restored the background model ({kind}) from {self.path}")
+        return True
+
+# Utility function to check whether all the background subtractors can be snapshotted directly
+def _support_state(background_subtractors):
+    return all(hasattr(background_subtractor, 'get_state') and hasattr(background_subtractor, 'set_state') for background_subtractor in background_subtractors)
@@ -11,8 +11,20 @@
 # all copies or substantial portions of the Software.
 
 import cv2
-import pybgs as bgs
-import pysky360 as sky360
+from uap_tracker.decimated_background_subtractor import DecimatedBackgroundSubtractor
+from uap_tracker.weighted_moving_variance import WeightedMovingVariance
+
+# pybgs and pysky360 are compiled libraries that can be hard to build, they are only needed for their own background
+# subtractors so the others still work when they are not installed
+try:
+    import pybgs as bgs
+except ImportError:
+    bgs = None
+
+try:
+    import pysky360 as sky360
+except ImportError:
+    sky360 = None
 
 ####################################################################################################################
 # This class provides a factory implimentation for selecting which background subtraction algorithm should be used #
@@ -29,7 +41,13 @@ class BackgroundSubtractorFactory():
         if enable_cuda:
             return BackgroundSubtractorFactory.create('MOG2_CUDA', settings)
 
-        return BackgroundSubtractorFactory.create(bs_type, settings)
+        background_subtractor = BackgroundSubtractorFactory.create(bs_type, settings)
+
+        # Only update the model every Nth frame, the frames in between are compared against the background
+        if settings['bg_decimation_enabled']:
+            return DecimatedBackgroundSubtractor(settings, background_subtractor)
+
+        return background_subtractor
 
     # Static create method, used to instantiate the selected background subtraction algorithm along with
     # whatever parameters that have been configured
@@ -108,6 +126,11 @@ class BackgroundSubtractorFactory():
             else:
                 raise Exception(f"Unknown sensitivity option ({sensitivity}). 1, 2 and 3 is supported not {sensitivity}.")
 
+        if type.startswith('BGS_') and bgs is None:
+            raise Exception(f"The background subtractor type ({type}) requires pybgs, which is not installed.")
+        if type.startswith('SKY_') and sky360 is None:
+            raise Exception(f"The background subtractor type ({type}) requires pysky360, which is not installed.")
+
         if type == 'BGS_FD':
             background_subtractor = bgs.FrameDifference()
         if type == 'BGS_SFD':
@@ -144,6 +167,9 @@ class BackgroundSubtractorFactory():
         if type == 'SKY_WMV':
             background_subtractor = sky360.WeightedMovingVariance()
 
+        if type == 'NP_WMV':
+            background_subtractor = WeightedMovingVariance()
+
         if background_subtractor is None:
             raise Exception(f"Unknown background subtractor type ({type}).")
 
@@ -11,8 +11,14 @@
 # all copies or substantial portions of the Software.
 
 import cv2
+import numpy as np
 import uap_tracker.utils as utils
-import pysky360 as sky360
+
+# pysky360 is a compiled library that can be hard to build, it's only needed for the sky360 blob detector
+try:
+    import pysky360 as sky360
+except ImportError:
+    sky360 = None
 
 class BlobDetector():
 
@@ -28,6 +34,9 @@ class BlobDetector():
         if detector_type == 'sky360':
             return BlobDetector.Sky360(settings)
 
+        if detector_type == 'connected_components':
+            return BlobDetector.ConnectedComponents(settings)
+
     @staticmethod
     def Simple(settings):
         return SimpleBlobDetector(settings)
@@ -36,6 +45,10 @@ class BlobDetector():
     def Sky360(settings):
         return Sky360BlobDetector(settings)
 
+    @staticmethod
+    def ConnectedComponents(settings):
+        return ConnectedComponentsBlobDetector(settings)
+
 
     def __init__(self, settings):
         self.settings = settings
@@ -44,7 +57,8 @@ class BlobDetector():
     def initialise(self, init_frame):
         pass
 
-    def detect(self, frame):
+    # detect the blobs on the frame, the offset (x, y) is added to the bboxes when the frame is a region of a larger frame
+    def detect(self, frame, offset=(0, 0)):
         pass
 
 class SimpleBlobDetector(BlobDetector):
@@ -78,8 +92,8 @@ class SimpleBlobDetector(BlobDetector):
 
         self.blob_detector = cv2.SimpleBlobDetector_create(params)
 
-    def detect(self, frame):
-        super().detect(frame)
+    def detect(self, frame, offset=(0, 0)):
+        super().detect(frame, offset)
 
         # params.write('params.json')
         # print("created detector")
@@ -88,7 +102,7 @@ class SimpleBlobDetector(BlobDetector):
         keypoints = self.blob_detector.detect(frame)
         # print("ran detect")
 
-        bboxes = [utils.kp_to_bbox(x) for x in keypoints]
+        bboxes = [utils.kp_to_bbox(x, offset) for x in keypoints]
         return bboxes
 
 class Sky360BlobDetector(BlobDetector):
@@ -99,6 +113,9 @@ class Sky360BlobDetector(BlobDetector):
     def initialise(self, init_frame):
         super().initialise(init_frame)
 
+        if sky360 is None:
+            raise Exception(f"The sky360 blob detector requires pysky360, which is not installed.")
+
         self.blob_detector = sky360.ConnectedBlobDetection()
         
         if self.settings['bbox_fixed_size']:
@@ -117,8 +134,109 @@ class Sky360BlobDetector(BlobDetector):
             raise Exception(
                 f"Unknown sensitivity option ({self.sensitivity}). 1, 2 and 3 is supported not {self.sensitivity}.")
 
-    def detect(self, frame):
-        super().detect(frame)
+    def detect(self, frame, offset=(0, 0)):
+        super().detect(frame, offset)
+
+        # The frame can be the region of interest of a larger frame, the sky360 detector needs it to be contiguous
+        bboxes = self.blob_detector.detectBB(np.ascontiguousarray(frame))
+        if offset != (0, 0):
+            bboxes = [(bbox[0] + offset[0], bbox[1] + offset[1], bbox[2], bbox[3]) for bbox in bboxes]
+        return bboxes
+
+#####################################################################################################################################
+# Blob detector that thresholds the masked background once and labels its connected blobs with connectedComponentsWithStats,      #
+# rather than thresholding it at a range of levels like the simple blob detector. The blobs are filtered on their size and area   #
+# and blobs that are closer to a bigger blob than the min distance are dropped, all of this works on the stats array of the blobs #
+# as a whole. Like the bboxes of the simple blob detector (see utils.kp_to_bbox) the bboxes are squares around the centroid of the #
+# blob, scaled up from its size, and are clipped to the frame. They are returned as an (n, 4) array in the format (x1,y1,w,h).     #
+#####################################################################################################################################
+class ConnectedComponentsBlobDetector(BlobDetector):
+
+    # Same as the min threshold of the simple blob detector, anything darker than this is background
+    THRESHOLD = 3
+    # Same as the scale of utils.kp_to_bbox, the size of a bbox is this many times the diameter of its blob
+    BBOX_SCALE = 6
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.binary_frame = None
+        self.labels = None
+
+    def initialise(self, init_frame):
+        super().initialise(init_frame)
+
+        # The bboxes are clipped to the init frame, the frame is only a region of it when detect is given an offset
+        self.frame_h, self.frame_w = init_frame.shape[:2]
+
+        # Same as the simple blob detector, 5% of the width of the image, unless the bboxes have a fixed size in which case
+        # it's half of it like the sky360 blob detector
+        self.min_distance = int(init_frame.shape[1] * 0.05)
+        if self.settings['bbox_fixed_size']:
+            self.min_distance = int(self.settings['bbox_size'] / 2)
+
+        self.min_size = 2
+
+        if self.sensitivity == 1:  # Detects small, medium and large objects
+            self.min_area = 2
+        elif self.sensitivity == 2:  # Detects medium and large objects
+            self.min_area = 10
+        elif self.sensitivity == 3:  # Detects large objects
+            self.min_area = 25
+        else:
+            raise Exception(
+                f"Unknown sensitivity option ({self.sensitivity}). 1, 2 and 3 is supported not {self.sensitivity}.")
 
-        bboxes = self.blob_detector.detectBB(frame)
-        return bboxes
\ No newline at end of file
+    def detect(self, frame, offset=(0, 0)):
+        super().detect(frame, offset)
+
+        if self.binary_frame is None or self.binary_frame.shape != frame.shape[:2]:
+            self.binary_frame = np.empty(frame.shape[:2], np.uint8)
+            self.labels = np.empty(frame.shape[:2], np.int32)
+
+        cv2.threshold(frame, self.THRESHOLD - 1, 255, cv2.THRESH_BINARY, dst=self.binary_frame)
+        _, _, stats, centroids = cv2.connectedComponentsWithStats(self.binary_frame, labels=self.labels, connectivity=8, ltype=cv2.CV_32S)
+
+        # The first label is the background
+        stats = stats[1:]
+        centroids = centroids[1:]
+
+        keep = ((stats[:, cv2.CC_STAT_AREA] >= self.min_area)
+                & (stats[:, cv2.CC_STAT_WIDTH] >= self.min_size)
+                & (stats[:, cv2.CC_STAT_HEIGHT] >= self.min_size))
+        stats = stats[keep]
+        centroids = centroids[keep]
+
+        if len(stats) > 1 and self.min_distance > 0:
+            keep = self._separated(stats[:, cv2.CC_STAT_AREA], centroids)
+            stats = stats[keep]
+            centroids = centroids[keep]
+
+        return self._to_bboxes(stats, centroids, offset)
+
+    # private function to work out which blobs are at least the min distance away from a bigger blob, going from the biggest
+    # blob to the smallest each blob that is kept drops the smaller ones around it. Returns the indices of the blobs to keep in
+    # their original order. This loops over the kept blobs rather than working out the distances of all the pairs, there are
+    # only so many blobs the min distance apart on a frame while a noisy frame can have thousands of blobs.
+    def _separated(self, areas, centroids):
+        min_distance_squared = self.min_distance ** 2
+        dropped = np.zeros(len(areas), bool)
+        kept = []
+        for i in np.argsort(-areas, kind='stable'):
+            if dropped[i]:
+                continue
+            kept.append(i)
+            distances_squared = np.square(centroids - centroids[i]).sum(axis=1)
+            dropped |= distances_squared < min_distance_squared
+        return np.sort(kept)
+
+    # private function to turn the blobs into square bboxes around their centroids, clipped to the init frame
+    def _to_bboxes(self, stats, centroids, offset):
+        diameters = (stats[:, cv2.CC_STAT_WIDTH] + stats[:, cv2.CC_STAT_HEIGHT]) / 2
+        half_sizes = self.BBOX_SCALE * diameters / 2
+        x = centroids[:, 0] + offset[0]
+        y = centroids[:, 1] + offset[1]
+        x1 = np.clip(x - half_sizes, 0, self.frame_w).astype(int)
+        y1 = np.clip(y - half_sizes, 0, self.frame_h).astype(int)
+        x2 = np.clip(x + half_sizes, 0, self.frame_w).astype(int)
+        y2 = np.clip(y + half_sizes, 0, self.frame_h).astype(int)
+        return np.stack([x1, y1, x2 - x1, y2 - y1], axis=1)
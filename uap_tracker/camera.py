@@ -14,6 +14,7 @@ import cv2
 import os
 import sys
 from uap_tracker.app_settings import AppSettings
+from uap_tracker.ffmpeg_capture import FFmpegPipeCapture
 
 def get_camera(settings: AppSettings):
     camera_mode = settings['camera_mode']
@@ -26,6 +27,15 @@ def get_camera(settings: AppSettings):
             camera_uri,
             cv2.CAP_FFMPEG
         )
+    elif camera_mode == 'ffmpeg_pipe':
+        # Decode in a seperate ffmpeg process, the detection path only needs the luma plane of the frames
+        camera = FFmpegPipeCapture(
+            camera_uri,
+            settings,
+            ['-rtsp_transport', 'udp'] if camera_uri.startswith('rtsp') else []
+        )
+        if not camera.isOpened():
+            camera = None
     elif camera_mode == 'rtsp':
         camera = cv2.VideoCapture(
             camera_uri
@@ -49,3 +59,9 @@ def get_camera(settings: AppSettings):
         print(f"Unable to find camera using config: {settings}")
         sys.exit(1)
     return camera
+
+# function to open a video file with the capture backend selected in the settings
+def get_video_capture(settings: AppSettings, full_path):
+    if settings['capture_backend'] == 'ffmpeg_pipe':
+        return FFmpegPipeCapture(full_path, settings)
+    return cv2.VideoCapture(full_path)
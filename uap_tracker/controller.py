@@ -15,6 +15,7 @@ import sys
 import datetime
 from datetime import timedelta
 from uap_tracker.frame_processor import FrameProcessor
+from uap_tracker.frame_reader import FrameReader
 from uap_tracker.dense_optical_flow import DenseOpticalFlow
 from uap_tracker.background_subtractor_factory import BackgroundSubtractorFactory
 
@@ -56,14 +57,20 @@ class CameraController(Controller):
         self.running = True
         interation_count = 1
 
-        while self.running:
-            print(f"Starting camera iteration count: {interation_count}")
-            iteration_period = timedelta(minutes=self.minute_interval)
-            self.process_iteration((datetime.datetime.now() + iteration_period), init_frame)
-            interation_count += 1
+        # select what frame reader to use, the latest frame reader continuously drains the camera on its own thread so that
+        # we always process the most recent frame. It lives accross iterations so that the camera buffer never fills up.
+        with FrameReader.SelectCamera(self.video_tracker.settings, self.camera) as reader:
+            while self.running:
+                print(f"Starting camera iteration count: {interation_count}")
+                iteration_period = timedelta(minutes=self.minute_interval)
+                reader.reset_stats()
+                self.process_iteration(reader, (datetime.datetime.now() + iteration_period), init_frame)
+                dropped_frames, avg_latency, max_latency = reader.get_stats()
+                print(f"Camera iteration {interation_count} complete: dropped frames:{dropped_frames}, capture to process latency avg:{avg_latency:0.3f}s max:{max_latency:0.3f}s")
+                interation_count += 1
 
     # To avoid the camera from getting 'stuck' we process in intervals specified by configuration parameter.
-    def process_iteration(self, iteration_period, init_frame):
+    def process_iteration(self, reader, iteration_period, init_frame):
 
         frame_count = 0
         fps = 0
@@ -85,9 +92,9 @@ class CameraController(Controller):
             while True:
 
                 timer = cv2.getTickCount()
-                success, frame = self.camera.read()
+                success, frame, _, frame_timestamp = reader.read()
                 if success:
-                    self.video_tracker.process_frame(processor, frame, frame_count, fps)
+                    self.video_tracker.process_frame(processor, frame, frame_count, fps, frame_timestamp=frame_timestamp)
                     # Calculate Frames per second (FPS)
                     fps = cv2.getTickFrequency() / (cv2.getTickCount() - timer)
                     frame_count += 1
@@ -121,38 +128,98 @@ class VideoController(Controller):
     # Main entry point of the controller, this will kick off the whole image processing pipeline
     def run(self):
 
-        success, init_frame = self.capture.read()
-        if not success:
-            print(f"Could not open video stream")
-            sys.exit()
+        # select what frame reader to use, the prefetch reader decodes frames on its own thread so that decoding
+        # overlaps the processing of the previous frame
+        with FrameReader.Select(self.video_tracker.settings, self.capture) as reader:
 
-        frame_count = 0
-        fps = 0
-        background_subtractor = BackgroundSubtractorFactory.Select(self.video_tracker.settings)
+            success, init_frame, _, _ = reader.read()
+            if not success:
+                print(f"Could not open video stream")
+                sys.exit()
 
-        dense_optical_flow = None
-        if self.video_tracker.settings['calculate_optical_flow']:
-            dense_optical_flow = DenseOpticalFlow.Select(self.video_tracker.settings)
+            frame_count = 0
+            fps = 0
+            background_subtractor = BackgroundSubtractorFactory.Select(self.video_tracker.settings)
 
-        # select what frame processor to use, this is mainly going to be driven by configuration
-        with FrameProcessor.Select(
-            settings=self.video_tracker.settings,
-            dense_optical_flow=dense_optical_flow,
-            background_subtractor=background_subtractor) as processor:
+            dense_optical_flow = None
+            if self.video_tracker.settings['calculate_optical_flow']:
+                dense_optical_flow = DenseOpticalFlow.Select(self.video_tracker.settings)
 
-            # Mike: Initialise the tracker and processor
-            self.video_tracker.initialise(processor, init_frame)
+            # select what frame processor to use, this is mainly going to be driven by configuration
+            with FrameProcessor.Select(
+                settings=self.video_tracker.settings,
+                dense_optical_flow=dense_optical_flow,
+                background_subtractor=background_subtractor) as processor:
 
-            # If the escape key has been depressed then exit the processing loop
-            while cv2.waitKey(1) != 27:  # Escape
-                success, frame = self.capture.read()
-                if success:
+                # Mike: Initialise the tracker and processor
+                self.video_tracker.initialise(processor, init_frame)
+
+                # If the escape key has been depressed then exit the processing loop
+                while cv2.waitKey(1) != 27:  # Escape
+                    success, frame, _, frame_timestamp = reader.read()
+                    if success:
+                        timer = cv2.getTickCount()
+                        self.video_tracker.process_frame(processor, frame, frame_count, fps, frame_timestamp=frame_timestamp)
+                        # Calculate Frames per second (FPS)
+                        fps = cv2.getTickFrequency() / (cv2.getTickCount() - timer)
+                        frame_count += 1
+                    else:
+                        break
+
+                self.video_tracker.finalise()
+
+##############################################################################################################################
+# Specialised implementation of the video controller that only processes a time shard of a video file. The shard seeks to   #
+# its start minus a warm-up window so that the background subtractor has settled by the time its real range begins.          #
+# Frame counts reported to the video tracker are those of the whole video so that the results can be stitched back together. #
+##############################################################################################################################
+class ShardVideoController(VideoController):
+
+    def __init__(self, capture, video_tracker, warmup_start_frame, start_frame, end_frame):
+        super().__init__(capture, video_tracker)
+
+        self.warmup_start_frame = warmup_start_frame
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+
+    # Main entry point of the controller, this will kick off the whole image processing pipeline
+    def run(self):
+
+        if self.warmup_start_frame > 0:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, self.warmup_start_frame)
+
+        with FrameReader.Select(self.video_tracker.settings, self.capture, start_index=self.warmup_start_frame) as reader:
+
+            success, init_frame, _, _ = reader.read()
+            if not success:
+                print(f"Could not open video stream at frame {self.warmup_start_frame}")
+                sys.exit()
+
+            fps = 0
+            background_subtractor = BackgroundSubtractorFactory.Select(self.video_tracker.settings)
+
+            dense_optical_flow = None
+            if self.video_tracker.settings['calculate_optical_flow']:
+                dense_optical_flow = DenseOpticalFlow.Select(self.video_tracker.settings)
+
+            with FrameProcessor.Select(
+                settings=self.video_tracker.settings,
+                dense_optical_flow=dense_optical_flow,
+                background_subtractor=background_subtractor) as processor:
+
+                self.video_tracker.initialise(processor, init_frame)
+
+                while True:
+                    success, frame, frame_index, frame_timestamp = reader.read()
+                    if not success:
+                        break
+                    if self.end_frame is not None and frame_index >= self.end_frame:
+                        break
                     timer = cv2.getTickCount()
-                    self.video_tracker.process_frame(processor, frame, frame_count, fps)
-                    # Calculate Frames per second (FPS)
+                    # The init frame is never processed, so frame count 0 is the second frame of the video, keep
+                    # it that way so that the frame count of a shard lines up with that of a serial run. The frame
+                    # processor warms up on the frames it processes, not by this frame count.
+                    self.video_tracker.process_frame(processor, frame, frame_index - 1, fps, frame_timestamp=frame_timestamp)
                     fps = cv2.getTickFrequency() / (cv2.getTickCount() - timer)
-                    frame_count += 1
-                else:
-                    break
 
-            self.video_tracker.finalise()
\ No newline at end of file
+                self.video_tracker.finalise()
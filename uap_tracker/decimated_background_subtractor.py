@@ -0,0 +1,79 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import cv2
+import numpy as np
+
+####################################################################################################################################
+# Background subtractor that wraps the configured background subtractor and only updates its model every Nth frame. For a slow     #
+# moving sky the model does not need updating on every frame. On the frames in between the foreground mask is worked out with a   #
+# cheap absolute difference against a background frame that is kept up to date from the model updates, only the pixels that the   #
+# model considers background are copied into it so targets do not leave ghosts behind.                                             #
+# N adapts to the scene: when the frame difference shows that a lot of the scene changes the model is updated on the next frame   #
+# and the interval is halved, while the scene is quiet it grows by one frame per update up to the max interval.                    #
+####################################################################################################################################
+class DecimatedBackgroundSubtractor():
+
+    # Same as the frame processor, the background subtractor needs a few frames to get initialised
+    WARMUP_FRAMES = 5
+
+    def __init__(self, settings, background_subtractor):
+        self.background_subtractor = background_subtractor
+        self.max_interval = max(1, settings['bg_decimation_max_interval'])
+        self.diff_threshold = settings['bg_decimation_diff_threshold']
+        self.change_threshold = settings['bg_decimation_change_threshold']
+        self.interval = 1
+        self.frames_since_update = 0
+        self.scene_changed = False
+        self.frame_count = 0
+        self.background = None
+        self.foreground_mask = None
+
+    # returns the foreground mask of the frame, just like the apply of the wrapped background subtractor
+    def apply(self, frame):
+        self.frame_count += 1
+        if self.background is None or self.background.shape != frame.shape:
+            self.background = frame.copy()
+            self.frames_since_update = self.interval
+
+        if self.frame_count <= self.WARMUP_FRAMES or self.frames_since_update >= self.interval:
+            return self._update(frame)
+
+        self.frames_since_update += 1
+        return self._difference(frame)
+
+    # private function to update the wrapped model and refresh the background where the model sees background
+    def _update(self, frame):
+        foreground_mask = self.background_subtractor.apply(frame)
+        np.copyto(self.background, frame, where=(foreground_mask == 0))
+        if self.frame_count > self.WARMUP_FRAMES and not self.scene_changed:
+            self.interval = min(self.max_interval, self.interval + 1)
+        self.scene_changed = False
+        self.frames_since_update = 1
+        return foreground_mask
+
+    # private function to work out the foreground mask from the difference with the background, this also measures how
+    # much of the scene changes
+    def _difference(self, frame):
+        if self.foreground_mask is None or self.foreground_mask.shape != frame.shape:
+            self.foreground_mask = np.empty(frame.shape, np.uint8)
+        cv2.absdiff(frame, self.background, dst=self.foreground_mask)
+        cv2.threshold(self.foreground_mask, self.diff_threshold, 255, cv2.THRESH_BINARY, dst=self.foreground_mask)
+
+        change = cv2.countNonZero(self.foreground_mask) / self.foreground_mask.size
+        if change > self.change_threshold:
+            # The scene is changing, update the model on the next frame and more often from then on
+            self.interval = max(1, self.interval // 2)
+            self.frames_since_update = self.interval
+            self.scene_changed = True
+
+        return self.foreground_mask
@@ -0,0 +1,186 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import cv2
+import json
+import subprocess
+import numpy as np
+import uap_tracker.utils as utils
+
+####################################################################################################################################
+# Capture implementation that runs FFmpeg as a separate process and reads the raw decoded frames from its stdout pipe. Rather than #
+# converting every frame to full resolution BGR, the frames are handed over in the planar YUV 4:2:0 (I420) layout of the decoder,  #
+# which is half the size of BGR. The luma plane of that layout is the grey frame that the detection path needs, so the colour      #
+# frame is only converted when a tracker or listener actually asks for it (see DecodedFrame). Optionally FFmpeg also scales the    #
+# frames down so that the largest dimension is at most capture_max_dimension, the scaled frames are then the source frames.        #
+# It supports the subset of the cv2.VideoCapture interface that the controllers, frame readers and listeners use.                  #
+####################################################################################################################################
+class FFmpegPipeCapture():
+
+    def __init__(self, uri, settings, input_options=None):
+        self.uri = uri
+        self.max_dimension = settings['capture_max_dimension']
+        self.input_options = input_options if input_options is not None else []
+        self.process = None
+        self.frame_index = 0
+        self.fps = 0.0
+        self.frame_count = 0
+        self.width = 0
+        self.height = 0
+        if self._probe():
+            self._open(0)
+
+    # returns true when the decoder process is running
+    def isOpened(self):
+        return self.process is not None
+
+    # read the next frame, returns a tuple of (success, DecodedFrame)
+    def read(self):
+        if self.process is None:
+            return False, None
+
+        buffer = np.empty((self.height * 3 // 2, self.width), np.uint8)
+        view = memoryview(buffer).cast('B')
+        read = 0
+        while read < len(view):
+            count = self.process.stdout.readinto(view[read:])
+            if not count:
+                return False, None
+            read += count
+
+        self.frame_index += 1
+        return True, DecodedFrame(buffer, self.width, self.height)
+
+    # the subset of the cv2.VideoCapture properties that we use
+    def get(self, property_id):
+        if property_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if property_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if property_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if property_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count)
+        if property_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.frame_index)
+        if property_id == cv2.CAP_PROP_POS_MSEC:
+            # Just like OpenCV this is the timestamp of the frame that was read last
+            if self.fps <= 0:
+                return 0.0
+            return max(0, self.frame_index - 1) * 1000.0 / self.fps
+        return 0.0
+
+    # only seeking to a frame is supported, the decoder is restarted at the timestamp of that frame
+    def set(self, property_id, value):
+        if property_id != cv2.CAP_PROP_POS_FRAMES or self.fps <= 0:
+            return False
+        self.release()
+        self._open(int(value))
+        return True
+
+    # clean up after yourself
+    def release(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.stdout.close()
+            self.process.wait()
+            self.process = None
+
+    # private function to find out the size, frame rate and length of the video stream using ffprobe
+    def _probe(self):
+        command = ['ffprobe', '-v', 'error'] + self.input_options + [
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height,avg_frame_rate,r_frame_rate,nb_frames,duration',
+            '-of', 'json', self.uri]
+        try:
+            result = subprocess.run(command, capture_output=True, check=True, text=True)
+            stream = json.loads(result.stdout)['streams'][0]
+        except (OSError, subprocess.CalledProcessError, ValueError, KeyError, IndexError) as e:
+            print(f"Unable to probe {self.uri} with ffprobe: {e}")
+            return False
+
+        source_width = int(stream['width'])
+        source_height = int(stream['height'])
+        self.fps = _parse_frame_rate(stream.get('avg_frame_rate')) or _parse_frame_rate(stream.get('r_frame_rate'))
+        # Not all containers store the number of frames, in that case estimate it from the duration like OpenCV does
+        nb_frames = str(stream.get('nb_frames', ''))
+        self.frame_count = 0
+        if nb_frames.isdigit():
+            self.frame_count = int(nb_frames)
+        elif _is_number(stream.get('duration')):
+            self.frame_count = int(float(stream['duration']) * self.fps)
+
+        self.width = source_width
+        self.height = source_height
+        if self.max_dimension > 0:
+            _, self.width, self.height = utils.calc_image_scale(source_width, source_height, self.max_dimension, self.max_dimension)
+
+        # The chroma planes of I420 are half the size of the luma plane, so the frame needs an even width and height
+        self.width -= self.width % 2
+        self.height -= self.height % 2
+        return True
+
+    # private function to start the decoder process at the given frame
+    def _open(self, start_frame):
+        command = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin'] + self.input_options
+        if start_frame > 0:
+            command += ['-ss', f'{start_frame / self.fps:0.6f}']
+        command += ['-i', self.uri, '-map', '0:v:0', '-an', '-sn', '-vsync', '0',
+                    '-vf', f'scale={self.width}:{self.height}',
+                    '-f', 'rawvideo', '-pix_fmt', 'yuv420p', '-']
+        try:
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=0)
+        except OSError as e:
+            print(f"Unable to start ffmpeg for {self.uri}: {e}")
+            self.process = None
+            return
+        self.frame_index = start_frame
+
+##################################################################################################################################
+# A frame as it comes out of the decoder, in the planar YUV 4:2:0 (I420) layout. The luma plane is a view of the start of the   #
+# buffer so it comes for free, the colour frame is converted on request. The shape and dtype are those of the colour frame.     #
+##################################################################################################################################
+class DecodedFrame():
+
+    def __init__(self, yuv, width, height):
+        self.yuv = yuv
+        self.width = width
+        self.height = height
+        self.shape = (height, width, 3)
+        self.dtype = yuv.dtype
+
+    # the luma plane, this is in the limited (16 - 235) range of the video rather than the full range of a grey frame
+    @property
+    def luma(self):
+        return self.yuv[:self.height]
+
+    # convert the frame into BGR, dst is an optional preallocated buffer of the shape of the frame
+    def to_bgr(self, dst=None):
+        return cv2.cvtColor(self.yuv, cv2.COLOR_YUV2BGR_I420, dst=dst)
+
+# Utility function to parse an ffprobe frame rate such as '30000/1001', returns 0 if it can't be parsed
+def _parse_frame_rate(frame_rate):
+    try:
+        numerator, denominator = str(frame_rate).split('/')
+        if float(denominator) == 0:
+            return 0.0
+        return float(numerator) / float(denominator)
+    except ValueError:
+        return 0.0
+
+# Utility function to check whether an ffprobe value is a number, missing values are reported as 'N/A'
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
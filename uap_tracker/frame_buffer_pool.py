@@ -0,0 +1,52 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import numpy as np
+from threading import Lock
+
+##################################################################################################################################
+# A pool of reusable frame buffers keyed by shape and dtype. Rather than each OpenCV call allocating a new image for every frame  #
+# the frame processor acquires its output buffers from this pool and passes them in as dst, once the listeners and visualizers   #
+# are done with the frame the buffers are released back into the pool for the next frame. At 4K this saves tens of MB of         #
+# allocations per frame. The pool is thread safe as the stages of the frame pipeline acquire and release on different threads.  #
+##################################################################################################################################
+class FrameBufferPool():
+
+    def __init__(self):
+        self.free_buffers = {}
+        self.lock = Lock()
+        self.allocated = 0
+
+    # acquire a buffer of the given shape and dtype, the contents of the buffer are undefined
+    def acquire(self, shape, dtype=np.uint8):
+        key = (tuple(shape), np.dtype(dtype))
+        with self.lock:
+            buffers = self.free_buffers.get(key)
+            if buffers:
+                return buffers.pop()
+            self.allocated += 1
+        return np.empty(shape, dtype)
+
+    # release a buffer back into the pool, the buffer must not be used after it has been released
+    def release(self, buffer):
+        key = (buffer.shape, buffer.dtype)
+        with self.lock:
+            self.free_buffers.setdefault(key, []).append(buffer)
+
+    # make sure that there are at least count free buffers of the given shape and dtype
+    def prime(self, shape, dtype=np.uint8, count=1):
+        key = (tuple(shape), np.dtype(dtype))
+        with self.lock:
+            buffers = self.free_buffers.setdefault(key, [])
+            while len(buffers) < count:
+                buffers.append(np.empty(shape, dtype))
+                self.allocated += 1
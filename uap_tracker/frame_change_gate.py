@@ -0,0 +1,74 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import cv2
+from uap_tracker.ffmpeg_capture import DecodedFrame
+
+###################################################################################################################################
+# The frame change gate decides whether a frame is idle, i.e. nothing is being tracked and nothing in the scene has changed. Each #
+# frame is scaled down to a small grey thumbnail which is compared against the thumbnail of the last frame that was processed,   #
+# when none of the pixels differs by more than the threshold the frame is idle and the frame processor skips it. Slow changes    #
+# build up against the last processed frame until they pass the threshold. Every refresh interval idle frames a frame is         #
+# processed anyway so that the background subtractor keeps up with the light conditions.                                        #
+###################################################################################################################################
+class FrameChangeGate():
+
+    # Same as the frame processor, the background subtractor needs a few frames to get initialised
+    WARMUP_FRAMES = 5
+
+    def __init__(self, settings):
+        self.dimension = settings['frame_gate_dimension']
+        self.threshold = settings['frame_gate_threshold']
+        self.refresh_interval = settings['frame_gate_refresh_interval']
+        self.size = None
+        self.visibility = None
+        self.reference = None
+        self.idle_frames = 0
+        self.processed_frames = 0
+
+    # Initialiser to work out the size of the thumbnails for frames of the given shape. The visibility frame is the result of
+    # masking a white frame, if it's given only the parts of the thumbnail that are not masked out are compared.
+    def initialise(self, frame_shape, visibility=None):
+        h, w = frame_shape[:2]
+        scale = min(1.0, self.dimension / max(w, h))
+        self.size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        self.visibility = None
+        if visibility is not None:
+            self.visibility = cv2.compare(self._thumbnail(visibility), 0, cv2.CMP_GT)
+        print(f"  frame change gate thumbnail size h x w = {self.size[1]} x {self.size[0]}")
+
+    # returns true if the frame is idle, a frame is never idle while something is being tracked
+    def is_idle(self, frame, tracking):
+        thumbnail = self._thumbnail(frame)
+        idle = (not tracking
+                and self.reference is not None
+                and self.processed_frames >= self.WARMUP_FRAMES
+                and self.idle_frames < self.refresh_interval
+                and cv2.norm(thumbnail, self.reference, cv2.NORM_INF, mask=self.visibility) <= self.threshold)
+
+        if idle:
+            self.idle_frames += 1
+        else:
+            self.reference = thumbnail
+            self.idle_frames = 0
+            self.processed_frames += 1
+        return idle
+
+    # private function to scale the (colour, grey or decoded) frame down to a grey thumbnail
+    def _thumbnail(self, frame):
+        if isinstance(frame, DecodedFrame):
+            # The luma plane is the grey frame, the range does not matter as we only compare it with itself
+            return cv2.resize(frame.luma, self.size, interpolation=cv2.INTER_AREA)
+        thumbnail = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if len(thumbnail.shape) > 2:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        return thumbnail
@@ -0,0 +1,109 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import queue
+from threading import Thread
+
+#####################################################################################################################################
+# This class provides an overlapped multi-stage frame pipeline. The preprocessing (mask, resize, grey, blur) and detection          #
+# (background subtraction, blob detection) stages of the frame processor each run on their own thread and hand frames over to the #
+# next stage through a bounded queue. The tracking stage (tracker updates, listeners and visualizers) runs on the calling thread,  #
+# so while frame N is being tracked frame N+1 is already being preprocessed and background subtracted. Each stage processes one   #
+# frame at a time in the order they were submitted, so frame ordering is preserved and the results are the same as processing     #
+# the frames one by one. OpenCV releases the GIL so the stages really do run in parallel on a multi-core CPU.                      #
+#####################################################################################################################################
+class FramePipeline():
+
+    def __init__(self, frame_proc, depth, stream=None):
+        self.frame_proc = frame_proc
+        self.depth = max(1, depth)
+        self.stream = stream
+        self.in_flight = 0
+        self.preprocess_queue = queue.Queue(maxsize=self.depth)
+        self.detect_queue = queue.Queue(maxsize=self.depth)
+        self.result_queue = queue.Queue(maxsize=self.depth)
+        self.threads = []
+
+    def start(self):
+        self.threads = [
+            Thread(target=self._stage_task, args=(self.preprocess_queue, self.detect_queue, self._preprocess), daemon=True),
+            Thread(target=self._stage_task, args=(self.detect_queue, self.result_queue, self._detect), daemon=True)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    # stops the stage threads, any frames still in flight that have not been collected are discarded
+    def stop(self):
+        stopping = True
+        while stopping:
+            try:
+                self.preprocess_queue.put(None, timeout=0.1)
+                stopping = False
+            except queue.Full:
+                self._discard_results()
+        # The None works its way through all the stages, once it comes out the other end all the stages have stopped
+        while self.result_queue.get() is not None:
+            pass
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.in_flight = 0
+
+    def _discard_results(self):
+        try:
+            while True:
+                self.result_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    # submit a frame to the pipeline, this blocks if the pipeline is full
+    def submit(self, frame, frame_count, fps, frame_timestamp):
+        self.preprocess_queue.put((frame, frame_count, fps, frame_timestamp))
+        self.in_flight += 1
+
+    # returns true when the pipeline has run far enough ahead that a result should be collected before submitting more frames
+    def is_full(self):
+        return self.in_flight > self.depth
+
+    def has_pending(self):
+        return self.in_flight > 0
+
+    # collect the next frame result, in submission order, as a tuple of (frame_result, fps, frame_timestamp)
+    def collect(self):
+        item = self.result_queue.get()
+        self.in_flight -= 1
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def _preprocess(self, item):
+        frame, frame_count, fps, frame_timestamp = item
+        return (self.frame_proc.preprocess_frame(frame, frame_count, self.stream), fps, frame_timestamp)
+
+    def _detect(self, item):
+        frame_result, fps, frame_timestamp = item
+        return (self.frame_proc.detect_frame(frame_result, self.stream), fps, frame_timestamp)
+
+    # private function to serve as the entry point of each stage thread, a None item stops the stage and is passed on to the
+    # next stage. Exceptions are passed down the pipeline so that they are raised on the tracking (calling) thread.
+    def _stage_task(self, input_queue, output_queue, stage):
+        while True:
+            item = input_queue.get()
+            if item is None or isinstance(item, BaseException):
+                output_queue.put(item)
+                if item is None:
+                    break
+                continue
+            try:
+                output_queue.put(stage(item))
+            except BaseException as e:
+                output_queue.put(e)
@@ -16,8 +16,17 @@ import time
 import math
 from threading import Thread
 import uap_tracker.utils as utils
+import uap_tracker.non_max_suppression as non_max_suppression
 from uap_tracker.mask import Mask
 from uap_tracker.blob_detector import BlobDetector
+from uap_tracker.frame_buffer_pool import FrameBufferPool
+from uap_tracker.tiled_background_subtraction import TiledBackgroundSubtraction
+from uap_tracker.ffmpeg_capture import DecodedFrame
+from uap_tracker.frame_change_gate import FrameChangeGate
+from uap_tracker.background_model_store import BackgroundModelStore
+
+# Lookup table to convert the limited (16 - 235) range luma of a decoded frame into the full range grey that cvtColor gives
+LUMA_TO_GREY = numpy.clip(numpy.round((numpy.arange(256) - 16) * 255.0 / 219.0), 0, 255).astype(numpy.uint8)
 
 ####################################################################################################################################
 # Base class for various frame processor implementations. The idea here is that we have a standardised frame processing interface  #
@@ -37,12 +46,19 @@ class FrameProcessor():
         self.noise_reduction = settings['noise_reduction']
         self.detection_mode = settings['detection_mode']
         self.blur_radius = settings['blur_radius']
+        self.detection_nms_enabled = settings['detection_nms_enabled']
+        self.tracker_input = settings['tracker_input']
         self.original_frame_w = 0
         self.original_frame_h = 0
         self.mask = Mask.Select(settings)
         self.start = time.time()
         self.tracker_wait_seconds_threshold = settings['tracker_wait_seconds_threshold']
         self.blob_detector = BlobDetector.Select(settings)
+        self.buffer_pool = FrameBufferPool()
+        # Set when the background model was restored from a previous iteration, there's no need to wait for it then
+        self.warm_started = False
+        # The frame count of the first frame that is processed, a shard of a video starts part way into it
+        self.first_frame_count = None
 
     # Static select method, used as a factory method for selecting the appropriate implementation based on configuration
     @staticmethod
@@ -108,10 +124,151 @@ class FrameProcessor():
     def process_optical_flow(self, frame_grey, frame_w, frame_h, stream):
         pass
 
-    # interface specification for processing a frame, this is the main entry point method of this object
-    def process_frame(self, video_tracker, frame, frame_count, fps, stream):
+    # interface specification for the preprocessing stage of a frame i.e. mask, resize, grey and noise reduction
+    def preprocess_frame(self, frame, frame_count, stream):
+        pass
+
+    # interface specification for the detection stage of a frame i.e. background subtraction, blob detection and optical flow
+    def detect_frame(self, frame_result, stream):
         pass
 
+    # function to work out how many frames have been processed before this one. The frame count of a shard of a video starts
+    # part way into the video, but the background subtractor still has to warm up on the first frames the shard processes.
+    def count_warmup_frame(self, frame_result):
+        if self.first_frame_count is None:
+            self.first_frame_count = frame_result.frame_count
+        frame_result.warmup_frame_count = frame_result.frame_count - self.first_frame_count
+
+    # processes a frame from start to finish, this is the main entry point method of this object
+    def process_frame(self, video_tracker, frame, frame_count, fps, stream=None):
+        frame_result = self.detect_frame(self.preprocess_frame(frame, frame_count, stream), stream)
+        return self.track_frame(video_tracker, frame_result, stream)
+
+    # the tracking stage of a frame, this is the same for all the frame processors as the trackers run on the CPU. It hands the
+    # images of the frame over to the video tracker and updates the trackers with the detected bboxes.
+    def track_frame(self, video_tracker, frame_result, stream):
+
+        # The colour frame is only worked out when a listener or visualizer asks for it
+        video_tracker.add_lazy_image(video_tracker.FRAME_TYPE_ORIGINAL, frame_result.get_frame)
+        video_tracker.add_image(video_tracker.FRAME_TYPE_GREY, frame_result.frame_grey)
+
+        if self.detection_mode == 'background_subtraction':
+
+            video_tracker.add_lazy_image(video_tracker.FRAME_TYPE_MASKED_BACKGROUND, frame_result.get_frame_masked_background)
+
+            if frame_result.warmup_frame_count < 5 and not self.warm_started:
+                # Need 5 frames to get the background subtractor initialised
+                return frame_result.bboxes
+
+        # Allow camera to focus and deal with light conditions etc
+        if self.warm_started or math.floor((time.time() - self.start)) > self.tracker_wait_seconds_threshold:
+            # The trackers only need a frame if there is something to track
+            frame = None
+            if video_tracker.is_tracking or len(frame_result.bboxes) > 0:
+                frame = self.get_tracker_frame(video_tracker, frame_result)
+            video_tracker.update_trackers(frame_result.bboxes, frame)
+
+        # Mike: Wait for worker threads to join before publishing events as their results might be required
+        for worker_thread in frame_result.worker_threads:
+            worker_thread.join()
+
+        if frame_result.frame_optical_flow is not None:
+            video_tracker.add_image(video_tracker.FRAME_TYPE_OPTICAL_FLOW, frame_result.frame_optical_flow)
+
+        return frame_result.bboxes
+
+    # function to get the frame that is handed to the trackers. With the grey tracker input they all share the grey frame from
+    # before the noise reduction rather than each of them converting the colour frame to grey, an idle frame has no grey frame
+    # yet so it's worked out (without noise reduction) on request. The kalman engine doesn't need a frame at all.
+    def get_tracker_frame(self, video_tracker, frame_result):
+        if not video_tracker.tracker_engine.needs_frame:
+            return None
+        if self.tracker_input == 'grey':
+            if frame_result.frame_grey_sharp is not None:
+                return frame_result.frame_grey_sharp
+            return video_tracker.get_image(video_tracker.FRAME_TYPE_GREY)
+        return frame_result.get_frame()
+
+    # function to start the optical flow task of a frame on a seperate thread. The dense optical flow keeps the previous frame
+    # so the tasks of consecutive frames must not overlap, in the pipeline the detect stage of the next frame would start the
+    # next task before the track stage has joined this one, so the detect stage waits for it there
+    def start_optical_flow_task(self, frame_result, frame_grey, stream):
+        optical_flow_thread = Thread(target=self.perform_optical_flow_task,
+                                     args=(frame_result, frame_grey, self.resize_dimension[0], self.resize_dimension[1], stream))
+        optical_flow_thread.start()
+        if self.settings['pipeline_enabled']:
+            optical_flow_thread.join()
+        else:
+            frame_result.worker_threads.append(optical_flow_thread)
+
+    # task used to calculate the optical flow on a seperate thread, the result is stored on the frame result
+    def perform_optical_flow_task(self, frame_result, frame_grey, frame_w, frame_h, stream):
+        frame_result.frame_optical_flow = self.process_optical_flow(frame_grey, frame_w, frame_h, stream)
+
+    # the non max suppression of the detections of a frame, part of the detection stage. The detections that overlap a bigger
+    # detection are dropped (or merged into it) and their number is capped, so that the same target does not start a tracker
+    # for each of its blobs.
+    def suppress_detections(self, frame_result):
+        if self.detection_nms_enabled and len(frame_result.bboxes) > 0:
+            frame_result.bboxes = non_max_suppression.suppress_detections(
+                frame_result.bboxes,
+                self.settings['detection_nms_overlap_threshold'],
+                self.settings['detection_nms_max_detections'],
+                self.settings['detection_nms_merge'])
+
+################################################################################################################################
+# The result of processing a single frame. The preprocessing and detection stages fill this in, the tracking stage consumes  #
+# it. Keeping all of this per frame (rather than on the video tracker) allows the stages of consecutive frames to overlap.    #
+################################################################################################################################
+class FrameResult():
+
+    def __init__(self, frame_count, frame=None, frame_grey=None, buffer_pool=None):
+        self.frame_count = frame_count
+        # The number of frames processed before this one, this is what the warm up of the background subtractor goes by
+        self.warmup_frame_count = frame_count
+        self.frame = frame
+        self.frame_grey = frame_grey
+        # The grey frame before the noise reduction, this is what the trackers get with the grey tracker input
+        self.frame_grey_sharp = frame_grey
+        self.bboxes = []
+        self.frame_masked_background = None
+        self.frame_optical_flow = None
+        self.worker_threads = []
+        self.buffer_pool = buffer_pool
+        self.buffers = []
+        self.frame_loader = None
+        self.frame_masked_background_loader = None
+        self.idle = False
+
+    # get the colour frame, for a frame straight from the decoder the frame loader only works it out on the first request
+    def get_frame(self):
+        if self.frame is None and self.frame_loader is not None:
+            self.frame = self.frame_loader()
+            self.frame_loader = None
+        return self.frame
+
+    # get the masked background frame, in cascade mode the loader only scales it up to the size of the frame on the first request
+    def get_frame_masked_background(self):
+        if self.frame_masked_background_loader is not None:
+            self.frame_masked_background = self.frame_masked_background_loader()
+            self.frame_masked_background_loader = None
+        return self.frame_masked_background
+
+    # acquire a buffer from the pool that is released along with this frame result
+    def acquire_buffer(self, shape, dtype=numpy.uint8):
+        if self.buffer_pool is None:
+            return numpy.empty(shape, dtype)
+        buffer = self.buffer_pool.acquire(shape, dtype)
+        self.buffers.append(buffer)
+        return buffer
+
+    # release the buffers back into the pool, called once the listeners and visualizers are done with the frame
+    def release_buffers(self):
+        if self.buffer_pool is not None:
+            for buffer in self.buffers:
+                self.buffer_pool.release(buffer)
+        self.buffers = []
+
 ######################################################################
 # Specialised implementation of the frame processor specific to CPU. #
 ######################################################################
@@ -119,41 +276,208 @@ class CpuFrameProcessor(FrameProcessor):
 
     def __init__(self, settings, dense_optical_flow, background_subtractor):
         super().__init__(settings, dense_optical_flow, background_subtractor)
+        self.tiled_background_subtraction = None
+        self.frame_change_gate = None
+        self.background_model_store = None
+        self.tracking = False
 
     def __enter__(self):
         #print('CPU.__enter__')
         return self
 
     def __exit__(self, type, value, traceback):
-        pass
         #print('CPU.__exit__')
+        if self.background_model_store is not None:
+            self.background_model_store.save(self._get_background_model_meta(), self._get_background_subtractors())
+        if self.tiled_background_subtraction is not None:
+            self.tiled_background_subtraction.close()
 
-    def resize(self, frame, w, h, stream):
+    def initialise(self, init_frame):
+        # A frame straight from the decoder only has its luma plane preprocessed, the colour frame is worked out on request
+        self.decoded_frames = isinstance(init_frame, DecodedFrame)
+        if self.decoded_frames:
+            init_frame = init_frame.to_bgr()
+
+        size = super().initialise(init_frame)
+
+        # Prime the buffer pool with enough buffers for the frames that can be in flight at the same time
+        count = 1
+        if self.settings['pipeline_enabled']:
+            count = self.settings['pipeline_depth'] + 2
+        if self.mask.writes_new_frame:
+            self.buffer_pool.prime(self.mask.get_output_shape(init_frame.shape), init_frame.dtype, count)
+        frame_shape = (size[1], size[0])
+        if self.resize_frame:
+            self.buffer_pool.prime(frame_shape + init_frame.shape[2:], init_frame.dtype, count)
+        grey_count = count * 3 if self.noise_reduction else count * 2
+        if self.decoded_frames:
+            if self.mask.writes_new_frame:
+                self.buffer_pool.prime(self.mask.get_output_shape(init_frame.shape[:2]), numpy.uint8, count)
+            if self.resize_frame:
+                grey_count += count
+        self.buffer_pool.prime(frame_shape, numpy.uint8, grey_count)
+
+        # If the mask only leaves part of the frame visible then the grey, blur, background subtraction and blob detection
+        # only need to run on that part of the (resized) frame
+        self.roi = None
+        mask_roi = self.mask.get_roi()
+        if self.settings['mask_roi_enabled'] and mask_roi is not None:
+            self.roi = self._scale_roi(mask_roi, size)
+            if self.roi == (0, 0, size[0], size[1]):
+                self.roi = None
+
+        if self.settings['bg_tiling_enabled'] and self.detection_mode == 'background_subtraction':
+            self.tiled_background_subtraction = TiledBackgroundSubtraction(self.settings)
+            # Run a white frame through the mask to work out which parts of the processed frame are masked out
+            visibility = self.mask.apply(numpy.full(init_frame.shape, 255, init_frame.dtype))
+            if self.resize_frame:
+                visibility = self.resize(visibility, self.resize_dimension[0], self.resize_dimension[1], None)
+            visibility = self._get_roi(self.convert_to_grey(visibility, None))
+            self.tiled_background_subtraction.initialise((visibility.shape[1], visibility.shape[0]), visibility, init_frame)
+
+        if self.settings['frame_gate_enabled'] and self.detection_mode == 'background_subtraction':
+            self.frame_change_gate = FrameChangeGate(self.settings)
+            # The gate looks at the frame before it's masked, so it can only ignore what is masked out when the mask keeps
+            # the frame the same size
+            visibility = None
+            if self.mask.writes_new_frame and self.mask.get_output_shape(init_frame.shape) == init_frame.shape:
+                visibility = self.mask.apply(numpy.full(init_frame.shape, 255, init_frame.dtype))
+            self.frame_change_gate.initialise(init_frame.shape, visibility)
+
+        # In cascade mode the background subtraction and blob detection run on a scaled down copy of the (region of
+        # interest of the) grey frame, the candidates are then verified on the full resolution grey frame
+        self.cascade_size = None
+        if self.settings['cascade_enabled'] and self.detection_mode == 'background_subtraction':
+            region_w, region_h = size if self.roi is None else self.roi[2:4]
+            scale, scaled_width, scaled_height = utils.calc_image_scale(region_w, region_h, self.settings['cascade_detection_dimension'], self.settings['cascade_detection_dimension'])
+            if scale:
+                self.cascade_size = (scaled_width, scaled_height)
+                self.blob_detector.initialise(numpy.zeros((scaled_height, scaled_width), numpy.uint8))
+                self.buffer_pool.prime((scaled_height, scaled_width), numpy.uint8, count * 2)
+                print(f"  cascade detection size h x w = {scaled_height} x {scaled_width}")
+            else:
+                print(f"  cascade detection disabled, the frame is already smaller than the cascade detection dimension")
+
+        # Pick up the background model where the previous iteration left off
+        if self.settings['bg_model_store_enabled'] and self.detection_mode == 'background_subtraction':
+            self.background_model_store = BackgroundModelStore(self.settings)
+            self.warm_started = self.background_model_store.load(self._get_background_model_meta(), self._get_background_subtractors(), self._replay_background_frame)
+
+        return size
+
+    # private function to get the derived state of the frame processor that a stored background model has to match
+    def _get_background_model_meta(self):
+        detection_size = self.cascade_size
+        if detection_size is None:
+            detection_size = self.resize_dimension if self.resize_frame else (self.original_frame_w, self.original_frame_h)
+            if self.roi is not None:
+                detection_size = self.roi[2:4]
+        tiles = None
+        if self.tiled_background_subtraction is not None:
+            tiles = [self.settings['bg_tile_columns'], self.settings['bg_tile_rows'], self.settings['bg_tile_overlap']]
+        return {
+            'background_subtractor_type': self.settings['background_subtractor_type'],
+            'detection_sensitivity': self.settings['detection_sensitivity'],
+            'mask_type': self.settings['mask_type'],
+            'mask_pct': self.settings['mask_pct'],
+            'mask_overlay_image_path': self.settings['mask_overlay_image_path'],
+            'noise_reduction': self.noise_reduction,
+            'blur_radius': self.blur_radius,
+            'source_size': [self.original_frame_w, self.original_frame_h],
+            'detection_size': list(detection_size),
+            'roi': None if self.roi is None else list(self.roi),
+            'tiles': tiles,
+        }
+
+    # private function to get the background subtractors, there's one for each tile with tiled background subtraction
+    def _get_background_subtractors(self):
+        if self.tiled_background_subtraction is not None:
+            return self.tiled_background_subtraction.get_background_subtractors()
+        return [self.background_subtractor]
+
+    # private function to feed a frame of the stored frame history to the background subtractors
+    def _replay_background_frame(self, frame_grey):
+        if self.tiled_background_subtraction is not None:
+            self.tiled_background_subtraction.replay(frame_grey)
+        else:
+            self.background_subtractor.apply(numpy.ascontiguousarray(frame_grey))
+
+    # private function to record a frame that is fed to the background subtractors in the frame history of the model store
+    def _record_background_frame(self, frame_grey):
+        if self.background_model_store is not None:
+            self.background_model_store.record(frame_grey)
+
+    # private function to scale the region of interest of the mask to the size of the processed frame. When the frame is resized
+    # the region is grown by a pixel to cover the pixels that are interpolated from the edge of the region. When noise reduction
+    # is enabled it's grown by twice the blur radius, once as the blur spreads the edge of the region and once more so that the
+    # border pixels the blur makes up at the edge of the region are all zero, just like they are in the full frame.
+    def _scale_roi(self, roi, size):
+        x, y, w, h = roi
+        scale_w = 1.0
+        scale_h = 1.0
+        margin = 0
+        if self.resize_frame:
+            scale_w = size[0] / self.original_frame_w
+            scale_h = size[1] / self.original_frame_h
+            margin += 1
+        if self.noise_reduction:
+            margin += (self.blur_radius // 2) * 2
+        left = max(0, math.floor(x * scale_w) - margin)
+        top = max(0, math.floor(y * scale_h) - margin)
+        right = min(size[0], math.ceil((x + w) * scale_w) + margin)
+        bottom = min(size[1], math.ceil((y + h) * scale_h) + margin)
+        return (left, top, right - left, bottom - top)
+
+    # private function to get the region of interest of a frame, or the whole frame if there is no region of interest
+    def _get_roi(self, frame):
+        if self.roi is None:
+            return frame
+        x, y, w, h = self.roi
+        return frame[y:y+h, x:x+w]
+
+    # private function to get the region of interest of a full size output buffer. Outside of the region everything has been
+    # masked out so the buffer is cleared there.
+    def _get_roi_dst(self, buffer):
+        if self.roi is None:
+            return buffer
+        utils.zero_outside_roi(buffer, self.roi)
+        return self._get_roi(buffer)
+
+    def resize(self, frame, w, h, stream, dst=None):
         # Overload this for a CPU specific implementation
         #print(f'CPU.resize_frame w:{w}, h:{h}')
-        return cv2.resize(frame, (w, h))
+        return cv2.resize(frame, (w, h), dst=dst)
 
-    def reduce_noise(self, frame, blur_radius, stream):
+    def reduce_noise(self, frame, blur_radius, stream, dst=None):
         # Overload this for a CPU specific implementation
         #print('CPU.noise_reduction')
-        noise_reduced_frame = cv2.GaussianBlur(frame, (blur_radius, blur_radius), 0)
+        noise_reduced_frame = cv2.GaussianBlur(frame, (blur_radius, blur_radius), 0, dst=dst)
         # frame_grey = cv2.medianBlur(frame_grey, blur_radius)
         return noise_reduced_frame
 
-    def convert_to_grey(self, frame, stream):
+    def convert_to_grey(self, frame, stream, dst=None):
         # Overload this for a CPU specific implementation
         #print('CPU.convert_to_grey')
-        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=dst)
 
-    def bboxes_from_bg_subtraction(self, frame_grey, stream):
+    def bboxes_from_bg_subtraction(self, frame_grey, stream, dst=None, offset=(0, 0)):
         # Overload this for a CPU specific implementation
         #print('CPU.bboxes_from_bg_subtraction')
 
+        # Only the OpenCV background subtractors deal with the region of interest of a frame, the others need it contiguous
+        if not isinstance(self.background_subtractor, cv2.BackgroundSubtractor):
+            frame_grey = numpy.ascontiguousarray(frame_grey)
+
         # Mike: This needs to be done on an 8 bit grey scale image, the colour image is causing a detection cluster
         foreground_mask = self.background_subtractor.apply(frame_grey) #, learningRate=self.background_subtractor_learning_rate)
-        frame_masked_background = cv2.bitwise_and(frame_grey, frame_grey, mask=foreground_mask)
+        if dst is None:
+            frame_masked_background = cv2.bitwise_and(frame_grey, frame_grey, mask=foreground_mask)
+        else:
+            # bitwise_and leaves the pixels outside of the mask untouched, so clear out the previous frame first
+            dst.fill(0)
+            frame_masked_background = cv2.bitwise_and(frame_grey, frame_grey, dst=dst, mask=foreground_mask)
 
-        bboxes = self.blob_detector.detect(frame_masked_background)
+        bboxes = self.blob_detector.detect(frame_masked_background, offset)
 
         return bboxes, frame_masked_background
 
@@ -163,57 +487,178 @@ class CpuFrameProcessor(FrameProcessor):
         dof_frame = self.dense_optical_flow.process_grey_frame(frame_grey)
         return self.resize(dof_frame, frame_w, frame_h, stream)
 
-    def process_frame(self, video_tracker, frame, frame_count, fps, stream=None):
+    def track_frame(self, video_tracker, frame_result, stream):
+        if frame_result.idle:
+            self._track_idle_frame(video_tracker, frame_result, stream)
+        else:
+            super().track_frame(video_tracker, frame_result, stream)
+
+        # The frame change gate never skips a frame while something is being tracked
+        self.tracking = video_tracker.is_tracking
+        return frame_result.bboxes
+
+    # private function for the tracking stage of an idle frame. Nothing has been detected, the images of the frame are only
+    # worked out when a listener or visualizer asks for them.
+    def _track_idle_frame(self, video_tracker, frame_result, stream):
+        video_tracker.add_lazy_image(video_tracker.FRAME_TYPE_ORIGINAL, frame_result.get_frame)
+        video_tracker.add_lazy_image(video_tracker.FRAME_TYPE_GREY, lambda: self._load_idle_grey_frame(frame_result, stream))
+        video_tracker.add_lazy_image(video_tracker.FRAME_TYPE_MASKED_BACKGROUND, lambda: self._load_blank_frame(frame_result, 1))
+        if self.dense_optical_flow is not None:
+            video_tracker.add_lazy_image(video_tracker.FRAME_TYPE_OPTICAL_FLOW, lambda: self._load_blank_frame(frame_result, 3))
+
+        # In the pipeline the gate decides before the previous frames have been tracked, so a tracker might have been
+        # created since then. It still gets updated, there just aren't any detections to go with it.
+        if video_tracker.is_tracking:
+            video_tracker.update_trackers([], self.get_tracker_frame(video_tracker, frame_result))
+
+    # private function to work out the grey frame of an idle frame on request
+    def _load_idle_grey_frame(self, frame_result, stream):
+        frame = frame_result.get_frame()
+        frame_grey = frame_result.acquire_buffer(frame.shape[:2], numpy.uint8)
+        self.convert_to_grey(self._get_roi(frame), stream, self._get_roi_dst(frame_grey))
+        return frame_grey
+
+    # private function to get a black frame the size of the frame with the given number of channels
+    def _load_blank_frame(self, frame_result, channels):
+        frame = frame_result.get_frame()
+        shape = frame.shape[:2] if channels == 1 else frame.shape[:2] + (channels,)
+        blank_frame = frame_result.acquire_buffer(shape, numpy.uint8)
+        blank_frame.fill(0)
+        return blank_frame
+
+    def perform_optical_flow_task(self, frame_result, frame_grey, frame_w, frame_h, stream):
+        dof_frame = self.dense_optical_flow.process_grey_frame(frame_grey)
+        dst = frame_result.acquire_buffer((frame_h, frame_w) + dof_frame.shape[2:], dof_frame.dtype)
+        frame_result.frame_optical_flow = self.resize(dof_frame, frame_w, frame_h, stream, dst)
+
+    def preprocess_frame(self, frame, frame_count, stream=None):
+
+        # All the intermediate frames are written into buffers from the pool, they are released along with the frame result
+        frame_result = FrameResult(frame_count, buffer_pool=self.buffer_pool)
+        self.count_warmup_frame(frame_result)
+
+        # Nothing has changed and nothing is being tracked, skip the frame. The colour frame is still worked out if a
+        # listener asks for it
+        if self.frame_change_gate is not None and self.frame_change_gate.is_idle(frame, self.tracking):
+            frame_result.idle = True
+            frame_result.frame_loader = lambda: self._load_colour_frame(frame, frame_result, stream)
+            return frame_result
+
+        # The grey frames are full size, but only the region of interest is converted and blurred. The results are written
+        # straight into the region of the dst buffer.
+        if isinstance(frame, DecodedFrame):
+            # The luma plane of the decoder output is masked and resized on its own, which is a third of the work of doing
+            # it to the colour frame, and it's converted to grey with a lookup table rather than from colour
+            luma = self._mask_and_resize(frame.luma, frame_result, stream)
+            frame_grey = frame_result.acquire_buffer(luma.shape, numpy.uint8)
+            cv2.LUT(self._get_roi(luma), LUMA_TO_GREY, dst=self._get_roi_dst(frame_grey))
+            frame_result.frame_loader = lambda: self._load_colour_frame(frame, frame_result, stream)
+        else:
+            frame = self._mask_and_resize(frame, frame_result, stream)
+            frame_grey = frame_result.acquire_buffer(frame.shape[:2], numpy.uint8)
+            self.convert_to_grey(self._get_roi(frame), stream, self._get_roi_dst(frame_grey))
+            frame_result.frame = frame
+
+        frame_result.frame_grey_sharp = frame_grey
+        if self.noise_reduction:
+            frame_grey_blurred = frame_result.acquire_buffer(frame_grey.shape, frame_grey.dtype)
+            self.reduce_noise(self._get_roi(frame_grey), self.blur_radius, stream, self._get_roi_dst(frame_grey_blurred))
+            frame_grey = frame_grey_blurred
 
-        # print(f" fps:{int(fps)}", end='\r')
+        frame_result.frame_grey = frame_grey
+        return frame_result
 
-        worker_threads = []
-        bboxes = []
+    # private function to work out the colour frame of a frame result on request
+    def _load_colour_frame(self, frame, frame_result, stream):
+        if isinstance(frame, DecodedFrame):
+            frame = frame.to_bgr(frame_result.acquire_buffer(frame.shape, frame.dtype))
+        return self._mask_and_resize(frame, frame_result, stream)
 
-        frame = self.mask.apply(frame)
+    # private function to mask and resize a (colour or luma) frame into buffers of the frame result
+    def _mask_and_resize(self, frame, frame_result, stream):
+        if self.mask.writes_new_frame:
+            frame = self.mask.apply(frame, stream, frame_result.acquire_buffer(self.mask.get_output_shape(frame.shape), frame.dtype))
 
         # Mike: As part of the initialisation method we worked out that the frame needs to be resized
         if self.resize_frame:
-            frame = self.resize(frame, self.resize_dimension[0], self.resize_dimension[1], stream)
+            w, h = self.resize_dimension
+            frame = self.resize(frame, w, h, stream, frame_result.acquire_buffer((h, w) + frame.shape[2:], frame.dtype))
 
-        frame_grey = self.convert_to_grey(frame, stream)
+        return frame
 
-        if self.noise_reduction:
-            frame_grey = self.reduce_noise(frame_grey, self.blur_radius, stream)
+    def detect_frame(self, frame_result, stream=None):
 
-        video_tracker.add_image(video_tracker.FRAME_TYPE_ORIGINAL, frame)
-        video_tracker.add_image(video_tracker.FRAME_TYPE_GREY, frame_grey)
+        if frame_result.idle:
+            return frame_result
 
         if self.detection_mode == 'background_subtraction':
 
-            bboxes, frame_masked_background = self.bboxes_from_bg_subtraction(frame_grey, stream)
-            video_tracker.add_image(video_tracker.FRAME_TYPE_MASKED_BACKGROUND, frame_masked_background)
-
-            if frame_count < 5:
-                # Need 5 frames to get the background subtractor initialised
-                return bboxes
-
-            if self.dense_optical_flow is not None:
-                optical_flow_thread = Thread(target=self.perform_optical_flow_task,
-                                             args=(video_tracker, frame_count, frame_grey, self.resize_dimension[0], self.resize_dimension[1], stream))
-                optical_flow_thread.start()
-                worker_threads.append(optical_flow_thread)
-
-        # Mike: Allow cameta to focus and deal with light conditions etc
-        if math.floor((time.time() - self.start)) > self.tracker_wait_seconds_threshold:
-            video_tracker.update_trackers(bboxes, frame)
-
-        frame_count + 1
-
-        # Mike: Wait for worker threads to join before publishing events as their results might be required
-        for worker_thread in worker_threads:
-            worker_thread.join()
-
-        return bboxes
-
-    def perform_optical_flow_task(self, video_tracker, frame_count, frame_grey, frame_w, frame_h, stream):
-        optical_flow_frame = self.process_optical_flow(frame_grey, frame_w, frame_h, stream)
-        video_tracker.add_image(video_tracker.FRAME_TYPE_OPTICAL_FLOW, optical_flow_frame)
+            if self.cascade_size is not None:
+                self._detect_cascade(frame_result, stream)
+            else:
+                frame_masked_background = frame_result.acquire_buffer(frame_result.frame_grey.shape, frame_result.frame_grey.dtype)
+                # The bboxes are translated from the region of interest back to the frame by the blob detector
+                offset = (0, 0) if self.roi is None else self.roi[0:2]
+                self._record_background_frame(self._get_roi(frame_result.frame_grey))
+                if self.tiled_background_subtraction is not None:
+                    frame_result.bboxes = self.tiled_background_subtraction.detect(self._get_roi(frame_result.frame_grey), self._get_roi_dst(frame_masked_background), offset)
+                else:
+                    frame_result.bboxes, _ = self.bboxes_from_bg_subtraction(self._get_roi(frame_result.frame_grey), stream, self._get_roi_dst(frame_masked_background), offset)
+                frame_result.frame_masked_background = frame_masked_background
+
+            self.suppress_detections(frame_result)
+
+            if frame_result.warmup_frame_count >= 5 and self.dense_optical_flow is not None:
+                self.start_optical_flow_task(frame_result, frame_result.frame_grey, stream)
+
+        return frame_result
+
+    # private function for the detection stage in cascade mode. The background subtraction and blob detection propose candidates
+    # on the scaled down grey frame, the candidates are scaled up to the full resolution frame and only the ones that stand out
+    # from their surroundings on the full resolution grey frame are handed over to the trackers.
+    def _detect_cascade(self, frame_result, stream):
+        frame_grey = self._get_roi(frame_result.frame_grey)
+        w, h = self.cascade_size
+        # Area interpolation averages the pixels rather than skipping them, so small targets still leave a trace
+        frame_grey_small = cv2.resize(frame_grey, (w, h), dst=frame_result.acquire_buffer((h, w), numpy.uint8), interpolation=cv2.INTER_AREA)
+        self._record_background_frame(frame_grey_small)
+        candidates, frame_masked_background_small = self.bboxes_from_bg_subtraction(frame_grey_small, stream, frame_result.acquire_buffer((h, w), numpy.uint8))
+
+        offset_x, offset_y = (0, 0) if self.roi is None else self.roi[0:2]
+        scale_x = frame_grey.shape[1] / w
+        scale_y = frame_grey.shape[0] / h
+        candidates = [(int(offset_x + x * scale_x), int(offset_y + y * scale_y), int(bw * scale_x), int(bh * scale_y)) for x, y, bw, bh in candidates]
+        if self.settings['bbox_fixed_size']:
+            # The fixed bbox size is a size at full resolution, only the centre of the candidate is scaled up
+            candidates = [utils.get_sized_bbox(bbox, self.settings) for bbox in candidates]
+        frame_result.bboxes = self._verify_candidates(frame_result.frame_grey, candidates)
+
+        def load_frame_masked_background():
+            frame_masked_background = frame_result.acquire_buffer(frame_result.frame_grey.shape, numpy.uint8)
+            dst = self._get_roi_dst(frame_masked_background)
+            cv2.resize(frame_masked_background_small, (dst.shape[1], dst.shape[0]), dst=dst, interpolation=cv2.INTER_NEAREST)
+            return frame_masked_background
+
+        frame_result.frame_masked_background_loader = load_frame_masked_background
+
+    # private function to verify the cascade candidates on the full resolution grey frame. A candidate passes when the contrast
+    # between its brightest (or darkest) pixel and the local background, the median of the candidate and a ring of half its size
+    # around it, is at least the cascade contrast threshold. Returns the candidates that pass.
+    def _verify_candidates(self, frame_grey, candidates):
+        frame_h, frame_w = frame_grey.shape[:2]
+        threshold = self.settings['cascade_contrast_threshold']
+        verified = []
+        for bbox in candidates:
+            x, y, w, h = bbox
+            candidate = frame_grey[max(0, y):min(frame_h, y + h), max(0, x):min(frame_w, x + w)]
+            if candidate.size == 0:
+                continue
+            surroundings = frame_grey[max(0, y - h // 2):min(frame_h, y + h + h // 2), max(0, x - w // 2):min(frame_w, x + w + w // 2)]
+            background = float(numpy.median(surroundings))
+            contrast = max(float(candidate.max()) - background, background - float(candidate.min()))
+            if contrast >= threshold:
+                verified.append(bbox)
+        return verified
 
 ################################################################################
 # Specialised implementation of the frame processor specific to GPU i.e. CUDA. #
@@ -268,12 +713,7 @@ class GpuFrameProcessor(FrameProcessor):
         gpu_dof_frame = self.resize(gpu_dof_frame, frame_w, frame_h, stream)
         return gpu_dof_frame
 
-    def process_frame(self, video_tracker, frame, frame_count, fps, stream):
-
-        # print(f" fps:{int(fps)}", end='\r')
-
-        worker_threads = []
-        bboxes = []
+    def preprocess_frame(self, frame, frame_count, stream):
 
         # Mike: We need to upload the frame to GPU memory so that we can process it on the GPU
         # We try and limit as much as we can the upload and download of the frae 
@@ -288,45 +728,35 @@ class GpuFrameProcessor(FrameProcessor):
 
         gpu_frame_grey = self.convert_to_grey(gpu_frame, stream)
 
+        # The trackers get the grey frame before the noise reduction, it's only downloaded when they need it
+        frame_grey_sharp = None
         if self.noise_reduction:
+            if self.tracker_input == 'grey':
+                frame_grey_sharp = gpu_frame_grey.download()
             gpu_frame_grey = self.reduce_noise(gpu_frame_grey, self.blur_radius, stream)
 
         # Mike: Download frame from the GPU as there is no GPU implementation of the CSRT tracker
-        frame = gpu_frame.download()
-        frame_grey = gpu_frame_grey.download()
-
-        video_tracker.add_image(video_tracker.FRAME_TYPE_ORIGINAL, frame)
-        video_tracker.add_image(video_tracker.FRAME_TYPE_GREY, frame_grey)
+        frame_result = FrameResult(frame_count, gpu_frame.download(), gpu_frame_grey.download())
+        self.count_warmup_frame(frame_result)
+        frame_result.gpu_frame_grey = gpu_frame_grey
+        if frame_grey_sharp is not None:
+            frame_result.frame_grey_sharp = frame_grey_sharp
+        return frame_result
 
-        if self.detection_mode == 'background_subtraction':
+    def detect_frame(self, frame_result, stream):
 
-            bboxes, frame_masked_background = self.bboxes_from_bg_subtraction(gpu_frame_grey, stream)
-            video_tracker.add_image(video_tracker.FRAME_TYPE_MASKED_BACKGROUND, frame_masked_background)
+        gpu_frame_grey = frame_result.gpu_frame_grey
 
-            if frame_count < 5:
-                # Need 5 frames to get the background subtractor initialised
-                return bboxes
-
-            if self.dense_optical_flow is not None:
-                #self.perform_optical_flow_task(video_tracker, frame_count, gpu_frame_grey, self.resize_dimension[0], self.resize_dimension[1], stream)
-                optical_flow_thread = Thread(target=self.perform_optical_flow_task, 
-                args=(video_tracker, frame_count, gpu_frame_grey, self.resize_dimension[0], self.resize_dimension[1], stream))
-                optical_flow_thread.start()
-                worker_threads.append(optical_flow_thread)
-
-        # Mike: Allow frame delivery to settle before we start tracking
-        if math.floor((time.time() - self.start)) > self.tracker_wait_seconds_threshold:
-            video_tracker.update_trackers(bboxes, frame)
+        if self.detection_mode == 'background_subtraction':
 
-        frame_count + 1
+            frame_result.bboxes, frame_result.frame_masked_background = self.bboxes_from_bg_subtraction(gpu_frame_grey, stream)
+            self.suppress_detections(frame_result)
 
-        # Mike: Wait for worker threads to join before publishing events as their results might be required
-        for worker_thread in worker_threads:
-            worker_thread.join()
+            if frame_result.warmup_frame_count >= 5 and self.dense_optical_flow is not None:
+                self.start_optical_flow_task(frame_result, gpu_frame_grey, stream)
 
-        return bboxes
+        return frame_result
 
-    def perform_optical_flow_task(self, video_tracker, frame_count, gpu_frame_grey, frame_w, frame_h, stream):
+    def perform_optical_flow_task(self, frame_result, gpu_frame_grey, frame_w, frame_h, stream):
         gpu_dof_frame = self.process_optical_flow(gpu_frame_grey, frame_w, frame_h, stream)
-        dof_frame = gpu_dof_frame.download()
-        video_tracker.add_image(video_tracker.FRAME_TYPE_OPTICAL_FLOW, dof_frame)
+        frame_result.frame_optical_flow = gpu_dof_frame.download()
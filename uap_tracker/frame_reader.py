@@ -0,0 +1,237 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import cv2
+import time
+import queue
+from collections import deque
+from threading import Thread, Event, Condition
+
+#####################################################################################################################################
+# Base class for various frame reader implementations. The idea here is that the controllers no longer call capture.read() directly #
+# but pull frames from a reader, this allows us to decode frames on a seperate thread so that decoding overlaps frame processing.   #
+# Each read returns the frame along with its index and media timestamp (in milliseconds).                                           #
+#####################################################################################################################################
+class FrameReader():
+
+    def __init__(self, capture, start_index=0):
+        self.capture = capture
+        self.frame_index = start_index
+        self.reset_stats()
+
+    # Static factory select method to determine what frame reader implementation to use for a video file
+    @staticmethod
+    def Select(settings, capture, start_index=0):
+        if settings['frame_prefetch_enabled']:
+            return FrameReader.Prefetch(capture, settings['frame_prefetch_depth'], start_index)
+
+        return FrameReader.Synchronous(capture, start_index)
+
+    # Static factory select method to determine what frame reader implementation to use for a live camera
+    @staticmethod
+    def SelectCamera(settings, camera):
+        if settings['camera_capture_mode'] == 'latest':
+            return FrameReader.Latest(camera, settings['camera_capture_ring_size'])
+
+        return FrameReader.Synchronous(camera)
+
+    @staticmethod
+    def Synchronous(capture, start_index=0):
+        return SynchronousFrameReader(capture, start_index)
+
+    @staticmethod
+    def Prefetch(capture, depth, start_index=0):
+        return PrefetchFrameReader(capture, depth, start_index)
+
+    @staticmethod
+    def Latest(capture, ring_size):
+        return LatestFrameReader(capture, ring_size)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.stop()
+
+    # start reading frames
+    def start(self):
+        pass
+
+    # stop reading frames and clean up after yourself
+    def stop(self):
+        pass
+
+    # read the next frame, returns a tuple of (success, frame, frame_index, frame_timestamp)
+    def read(self):
+        pass
+
+    # reset the dropped frame and capture to process latency statistics
+    def reset_stats(self):
+        self.dropped_frames = 0
+        self.latency_count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    # returns the statistics gathered since the last reset as a tuple of (dropped_frames, avg_latency, max_latency)
+    def get_stats(self):
+        avg_latency = 0.0
+        if self.latency_count > 0:
+            avg_latency = self.latency_total / self.latency_count
+        return self.dropped_frames, avg_latency, self.latency_max
+
+    # decode a single frame from the capture device, this is shared by all the reader implementations
+    def _decode(self):
+        success, frame = self.capture.read()
+        frame_index = self.frame_index
+        frame_timestamp = self.capture.get(cv2.CAP_PROP_POS_MSEC)
+        if success:
+            self.frame_index += 1
+        return success, frame, frame_index, frame_timestamp
+
+###############################################################################################
+# The synchronous reader decodes frames on the calling thread, this is the original behaviour #
+###############################################################################################
+class SynchronousFrameReader(FrameReader):
+
+    def __init__(self, capture, start_index=0):
+        super().__init__(capture, start_index)
+
+    def read(self):
+        return self._decode()
+
+##############################################################################################################################
+# The prefetch reader decodes frames ahead of time on its own thread into a bounded queue. The depth of the queue determines #
+# how far ahead of the processing thread the decoder is allowed to run, and as such bounds the memory that is used.          #
+##############################################################################################################################
+class PrefetchFrameReader(FrameReader):
+
+    def __init__(self, capture, depth, start_index=0):
+        super().__init__(capture, start_index)
+        self.depth = max(1, depth)
+        self.frames = queue.Queue(maxsize=self.depth)
+        self.stopped = Event()
+        self.decode_thread = None
+        self.finished = False
+
+    def start(self):
+        self.stopped.clear()
+        self.decode_thread = Thread(target=self._decode_task, daemon=True)
+        self.decode_thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        # drain the queue so that a decode thread blocked on a full queue can see that it has been stopped
+        while self.decode_thread is not None and self.decode_thread.is_alive():
+            try:
+                self.frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.decode_thread = None
+
+    def read(self):
+        if self.finished:
+            return False, None, self.frame_index, 0
+        result = self.frames.get()
+        if not result[0]:
+            # The decode thread has reached the end of the stream
+            self.finished = True
+        return result
+
+    # private function to serve as the thread's entry point
+    def _decode_task(self):
+        result = None
+        try:
+            while not self.stopped.is_set():
+                result = self._decode()
+                self._put(result)
+                if not result[0]:
+                    break
+        finally:
+            # If the decode raised then the reading thread still has to find out that there are no more frames, otherwise it
+            # would wait for the next one forever
+            if result is None or result[0]:
+                self._put((False, None, self.frame_index, 0))
+
+    # private function to put a result on the queue, giving up when the reader is stopped
+    def _put(self, result):
+        while not self.stopped.is_set():
+            try:
+                self.frames.put(result, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+###################################################################################################################################
+# The latest frame reader is used for live cameras where low latency is more important than processing every frame. A grabber    #
+# thread continuously drains the camera and only keeps the newest frames in a small ring, older frames are dropped (and counted). #
+# The processing thread always gets the most recent frame that the camera has delivered.                                          #
+###################################################################################################################################
+class LatestFrameReader(FrameReader):
+
+    def __init__(self, capture, ring_size=1, read_timeout=1.0):
+        super().__init__(capture)
+        self.ring_size = max(1, ring_size)
+        self.read_timeout = read_timeout
+        self.frames = deque(maxlen=self.ring_size)
+        self.frames_available = Condition()
+        self.stopped = Event()
+        self.grab_thread = None
+
+    def start(self):
+        self.stopped.clear()
+        self.grab_thread = Thread(target=self._grab_task, daemon=True)
+        self.grab_thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        with self.frames_available:
+            self.frames_available.notify_all()
+        if self.grab_thread is not None:
+            self.grab_thread.join()
+            self.grab_thread = None
+
+    # returns the newest frame in the ring, the older frames in the ring are dropped (and counted) as they are behind it. If no
+    # frame arrives within the read timeout then the read is unsuccessful so that the controller still gets the opportunity to
+    # check its iteration period
+    def read(self):
+        with self.frames_available:
+            if not self.frames_available.wait_for(lambda: len(self.frames) > 0 or self.stopped.is_set(), timeout=self.read_timeout):
+                return False, None, self.frame_index, 0
+            if len(self.frames) == 0:
+                return False, None, self.frame_index, 0
+            frame, frame_index, frame_timestamp, capture_time = self.frames.pop()
+            self.dropped_frames += len(self.frames)
+            self.frames.clear()
+
+        latency = time.perf_counter() - capture_time
+        self.latency_count += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+        return True, frame, frame_index, frame_timestamp
+
+    # private function to serve as the thread's entry point
+    def _grab_task(self):
+        while not self.stopped.is_set():
+            success, frame, frame_index, frame_timestamp = self._decode()
+            if not success:
+                # Give the camera a moment to recover rather than spinning
+                time.sleep(0.01)
+                continue
+
+            with self.frames_available:
+                if len(self.frames) == self.frames.maxlen:
+                    # the oldest frame is about to be pushed out of the ring without ever being processed
+                    self.dropped_frames += 1
+                self.frames.append((frame, frame_index, frame_timestamp, time.perf_counter()))
+                self.frames_available.notify()
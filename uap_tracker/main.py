@@ -19,7 +19,9 @@ import getopt
 import sys
 import cv2
 import shutil
+import multiprocessing
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from uap_tracker.event_publisher import EventPublisher
 from uap_tracker.visualizer import NoOpVisualiser, SimpleVisualiser, TwoByTwoVisualiser, TwoByTwoOpticalFlowVisualiser
@@ -28,10 +30,11 @@ from uap_tracker.tracker_listener_stf import TrackerListenerMOTStf, TrackerListe
 from uap_tracker.video_frame_dumpers import OriginalFrameVideoWriter, GreyFrameVideoWriter, OpticalFlowFrameVideoWriter, AnnotatedFrameVideoWriter, MaskedBackgroundFrameVideoWriter
 from config import settings
 from uap_tracker.video_tracker import VideoTracker
-from uap_tracker.camera import get_camera
+from uap_tracker.camera import get_camera, get_video_capture
 from uap_tracker.video_formatter import VideoFormatter
 import uap_tracker.utils as utils
 from uap_tracker.app_settings import AppSettings
+from uap_tracker.video_sharding import process_file_sharded
 
 
 USAGE = 'python uap_tracker/main.py\n settings are handled in the setttings.toml file or overridden in the ENV'
@@ -167,8 +170,11 @@ def main(argv):
 
     # If a video was passed in on commandline, run that and ignore other sources
     if cmdline_filename:
-        process_file(controller, visualizer, cmdline_filename,
-                     output_dir, app_settings)
+        if app_settings['shard_count'] > 1:
+            process_file_sharded(cmdline_filename, output_dir, app_settings)
+        else:
+            process_file(controller, visualizer, cmdline_filename,
+                         output_dir, app_settings)
     else:
         if controller == VideoController:
 
@@ -176,15 +182,25 @@ def main(argv):
             if not os.path.isdir(processed_dir):
                 os.mkdir(processed_dir)
 
-            sorted_files = os.listdir(settings.input_dir)
+            sorted_files = [filename for filename in os.listdir(settings.input_dir) if os.path.isfile(os.path.join(settings.input_dir, filename))]
             sorted_files.sort()
 
-            for filename in sorted_files:
-                full_path = os.path.join(settings.input_dir, filename)
-                process_file(controller, visualizer, full_path,
-                             output_dir, app_settings)
-                processed_path = os.path.join(processed_dir, filename)
-                shutil.move(full_path,processed_path)
+            if app_settings['shard_count'] > 1:
+                # each file is split into shards which are processed in parallel, so files are processed one at a time
+                for filename in sorted_files:
+                    full_path = os.path.join(settings.input_dir, filename)
+                    if process_file_sharded(full_path, output_dir, app_settings):
+                        processed_path = os.path.join(processed_dir, filename)
+                        shutil.move(full_path, processed_path)
+            elif app_settings['batch_workers'] > 1:
+                _process_files_parallel(controller, sorted_files, processed_dir, output_dir, app_settings)
+            else:
+                for filename in sorted_files:
+                    full_path = os.path.join(settings.input_dir, filename)
+                    process_file(controller, visualizer, full_path,
+                                 output_dir, app_settings)
+                    processed_path = os.path.join(processed_dir, filename)
+                    shutil.move(full_path,processed_path)
 
         elif controller == CameraController:
             camera = get_camera(app_settings)
@@ -212,7 +228,7 @@ def process_file(controller, visualizer, full_path, output_dir, app_settings):
     source_filename = Path(full_path).stem
 
     print(f"Opening {full_path}")
-    video = cv2.VideoCapture(full_path)
+    video = get_video_capture(app_settings, full_path)
     # Exit if video not opened.
     if not video.isOpened():
         print("Could not open video")
@@ -227,6 +243,51 @@ def process_file(controller, visualizer, full_path, output_dir, app_settings):
         _run(controller, [listener], visualizer, video, app_settings)
 
 
+# Fan the input files out to a pool of worker processes. Each worker has its own video tracker and frame processor and writes
+# to its own output sub directory, so output ids can't collide. Only this (parent) process moves files to the processed
+# directory, and only once the worker has finished processing that file successfully.
+def _process_files_parallel(controller, sorted_files, processed_dir, output_dir, app_settings):
+    batch_workers = app_settings['batch_workers']
+    print(f"Processing {len(sorted_files)} files using {batch_workers} worker processes")
+
+    # spawn rather than fork, OpenCV and its thread pools do not survive a fork very well
+    with ProcessPoolExecutor(max_workers=batch_workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_batch_worker, initargs=(app_settings,)) as executor:
+        futures = {}
+        for filename in sorted_files:
+            full_path = os.path.join(settings.input_dir, filename)
+            future = executor.submit(_process_file_task, controller, full_path, output_dir, app_settings)
+            futures[future] = filename
+
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                future.result()
+            except BaseException as e:
+                print(f"Failed to process {filename}, it will be left in {settings.input_dir}: {e!r}")
+                continue
+            full_path = os.path.join(settings.input_dir, filename)
+            processed_path = os.path.join(processed_dir, filename)
+            shutil.move(full_path, processed_path)
+            print(f"Moved {filename} to {processed_dir}")
+
+
+# Initialiser for each of the batch worker processes
+def _init_batch_worker(app_settings):
+    # We already have a process per core, so stop each worker from also spinning up a thread per core in OpenCV
+    cv2.setNumThreads(app_settings['batch_worker_cv_threads'])
+
+
+# Entry point for a batch worker process, there is no visualizer in batch mode as we can't display from multiple processes
+def _process_file_task(controller, full_path, output_dir, app_settings):
+    # use the full file name, including the extension, so that 'a.mp4' and 'a.mkv' don't end up sharing a directory
+    file_output_dir = os.path.join(output_dir, os.path.basename(full_path))
+    if not os.path.isdir(file_output_dir):
+        os.mkdir(file_output_dir)
+    process_file(controller, None, full_path, file_output_dir, app_settings)
+    return full_path
+
+
 def _run(controller, listeners, visualizer, media, app_settings):
 
     events = EventPublisher()
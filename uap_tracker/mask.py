@@ -78,6 +78,9 @@ class Mask():
     def OverlayInverseGpu(settings):
         return OverlayInverseMaskGpu(settings)
 
+    # Most masks write a new frame, the frame processor hands those a preallocated dst buffer to write it into
+    writes_new_frame = True
+
     def __init__(self):
         pass
     
@@ -85,16 +88,35 @@ class Mask():
     def initialise(self, init_frame):
         pass
 
-    # Method to apply the mask to the frame
-    def apply(self, frame):
+    # Method to get the shape of the frame that apply returns for a frame of the given shape
+    def get_output_shape(self, frame_shape):
+        return frame_shape
+
+    # Method to get the region of interest (x1,y1,w,h) of the frame, everything outside of it is masked out. None if the
+    # whole frame is of interest
+    def get_roi(self):
+        return None
+
+    # Method to apply the mask to the frame, dst is an optional preallocated buffer of the output shape (see get_output_shape)
+    def apply(self, frame, stream=None, dst=None):
         pass
 
+# Utility function to apply a mask using bitwise and, a dst buffer is cleared first as bitwise_and leaves the pixels outside the mask
+# untouched
+def _bitwise_and_mask(frame, mask, dst=None):
+    if dst is None:
+        return cv2.bitwise_and(frame, frame, mask=mask)
+    dst.fill(0)
+    return cv2.bitwise_and(frame, frame, dst=dst, mask=mask)
+
 #############################################################################################################
 # NoOp masking implementations. It's just a passthrough and does not perform any sort of masking operation. #
 # Its the fallback option and supports both CPU and GPU architectures.                                      #
 #############################################################################################################
 class NoOpMask(Mask):
 
+    writes_new_frame = False
+
     def __init__(self, settings):
         pass
 
@@ -104,7 +126,7 @@ class NoOpMask(Mask):
         self.width = self.shape[1]
         return (self.width, self.height)
 
-    def apply(self, frame, stream=None):
+    def apply(self, frame, stream=None, dst=None):
         return frame
 
 ##################################################################################################################
@@ -116,7 +138,10 @@ class FisheyeMask(Mask):
 
     def __init__(self, settings):
         self.mask_pct = settings['mask_pct']
+        self.cache_dir = settings['mask_cache_dir']
 
+    # The mask never changes so it is compiled once here. We work out the region that the frame gets clipped to up front
+    # so that only that region needs to be masked, there is no point in masking the parts of the frame that get clipped anyway
     def initialise(self, init_frame):
         self.mask_height = (100 - self.mask_pct) / 100.0
         self.mask_radius = self.mask_height / 2.0
@@ -125,20 +150,49 @@ class FisheyeMask(Mask):
         self.width = self.shape[1]
         self.new_width = int(self.mask_height * self.width)
         self.new_height = int(self.mask_height * self.height)
-        return (self.new_width, self.new_height)
-
-    def apply(self, frame, stream=None):
-        mask = np.zeros(self.shape, dtype=np.uint8)
-        cv2.circle(mask, (int(self.width / 2), int(self.height / 2)), int(min(self.height, self.width) * self.mask_radius), 255, -1)
-        masked_frame = cv2.bitwise_and(frame, frame, mask=mask)
-        clipped_masked_frame = utils.clip_at_center(
-            masked_frame,
+        self.top, self.bottom, self.left, self.right = utils.clip_at_center_bounds(
             (int(self.width / 2), int(self.height / 2)),
             self.width,
             self.height,
             self.new_width,
             self.new_height)
-        return clipped_masked_frame
+        self.roi_mask = self._load_roi_mask()
+        return (self.new_width, self.new_height)
+
+    def get_output_shape(self, frame_shape):
+        return self.roi_mask.shape + tuple(frame_shape[2:])
+
+    def apply(self, frame, stream=None, dst=None):
+        frame_roi = frame[self.top:self.bottom, self.left:self.right]
+        return _bitwise_and_mask(frame_roi, self.roi_mask, dst)
+
+    # draw the circle shaped mask and clip it to the region of interest
+    def _compile_roi_mask(self):
+        mask = np.zeros(self.shape, dtype=np.uint8)
+        cv2.circle(mask, (int(self.width / 2), int(self.height / 2)), int(min(self.height, self.width) * self.mask_radius), 255, -1)
+        return np.ascontiguousarray(mask[self.top:self.bottom, self.left:self.right])
+
+    # load the compiled mask from the cache directory if it has been compiled before for this resolution and mask_pct,
+    # otherwise compile it and store it in the cache directory
+    def _load_roi_mask(self):
+        if self.cache_dir is None:
+            return self._compile_roi_mask()
+
+        filename = os.path.join(self.cache_dir, f'fisheye-{self.width}x{self.height}-{self.mask_pct}.png')
+        if os.path.exists(filename):
+            roi_mask = cv2.imread(filename, cv2.IMREAD_GRAYSCALE)
+            if roi_mask is not None and roi_mask.shape == (self.bottom - self.top, self.right - self.left):
+                return roi_mask
+            print(f'Ignoring cached fisheye mask {filename}, it does not match the frame.')
+
+        roi_mask = self._compile_roi_mask()
+        # Batch workers and shards can all be compiling the same mask at the same time, each of them writes its own temporary
+        # file and moves it into place so that nobody ever reads a half written mask
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_filename = os.path.join(self.cache_dir, f'fisheye-{self.width}x{self.height}-{self.mask_pct}-{os.getpid()}.tmp.png')
+        cv2.imwrite(temp_filename, roi_mask)
+        os.replace(temp_filename, filename)
+        return roi_mask
 
 ##################################################################################################################
 # Overlay masking implementations. It provides the ability to overlay an image over the frame, black is the mask #
@@ -165,11 +219,39 @@ class OverlayMask(Mask):
             print(f'Resizing mask to fit init frame, for better performance ensure your mask matches the same size as your frame h:{self.height}, w:{self.width}.')
             self.overlay_image = cv2.resize(self.overlay_image, (self.width, self.height))
 
+        # Compile the mask, work out the tight bounding rectangle of the area that is not masked out so that we only have
+        # to mask (and process) that part of the frame. The effective mask is binary so that we can use a plain bitwise_and
+        # which writes all the pixels of the region rather than having to clear it first.
+        effective_mask = cv2.compare(self._get_effective_overlay(), 0, cv2.CMP_GT)
+        self.roi = cv2.boundingRect(effective_mask)
+        if self.roi[2] == 0 or self.roi[3] == 0:
+            print(f'The overlay mask masks out the whole frame, is this correct?')
+            self.roi = (0, 0, self.width, self.height)
+        x, y, w, h = self.roi
+        self.roi_mask_grey = np.ascontiguousarray(effective_mask[y:y+h, x:x+w])
+        self.roi_mask = self.roi_mask_grey
+        if len(init_frame.shape) > 2:
+            self.roi_mask = cv2.merge([self.roi_mask_grey] * init_frame.shape[2])
+        print(f'Overlay mask region of interest x, y, w, h = {self.roi}')
+
         return (self.width, self.height)
 
-    def apply(self, frame, stream=None):
-        masked_frame = cv2.bitwise_and(frame, frame, mask=self.overlay_image)
-        return masked_frame
+    # the overlay that is applied to the frame, non-zero pixels are kept
+    def _get_effective_overlay(self):
+        return self.overlay_image
+
+    def get_roi(self):
+        return self.roi
+
+    def apply(self, frame, stream=None, dst=None):
+        if dst is None:
+            dst = np.empty_like(frame)
+        x, y, w, h = self.roi
+        utils.zero_outside_roi(dst, self.roi)
+        # The luma plane of a decoded frame (see ffmpeg_capture) is masked on its own
+        roi_mask = self.roi_mask if len(frame.shape) == len(self.roi_mask.shape) else self.roi_mask_grey
+        cv2.bitwise_and(frame[y:y+h, x:x+w], roi_mask, dst=dst[y:y+h, x:x+w])
+        return dst
 
 ##################################################################################################################
 # Overlay masking implementations. It provides the ability to overlay an image over the frame, black is the mask #
@@ -221,10 +303,9 @@ class OverlayInverseMask(OverlayMask):
     def __init__(self, settings):
         super().__init__(settings)
 
-    def apply(self, frame, stream=None):
-        mask = cv2.bitwise_not(self.overlay_image)
-        masked_frame = cv2.bitwise_and(frame, frame, mask=mask)
-        return masked_frame
+    # The inverse never changes so it is compiled into the mask once rather than worked out for every frame
+    def _get_effective_overlay(self):
+        return cv2.bitwise_not(self.overlay_image)
 
 #######################################################################################################
 # Overlay inverse masking implementations. It provides the ability to overlay an image over the frame,#
@@ -21,7 +21,8 @@ def non_max_suppression_fast(boxes, overlapThresh):
   # compute the area of the bounding boxes and sort the bounding
   # boxes by the score/probability of the bounding box
   area = (x2 - x1 + 1) * (y2 - y1 + 1)
-  idxs = np.argsort(scores)[::-1]
+  # the highest score is picked from the end of the list, so the indexes are sorted ascending
+  idxs = np.argsort(scores)
 
   # keep looping while some indexes still remain in the indexes
   # list
@@ -52,4 +53,72 @@ def non_max_suppression_fast(boxes, overlapThresh):
       np.where(overlap > overlapThresh)[0])))
 
   # return only the bounding boxes that were picked
-  return boxes[pick]
\ No newline at end of file
+  return boxes[pick]
+
+# The number of bboxes whose overlaps are worked out in one go, this keeps the memory in check on noisy frames with a lot of
+# detections
+BLOCK_SIZE = 256
+
+# Vectorised non max suppression of the detections of a frame. The bboxes are in the format (x1,y1,w,h) and they are scored
+# by their area, the bigger the blob the more likely it is the target rather than a fragment of it. A bbox is suppressed when
+# more than the overlap threshold of it is covered by a bigger bbox. The overlaps of all the pairs are worked out in one go
+# rather than one bbox at a time (the "fast NMS" variant), so a suppressed bbox still suppresses the smaller ones it covers.
+# With merge the bboxes that are kept grow to cover the bboxes they suppressed. At most max_detections of the biggest bboxes
+# are returned, 0 for no limit.
+# Returns an (n, 4) array of the bboxes that are left, from big to small
+def suppress_detections(bboxes, overlap_threshold, max_detections=0, merge=False):
+  boxes = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+  areas = (boxes[:, 2] + 1) * (boxes[:, 3] + 1)
+  order = np.argsort(-areas, kind='stable')
+  boxes = boxes[order]
+  areas = areas[order]
+
+  if len(boxes) > 1:
+    suppressed = np.zeros(len(boxes), bool)
+    for start in range(0, len(boxes), BLOCK_SIZE):
+      suppressed |= _suppressing(boxes, areas, start, overlap_threshold).any(axis=0)
+    keep = ~suppressed
+
+    if merge:
+      boxes = _merge_suppressed(boxes, areas, keep, overlap_threshold)
+
+    boxes = boxes[keep]
+
+  if max_detections > 0:
+    boxes = boxes[:max_detections]
+
+  return boxes
+
+# private function to work out which of the block of bboxes from start suppress which of the (smaller) bboxes, the bboxes
+# are sorted from big to small. Returns a (block, n) matrix
+def _suppressing(boxes, areas, start, overlap_threshold):
+  block = boxes[start:start + BLOCK_SIZE]
+  x_left = np.maximum(block[:, np.newaxis, 0], boxes[np.newaxis, :, 0])
+  y_top = np.maximum(block[:, np.newaxis, 1], boxes[np.newaxis, :, 1])
+  x_right = np.minimum((block[:, 0] + block[:, 2])[:, np.newaxis], (boxes[:, 0] + boxes[:, 2])[np.newaxis, :])
+  y_bottom = np.minimum((block[:, 1] + block[:, 3])[:, np.newaxis], (boxes[:, 1] + boxes[:, 3])[np.newaxis, :])
+  intersection_area = np.clip(x_right - x_left + 1, 0, None) * np.clip(y_bottom - y_top + 1, 0, None)
+
+  # only a bigger bbox suppresses a smaller one, i.e. the ones further down the list
+  overlap = intersection_area / areas[np.newaxis, :]
+  return np.triu(overlap > overlap_threshold, k=start + 1)
+
+# private function to grow each bbox that is kept to cover the bboxes it suppressed, a bbox suppressed by more than one
+# bbox is merged into the biggest of them
+def _merge_suppressed(boxes, areas, keep, overlap_threshold):
+  owners = np.full(len(boxes), -1)
+  for start in range(0, len(boxes), BLOCK_SIZE):
+    suppressing = _suppressing(boxes, areas, start, overlap_threshold) & keep[start:start + BLOCK_SIZE, np.newaxis]
+    found = (owners < 0) & suppressing.any(axis=0)
+    owners[found] = start + np.argmax(suppressing[:, found], axis=0)
+
+  merged = np.flatnonzero(owners >= 0)
+  x1 = boxes[:, 0].copy()
+  y1 = boxes[:, 1].copy()
+  x2 = boxes[:, 0] + boxes[:, 2]
+  y2 = boxes[:, 1] + boxes[:, 3]
+  np.minimum.at(x1, owners[merged], x1[merged])
+  np.minimum.at(y1, owners[merged], y1[merged])
+  np.maximum.at(x2, owners[merged], x2[merged])
+  np.maximum.at(y2, owners[merged], y2[merged])
+  return np.stack([x1, y1, x2 - x1, y2 - y1], axis=1)
@@ -0,0 +1,53 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+#####################################################################################################################################
+# Uniform grid spatial index over the bboxes of the live trackers, used to answer "is this bbox already being tracked" without    #
+# walking all of the trackers. The frame is divided into square cells and each tracker is added to all the cells its bbox covers, #
+# a lookup only checks the trackers in the cells that the bbox covers. The index is rebuilt once per frame after the trackers have #
+# been updated, the trackers that are created after that are added to it as they are created.                                      #
+# A bbox is being tracked when it overlaps (or touches) the bbox of a tracker, the same as utils.is_bbox_being_tracked.            #
+#####################################################################################################################################
+class SpatialGrid():
+
+    def __init__(self, cell_size):
+        self.cell_size = max(1, int(cell_size))
+        self.cells = {}
+
+    # rebuild the index from the current bboxes of the trackers
+    def rebuild(self, trackers):
+        self.cells = {}
+        for tracker in trackers:
+            self.insert(tracker)
+
+    # add a tracker to the cells its current bbox covers
+    def insert(self, tracker):
+        bbox = tracker.get_bbox()
+        for cell in self._cells(bbox):
+            self.cells.setdefault(cell, []).append(bbox)
+
+    # returns true if the bbox overlaps the bbox of any of the trackers in the index
+    def is_bbox_being_tracked(self, bbox):
+        x, y, w, h = bbox
+        for cell in self._cells(bbox):
+            for tx, ty, tw, th in self.cells.get(cell, ()):
+                # The corners are inclusive, just like utils.bbox_overlap
+                if max(x, tx) <= min(x + w, tx + tw) and max(y, ty) <= min(y + h, ty + th):
+                    return True
+        return False
+
+    # private generator of the (column, row) cells that the bbox covers
+    def _cells(self, bbox):
+        x, y, w, h = bbox
+        for column in range(int(x // self.cell_size), int((x + w) // self.cell_size) + 1):
+            for row in range(int(y // self.cell_size), int((y + h) // self.cell_size) + 1):
+                yield (column, row)
@@ -17,22 +17,28 @@ import shutil
 from datetime import datetime
 import uap_tracker.utils as utils
 import time
+from threading import Lock
 
 class STFWriter():
 
+    # These counters are per process, listeners run on their own threads so access is guarded by a lock. When running
+    # in batch mode each worker process writes into its own output directory so ids can't collide accross processes.
     video_count = 0
     training_count = 0
+    _count_lock = Lock()
 
     @classmethod
     def _get_and_increment_video_count(cls):
-        ret = cls.video_count
-        cls.video_count += 1
+        with cls._count_lock:
+            ret = cls.video_count
+            cls.video_count += 1
         return ret
 
     @classmethod
     def _get_and_increment_training_count(cls):
-        ret = cls.training_count
-        cls.training_count += 1
+        with cls._count_lock:
+            ret = cls.training_count
+            cls.training_count += 1
         return ret
 
     def __init__(self,
@@ -0,0 +1,187 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import os
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import uap_tracker.association as association
+from uap_tracker.background_subtractor_factory import BackgroundSubtractorFactory
+from uap_tracker.blob_detector import BlobDetector
+
+#####################################################################################################################################
+# Tiled background subtraction. The (region of interest of the) grey frame is split into a grid of tiles that overlap a little,   #
+# each tile has its own background subtractor and blob detector and the tiles are processed in parallel on a pool of threads. The #
+# core of a tile is the part of the grid it owns, the overlap gives the blob detector a bit of context around the core. A tile    #
+# only reports the blobs with a centre in its core, the blobs that are cut in half by a seam are merged back together again.      #
+# Tiles that are completely masked out are skipped altogether.                                                                    #
+#                                                                                                                                 #
+# NOTE: The OpenCV background subtractors release the GIL so the tiles really run in parallel, for the pybgs and pysky360         #
+# algorithms this depends on whether their python bindings release the GIL.                                                       #
+#####################################################################################################################################
+class TiledBackgroundSubtraction():
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.columns = settings['bg_tile_columns']
+        self.rows = settings['bg_tile_rows']
+        self.overlap = settings['bg_tile_overlap']
+        self.workers = settings['bg_tile_workers']
+        if self.workers < 1:
+            self.workers = os.cpu_count()
+        self.max_distance = settings['min_centre_point_distance_between_bboxes']
+        self.tiles = []
+        self.executor = None
+
+    # Initialiser to lay out the tiles over a region of the given size (w, h). The visibility frame is the result of masking a
+    # white frame, where it's zero the frame is masked out. The init frame is used to initialise the blob detectors.
+    def initialise(self, size, visibility, init_frame):
+        w, h = size
+        xs = [round(i * w / self.columns) for i in range(self.columns + 1)]
+        ys = [round(i * h / self.rows) for i in range(self.rows + 1)]
+
+        self.tiles = []
+        for row in range(self.rows):
+            for column in range(self.columns):
+                core = (xs[column], ys[row], xs[column + 1], ys[row + 1])
+                bounds = (max(0, core[0] - self.overlap), max(0, core[1] - self.overlap), min(w, core[2] + self.overlap), min(h, core[3] + self.overlap))
+                masked_out = not visibility[bounds[1]:bounds[3], bounds[0]:bounds[2]].any()
+                self.tiles.append(BackgroundSubtractionTile(self.settings, core, bounds, masked_out, init_frame))
+
+        skipped = sum(tile.masked_out for tile in self.tiles)
+        print(f"  background subtraction tiles: {self.columns} x {self.rows}, overlap: {self.overlap}, masked out: {skipped}")
+
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bg_tile')
+
+    # clean up after yourself
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    # Run the background subtraction and blob detection on all the tiles, the masked background is written into dst. The offset
+    # (x, y) of the region is added to the bboxes. Returns the bboxes.
+    def detect(self, frame_grey, dst, offset=(0, 0)):
+        futures = [self.executor.submit(tile.detect, frame_grey, dst, offset) for tile in self.tiles]
+
+        bboxes = []
+        seam_bboxes = []
+        for future in futures:
+            tile_bboxes, tile_seam_bboxes = future.result()
+            bboxes.extend(tile_bboxes)
+            seam_bboxes.append(tile_seam_bboxes)
+
+        return bboxes + self._merge_seam_bboxes(seam_bboxes)
+
+    # returns the background subtractors of the tiles that are not masked out
+    def get_background_subtractors(self):
+        return [tile.background_subtractor for tile in self.tiles if not tile.masked_out]
+
+    # Feed a frame to the background subtractors of the tiles without detecting anything, this is used to replay the frame
+    # history of a stored background model
+    def replay(self, frame_grey):
+        for tile in self.tiles:
+            if not tile.masked_out:
+                tile.background_subtractor.apply(np.ascontiguousarray(tile.crop(frame_grey)))
+
+    # private function to merge the bboxes that cross a seam with the bboxes of the other tiles that they overlap with and are
+    # close to. A blob that is bigger than the overlap and cut in half by a seam will be detected by both tiles, each of them only
+    # seeing its own half.
+    def _merge_seam_bboxes(self, seam_bboxes):
+        merged = []
+        owners = []
+        for tile_index, tile_bboxes in enumerate(seam_bboxes):
+            for bbox in tile_bboxes:
+                merged.append(bbox)
+                owners.append({tile_index})
+
+        merging = True
+        while merging and len(merged) > 1:
+            merging = False
+            boxes = association.as_bbox_array(merged)
+            overlaps = association.intersects_matrix(boxes, boxes) & (association.centre_distance_matrix(boxes, boxes) < self.max_distance)
+            for i in range(len(merged)):
+                for j in range(i + 1, len(merged)):
+                    if overlaps[i, j] and owners[i].isdisjoint(owners[j]):
+                        merged[i] = _union_bbox(merged[i], merged[j])
+                        owners[i] |= owners[j]
+                        del merged[j]
+                        del owners[j]
+                        merging = True
+                        break
+                if merging:
+                    break
+
+        return merged
+
+##############################################################################################################################
+# A single tile of the tiled background subtraction. The core and bounds are (x1, y1, x2, y2) within the region being tiled. #
+##############################################################################################################################
+class BackgroundSubtractionTile():
+
+    def __init__(self, settings, core, bounds, masked_out, init_frame):
+        self.core = core
+        self.bounds = bounds
+        self.masked_out = masked_out
+        self.background_subtractor = None
+        self.blob_detector = None
+        if not masked_out:
+            self.background_subtractor = BackgroundSubtractorFactory.Select(settings)
+            self.blob_detector = BlobDetector.Select(settings)
+            self.blob_detector.initialise(init_frame)
+
+    # Run the background subtraction and blob detection on this tile, the masked background of the core is written into dst.
+    # Returns a tuple of (bboxes, seam_bboxes) where the seam bboxes are the ones that cross the edge of the core.
+    def detect(self, frame_grey, dst, offset):
+        cx1, cy1, cx2, cy2 = self.core
+        if self.masked_out:
+            dst[cy1:cy2, cx1:cx2] = 0
+            return [], []
+
+        bx1, by1, bx2, by2 = self.bounds
+        frame_grey_tile = self.crop(frame_grey)
+        # Only the OpenCV background subtractors deal with the region of a frame, the others need it contiguous
+        if not isinstance(self.background_subtractor, cv2.BackgroundSubtractor):
+            frame_grey_tile = np.ascontiguousarray(frame_grey_tile)
+
+        foreground_mask = self.background_subtractor.apply(frame_grey_tile)
+        frame_masked_background = cv2.bitwise_and(frame_grey_tile, frame_grey_tile, mask=foreground_mask)
+        dst[cy1:cy2, cx1:cx2] = frame_masked_background[cy1-by1:cy2-by1, cx1-bx1:cx2-bx1]
+
+        bboxes = []
+        seam_bboxes = []
+        for bbox in association.as_bbox_tuples(self.blob_detector.detect(frame_masked_background, (bx1 + offset[0], by1 + offset[1]))):
+            x, y, w, h = bbox
+            centre_x = int(x + (w / 2)) - offset[0]
+            centre_y = int(y + (h / 2)) - offset[1]
+            if not (cx1 <= centre_x < cx2 and cy1 <= centre_y < cy2):
+                # this blob belongs to the neighbouring tile
+                continue
+            if x - offset[0] < cx1 or y - offset[1] < cy1 or x + w - offset[0] > cx2 or y + h - offset[1] > cy2:
+                seam_bboxes.append(bbox)
+            else:
+                bboxes.append(bbox)
+
+        return bboxes, seam_bboxes
+
+    # returns the bounds of this tile within the frame
+    def crop(self, frame):
+        bx1, by1, bx2, by2 = self.bounds
+        return frame[by1:by2, bx1:bx2]
+
+# Utility function to get the union of two bboxes in the format (x1,y1,w,h)
+def _union_bbox(bbox1, bbox2):
+    x1 = min(bbox1[0], bbox2[0])
+    y1 = min(bbox1[1], bbox2[1])
+    x2 = max(bbox1[0] + bbox1[2], bbox2[0] + bbox2[2])
+    y2 = max(bbox1[1] + bbox1[3], bbox2[1] + bbox2[3])
+    return (x1, y1, x2 - x1, y2 - y1)
@@ -0,0 +1,70 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import numpy as np
+
+####################################################################################################################################
+# Compact history of a track, a preallocated NumPy ring buffer of rows of a fixed width (a bbox, a point, a point and a colour).  #
+# Only the latest max length rows are kept so the memory of a track is bounded no matter how long it lives. Optionally every     #
+# Nth row is also kept in a long term history of its own max length, which covers N times as much of the life of the track.     #
+####################################################################################################################################
+class TrackHistory():
+
+    __slots__ = ('rows', 'appended', 'decimation', 'long_term')
+
+    def __init__(self, max_length, width, dtype=np.int32, decimation=0, long_term_max_length=0):
+        self.rows = np.empty((max(1, max_length), width), dtype)
+        # The total number of rows ever appended, unlike the length of the history this keeps on going up
+        self.appended = 0
+        self.decimation = decimation
+        self.long_term = None
+        if decimation > 0 and long_term_max_length > 0:
+            # The first column of the long term history is the sequence number of the row
+            self.long_term = TrackHistory(long_term_max_length, width + 1, dtype)
+
+    # Static factory method to create a track history with the max lengths of the settings
+    @staticmethod
+    def Create(settings, width, dtype=np.int32):
+        return TrackHistory(settings['track_history_max_length'], width, dtype, settings['track_history_decimation'], settings['track_history_long_term_max_length'])
+
+    def __len__(self):
+        return min(self.appended, len(self.rows))
+
+    # append a row to the history, overwriting the oldest row once the history is full
+    def append(self, row):
+        self.rows[self.appended % len(self.rows)] = row
+        if self.long_term is not None and self.appended % self.decimation == 0:
+            self.long_term.append((self.appended,) + tuple(row))
+        self.appended += 1
+
+    # returns the latest row as a tuple
+    def last(self):
+        if self.appended == 0:
+            raise IndexError('The track history is empty')
+        return tuple(self.rows[(self.appended - 1) % len(self.rows)].tolist())
+
+    # returns the rows of the history in the order they were appended as a contiguous array
+    def values(self):
+        if self.appended <= len(self.rows):
+            return self.rows[:self.appended]
+        start = self.appended % len(self.rows)
+        return np.concatenate((self.rows[start:], self.rows[:start]))
+
+    # returns the rows of the long term history that are older than the rows of the history, followed by the rows of the
+    # history. Without a long term history these are just the rows of the history.
+    def long_term_values(self):
+        values = self.values()
+        if self.long_term is None:
+            return values
+        long_term_values = self.long_term.values()
+        older = long_term_values[long_term_values[:, 0] < self.appended - len(self), 1:]
+        return np.concatenate((older, values))
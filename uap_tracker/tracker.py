@@ -16,6 +16,7 @@ import math
 import uap_tracker.utils as utils
 from uap_tracker.tracker_factory import TrackerFactory
 from uap_tracker.track_prediction import TrackPrediction
+from uap_tracker.track_history import TrackHistory
 
 ########################################################################################################################
 # This class represents a single target/blob that has been identified on the frame and is currently being tracked      #
@@ -30,14 +31,27 @@ class Tracker():
     ACTIVE_TARGET = 2
     LOST_TARGET = 3
 
+    # There can be a lot of trackers alive at once, slots keep them small
+    __slots__ = ('settings', 'id', 'provisional_tracker', 'crop_padding', 'crop_window', 'cv2_tracker', 'bboxes', 'stationary_track_counter',
+                 'active_track_counter', 'tracking_state', 'bbox_to_check', 'start', 'second_counter', 'tracked_boxes', 'center_points',
+                 'track_predictor', 'predictor_center_points')
+
     def __init__(self, settings, id, frame, bbox):
 
         self.settings = settings
         self.id = id
-        self.cv2_tracker = TrackerFactory.create(settings)
+        # With tiered tracking a provisionary target is followed by a cheap tracker, most of them never become an active
+        # target and get scavenged. Only once it becomes an active target does it get the configured (expensive) tracker.
+        self.provisional_tracker = settings['tracker_tiered_enabled']
+        # With tracker crops the cv2 tracker only ever sees a padded crop of the frame around the target, the crop window
+        # is (x1,y1,w,h) in the frame and the bboxes are translated between the frame and the crop
+        self.crop_padding = settings['tracker_crop_padding'] if settings['tracker_crop_enabled'] else None
+        self.crop_window = None
         # print(f"--> bbox:{bbox}")
-        self.cv2_tracker.init(frame, bbox)
-        self.bboxes = [bbox]
+        self._init_cv2_tracker(frame, bbox)
+        # The histories of the track are ring buffers, only the latest track_history_max_length entries are kept
+        self.bboxes = TrackHistory.Create(settings, 4)
+        self.bboxes.append(bbox)
         self.stationary_track_counter = 0
         self.active_track_counter = 0
         self.tracking_state = Tracker.PROVISIONARY_TARGET
@@ -45,15 +59,18 @@ class Tracker():
         
         self.start = time.time()
         self.second_counter = 0
-        self.tracked_boxes = [bbox]
-        self.center_points = []        
+        # Validation only ever looks at the latest of the bboxes that are tracked once a second
+        self.tracked_boxes = TrackHistory(2, 4)
+        self.tracked_boxes.append(bbox)
+        # A center point is stored along with the colour of the bbox at the time (x, y, b, g, r)
+        self.center_points = TrackHistory.Create(settings, 5)
 
         self.track_predictor = TrackPrediction(id, bbox)
-        self.predictor_center_points = []
+        self.predictor_center_points = TrackHistory.Create(settings, 2)
 
     # function to get the latest bbox in the format (x1,y1,w,h)
     def get_bbox(self):
-        return self.bboxes[-1]
+        return self.bboxes.last()
 
     # function to determine the center of the the bbox being tracked
     def get_center(self):
@@ -64,15 +81,18 @@ class Tracker():
     # function to update the bbox on the frame, also if validation is enabled then some addtional logic is executed to determine 
     # if the target is still a avlid target
     def update(self, frame):
-        ok, bbox = self.cv2_tracker.update(frame)
+        ok, bbox = self._update_cv2_tracker(frame)
         # print(f'updating tracker {self.id}, result: {ok}')
         if ok:
+            if self.provisional_tracker:
+                # The legacy trackers report the bbox in floats
+                bbox = tuple(int(v) for v in bbox)
             self.bboxes.append(bbox)
 
             # Mike: If we have track plotting enabled, then we need to store the center points of the bboxes so that we can plo the 
             # entire track on the frame including the colour
             if self.settings['track_plotting_enabled']:
-                self.center_points.append((self.get_center(), self.bbox_color()))
+                self.center_points.append(self.get_center() + self.bbox_color())
 
             if self.settings['track_prediction_enabled']:
                 self.predictor_center_points.append(self.track_predictor.update(bbox))
@@ -106,7 +126,7 @@ class Tracker():
 
                     if validate_bbox:
                         # print(f'5 X --> tracker {self.id}, total length: {len(self.bboxes)}')
-                        previous_tracked_bbox = self.tracked_boxes[-1]
+                        previous_tracked_bbox = self.tracked_boxes.last()
                         if utils.bbox_overlap(self.bbox_to_check, previous_tracked_bbox) > 0:
                             # Mike: this bounding box has remained pretty static, its now closer to getting scavenged
                             self.stationary_track_counter += 1
@@ -130,21 +150,85 @@ class Tracker():
                         self.bbox_to_check = bbox
                         self.active_track_counter = 0
 
+            if self.provisional_tracker and self.tracking_state == Tracker.ACTIVE_TARGET:
+                self._promote(frame, bbox)
+            elif self.crop_window is not None and self._is_near_crop_edge(frame, bbox):
+                # The target is about to run out of its crop, the cv2 tracker starts over on a crop centred on it
+                self._init_cv2_tracker(frame, bbox)
+
         return ok, bbox
 
+    # private function to swap the cheap tracker of a provisionary target for the configured tracker once it's an active target,
+    # the new tracker is initialised on the latest frame
+    def _promote(self, frame, bbox):
+        self.provisional_tracker = False
+        self._init_cv2_tracker(frame, bbox)
+
+    # private function to create the cv2 tracker (the cheap one for a provisionary target with tiered tracking) and initialise
+    # it on the frame, or on a new crop of the frame around the bbox with tracker crops
+    def _init_cv2_tracker(self, frame, bbox):
+        if self.provisional_tracker:
+            self.cv2_tracker = TrackerFactory.create(self.settings, self.settings['tracker_provisional_type'])
+        else:
+            self.cv2_tracker = TrackerFactory.create(self.settings)
+
+        if self.crop_padding is not None:
+            self.crop_window = self._get_crop_window(frame, bbox)
+            x1, y1, w, h = self.crop_window
+            frame = frame[y1:y1+h, x1:x1+w]
+            bbox = (bbox[0] - x1, bbox[1] - y1, bbox[2], bbox[3])
+
+        self.cv2_tracker.init(frame, bbox)
+
+    # private function to update the cv2 tracker, with tracker crops it's updated on the crop and the bbox is translated back
+    # into the frame
+    def _update_cv2_tracker(self, frame):
+        if self.crop_window is None:
+            return self.cv2_tracker.update(frame)
+
+        x1, y1, w, h = self.crop_window
+        ok, bbox = self.cv2_tracker.update(frame[y1:y1+h, x1:x1+w])
+        if ok:
+            bbox = (bbox[0] + x1, bbox[1] + y1, bbox[2], bbox[3])
+        return ok, bbox
+
+    # private function to work out the crop window around the bbox, the bbox is padded by crop padding times its size on each
+    # side and the window is clipped to the frame
+    def _get_crop_window(self, frame, bbox):
+        frame_h, frame_w = frame.shape[:2]
+        x, y, w, h = (int(v) for v in bbox)
+        padding_x = math.ceil(w * self.crop_padding)
+        padding_y = math.ceil(h * self.crop_padding)
+        x1 = min(max(0, x - padding_x), frame_w - 1)
+        y1 = min(max(0, y - padding_y), frame_h - 1)
+        x2 = max(min(frame_w, x + w + padding_x), x1 + 1)
+        y2 = max(min(frame_h, y + h + padding_y), y1 + 1)
+        return (x1, y1, x2 - x1, y2 - y1)
+
+    # private function to determine if the bbox has come closer than its own size to an edge of the crop window, edges that
+    # are the edge of the frame don't count as the window can't move any further that way
+    def _is_near_crop_edge(self, frame, bbox):
+        frame_h, frame_w = frame.shape[:2]
+        x, y, w, h = bbox
+        x1, y1, crop_w, crop_h = self.crop_window
+        x2 = x1 + crop_w
+        y2 = y1 + crop_h
+        return ((x1 > 0 and x - x1 < w) or (x2 < frame_w and x2 - (x + w) < w) or
+                (y1 > 0 and y - y1 < h) or (y2 < frame_h and y2 - (y + h) < h))
+
     # Utility function to determine is this tracker has an active target
     def is_tracking(self):
         return self.tracking_state == Tracker.ACTIVE_TARGET
 
     # Utility function to determine if there is overlap between existing and new bboxes
     def does_bbx_overlap(self, bbox):
-        overlap = utils.bbox_overlap(self.bboxes[-1], bbox)
+        overlap = utils.bbox_overlap(self.get_bbox(), bbox)
         # print(f'checking tracking overlap {overlap} for {self.id}')
         return overlap > 0
     
     # Utility function to determine if there is containment of new bboxes
     def is_bbx_contained(self, bbox):
-        return utils.bbox1_contain_bbox2(self.bboxes[-1], bbox)
+        return utils.bbox1_contain_bbox2(self.get_bbox(), bbox)
 
     # Utility function to provide the colour of the bbox on the frame
     def bbox_color(self):
@@ -0,0 +1,495 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import os
+import math
+import numpy as np
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+from uap_tracker.tracker import Tracker
+from uap_tracker.track_history import TrackHistory
+
+###################################################################################################################################
+# Base class for the various tracker engine implementations. The tracker engine is responsible for creating trackers and running #
+# their updates, the video tracker then deals with matching detections and the lifecycle of the trackers.                        #
+###################################################################################################################################
+class TrackerEngine():
+
+    def __init__(self, settings):
+        self.settings = settings
+        # Whether the trackers need the colour frame, if not the frame processor doesn't have to work it out
+        self.needs_frame = True
+
+    # Static factory select method to determine what tracker engine implementation to use
+    @staticmethod
+    def Select(settings):
+        # The kalman tracker type doesn't run an OpenCV tracker per target, so it comes with an engine of its own
+        if settings['tracker_type'] == 'KALMAN':
+            return TrackerEngine.Kalman(settings)
+
+        tracker_engine = settings['tracker_engine']
+
+        if tracker_engine == 'process':
+            return TrackerEngine.Process(settings)
+
+        return TrackerEngine.Thread(settings)
+
+    @staticmethod
+    def Thread(settings):
+        return ThreadTrackerEngine(settings)
+
+    @staticmethod
+    def Process(settings):
+        return ProcessTrackerEngine(settings)
+
+    @staticmethod
+    def Kalman(settings):
+        return KalmanTrackerEngine(settings)
+
+    # create a tracker for the bbox and run its first update, returns the tracker
+    def create_tracker(self, id, frame, bbox):
+        pass
+
+    # update all the trackers, returns a list of (ok, bbox) in the same order as the trackers
+    def update_trackers(self, trackers, frame):
+        pass
+
+    # hand the engine the detections that were matched with the trackers on this frame as a list of (tracker, bbox) tuples,
+    # only the engines that follow the targets with the detections make use of them
+    def apply_detections(self, track_associations):
+        pass
+
+    # notify the engine that these trackers are no longer live
+    def remove_trackers(self, trackers):
+        pass
+
+    # clean up after yourself
+    def close(self):
+        pass
+
+###########################################################################################################################
+# The thread engine runs the tracker updates in batches on a long lived pool of threads. With only one or two trackers   #
+# alive it's quicker to just update them on the calling thread. Otherwise the trackers are split into one batch per      #
+# worker so that we pay the hand-off cost once per worker rather than once per tracker.                                  #
+###########################################################################################################################
+class ThreadTrackerEngine(TrackerEngine):
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.executor = None
+        self.workers = settings['tracker_update_workers']
+        if self.workers < 1:
+            self.workers = os.cpu_count()
+
+    def create_tracker(self, id, frame, bbox):
+        tracker = Tracker(self.settings, id, frame, bbox)
+        tracker.update(frame)
+        return tracker
+
+    def update_trackers(self, trackers, frame):
+        tracker_count = len(trackers)
+        if tracker_count <= self.settings['tracker_serial_threshold']:
+            return [tracker.update(frame) for tracker in trackers]
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tracker_update')
+
+        batch_size = math.ceil(tracker_count / self.workers)
+        futures = []
+        for i in range(0, tracker_count, batch_size):
+            futures.append(self.executor.submit(self.update_tracker_batch_task, trackers[i:i + batch_size], frame))
+
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    # Mike: Identifying tasks that can be called on seperate threads to try and speed this sucker up
+    def update_tracker_batch_task(self, trackers, frame):
+        return [tracker.update(frame) for tracker in trackers]
+
+###################################################################################################################################
+# The process engine gets around the GIL by running the trackers in worker processes, each tracker is pinned to a worker by its  #
+# id. The frame is published once per frame into a shared memory buffer that all the workers map, the workers then only return  #
+# the bbox and state of each tracker. The main process keeps a RemoteTracker per tracker which mirrors the state of the worker   #
+# side tracker so that listeners and visualizers work just as they would with a local tracker.                                   #
+###################################################################################################################################
+class ProcessTrackerEngine(TrackerEngine):
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.worker_count = settings['tracker_process_workers']
+        if self.worker_count < 1:
+            self.worker_count = os.cpu_count()
+        self.workers = []
+        self.connections = []
+        self.shared_frame = None
+        self.shared_memory = None
+        self.published_frame = None
+
+    def create_tracker(self, id, frame, bbox):
+        self._publish(frame)
+        connection = self.connections[id % self.worker_count]
+        connection.send(('create', id, bbox))
+        tracker = RemoteTracker(self.settings, id, bbox)
+        tracker.apply_result(connection.recv()[0])
+        return tracker
+
+    def update_trackers(self, trackers, frame):
+        # The frame buffers are reused from a pool so a frame can't be recognised by its identity accross frames, this is
+        # called once per frame before any trackers are created so it always publishes
+        self.published_frame = None
+
+        # Without any trackers there is no need to publish the frame, it might not even have been worked out
+        if len(trackers) == 0:
+            return []
+
+        self._publish(frame)
+
+        batches = [[] for i in range(self.worker_count)]
+        for tracker in trackers:
+            batches[tracker.id % self.worker_count].append(tracker)
+
+        # send all the requests before waiting for any of the replies so that the workers run in parallel
+        for connection, batch in zip(self.connections, batches):
+            if len(batch) > 0:
+                connection.send(('update', [tracker.id for tracker in batch]))
+
+        results = {}
+        for connection, batch in zip(self.connections, batches):
+            if len(batch) > 0:
+                for tracker, result in zip(batch, connection.recv()):
+                    results[tracker.id] = tracker.apply_result(result)
+
+        return [results[tracker.id] for tracker in trackers]
+
+    def remove_trackers(self, trackers):
+        batches = [[] for i in range(self.worker_count)]
+        for tracker in trackers:
+            batches[tracker.id % self.worker_count].append(tracker.id)
+        for connection, batch in zip(self.connections, batches):
+            if len(batch) > 0:
+                connection.send(('remove', batch))
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(('stop',))
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.connections = []
+        self._release_shared_memory()
+        self.published_frame = None
+
+    # start the worker processes if they have not been started yet
+    def _start(self):
+        # spawn rather than fork, OpenCV and its thread pools do not survive a fork very well
+        context = multiprocessing.get_context('spawn')
+        for i in range(self.worker_count):
+            parent_connection, child_connection = context.Pipe()
+            worker = context.Process(target=_tracker_worker_main, args=(child_connection, self.settings), daemon=True)
+            worker.start()
+            self.workers.append(worker)
+            self.connections.append(parent_connection)
+
+    # publish the frame into shared memory, this only happens once per frame no matter how many trackers there are
+    def _publish(self, frame):
+        if frame is self.published_frame:
+            return
+
+        if len(self.workers) == 0:
+            self._start()
+
+        if self.shared_frame is None or self.shared_frame.shape != frame.shape or self.shared_frame.dtype != frame.dtype:
+            self._release_shared_memory()
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+            self.shared_frame = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shared_memory.buf)
+            for connection in self.connections:
+                connection.send(('attach', self.shared_memory.name, frame.shape, frame.dtype.str))
+
+        np.copyto(self.shared_frame, frame)
+        self.published_frame = frame
+
+    def _release_shared_memory(self):
+        if self.shared_memory is not None:
+            self.shared_frame = None
+            self.shared_memory.close()
+            self.shared_memory.unlink()
+            self.shared_memory = None
+
+########################################################################################################################
+# Main process side proxy of a tracker that lives in a worker process of the process engine. It mirrors the state of  #
+# the worker side tracker, it is a Tracker so that all the utility functions used by listeners and visualizers work.   #
+########################################################################################################################
+class RemoteTracker(Tracker):
+
+    __slots__ = ()
+
+    def __init__(self, settings, id, bbox):
+        # Deliberately not calling Tracker.__init__, the cv2 tracker and validation live in the worker process
+        self.settings = settings
+        self.id = id
+        self.bboxes = TrackHistory.Create(settings, 4)
+        self.bboxes.append(bbox)
+        self.tracking_state = Tracker.PROVISIONARY_TARGET
+        self.center_points = TrackHistory.Create(settings, 5)
+        self.predictor_center_points = TrackHistory.Create(settings, 2)
+
+    def update(self, frame):
+        raise Exception(f"Remote tracker {self.id} can only be updated through the process tracker engine")
+
+    # apply the result of an update in the worker process, returns (ok, bbox)
+    def apply_result(self, result):
+        ok, bbox, tracking_state, tracked_bbox, center_point, predictor_center_point = result
+        if tracked_bbox is not None:
+            self.bboxes.append(tracked_bbox)
+        self.tracking_state = tracking_state
+        if center_point is not None:
+            self.center_points.append(center_point)
+        if predictor_center_point is not None:
+            self.predictor_center_points.append(predictor_center_point)
+        return ok, bbox
+
+# Entry point for a tracker worker process of the process engine
+def _tracker_worker_main(connection, settings):
+    trackers = {}
+    frame = None
+    frame_memory = None
+
+    while True:
+        message = connection.recv()
+        command = message[0]
+
+        if command == 'attach':
+            _, name, shape, dtype = message
+            if frame_memory is not None:
+                frame = None
+                frame_memory.close()
+            # The main process owns the shared memory and unlinks it, the workers share its resource tracker
+            frame_memory = shared_memory.SharedMemory(name=name)
+            frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=frame_memory.buf)
+
+        elif command == 'create':
+            _, id, bbox = message
+            tracker = Tracker(settings, id, frame, bbox)
+            trackers[id] = tracker
+            connection.send([_update_tracker(tracker, frame)])
+
+        elif command == 'update':
+            _, ids = message
+            connection.send([_update_tracker(trackers[id], frame) for id in ids])
+
+        elif command == 'remove':
+            _, ids = message
+            for id in ids:
+                trackers.pop(id, None)
+
+        elif command == 'stop':
+            break
+
+    if frame_memory is not None:
+        frame = None
+        frame_memory.close()
+
+# Update a tracker in a worker process and return the result along with the state that the main process needs to mirror
+def _update_tracker(tracker, frame):
+    # The histories are ring buffers, once they are full their length stops going up but the appended count doesn't
+    bbox_count = tracker.bboxes.appended
+    center_point_count = tracker.center_points.appended
+    predictor_center_point_count = tracker.predictor_center_points.appended
+
+    ok, bbox = tracker.update(frame)
+
+    tracked_bbox = None
+    if tracker.bboxes.appended > bbox_count:
+        tracked_bbox = tracker.bboxes.last()
+    center_point = None
+    if tracker.center_points.appended > center_point_count:
+        center_point = tracker.center_points.last()
+    predictor_center_point = None
+    if tracker.predictor_center_points.appended > predictor_center_point_count:
+        predictor_center_point = tracker.predictor_center_points.last()
+
+    return ok, bbox, tracker.tracking_state, tracked_bbox, center_point, predictor_center_point
+
+####################################################################################################################################
+# The kalman engine doesn't run an OpenCV tracker per target, it follows the targets with the detections of each frame instead.  #
+# All the tracks are kept in NumPy arrays, the state of all of them is predicted in one go by a constant velocity Kalman filter, #
+# the video tracker then associates the detections with the predicted bboxes and the tracks that were matched with a detection  #
+# are corrected with it, again in one go. A target is provisionary until it has been detected on kalman_min_hits frames (and    #
+# with track validation has moved out of the bbox it was first detected in), it's lost while it coasts on its prediction and     #
+# the track fails after kalman_max_misses frames in a row without a detection. The colour frame isn't needed at all.             #
+# The tracks are KalmanTrackers so that listeners and visualizers work just as they would with any other tracker.                #
+####################################################################################################################################
+class KalmanTrackerEngine(TrackerEngine):
+
+    # The state of a track is its centre and velocity (x, y, vx, vy) of which only the centre is measured, the size of a
+    # track is the size of the last detection it was matched with
+    TRANSITION = np.array([[1, 0, 1, 0], [0, 1, 0, 1], [0, 0, 1, 0], [0, 0, 0, 1]], np.float64)
+    INITIAL_VELOCITY_VARIANCE = 100.0
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.needs_frame = False
+        self.process_noise = np.eye(4) * settings['kalman_process_noise']
+        self.measurement_noise = np.eye(2) * settings['kalman_measurement_noise']
+        self.initial_covariance = np.diag([settings['kalman_measurement_noise']] * 2 + [KalmanTrackerEngine.INITIAL_VELOCITY_VARIANCE] * 2)
+        self.min_hits = settings['kalman_min_hits']
+        self.max_misses = settings['kalman_max_misses']
+        self.trackers = []
+        self.states = np.empty((0, 4))
+        self.covariances = np.empty((0, 4, 4))
+        self.sizes = np.empty((0, 2))
+        self.origins = np.empty((0, 4))
+        self.hits = np.empty(0, np.int32)
+        self.misses = np.empty(0, np.int32)
+        self.active = np.empty(0, bool)
+
+    def create_tracker(self, id, frame, bbox):
+        x, y, w, h = bbox
+        tracker = KalmanTracker(self.settings, id, bbox, len(self.trackers))
+        self.trackers.append(tracker)
+        self.states = np.append(self.states, [[x + w / 2, y + h / 2, 0, 0]], axis=0)
+        self.covariances = np.append(self.covariances, [self.initial_covariance], axis=0)
+        self.sizes = np.append(self.sizes, [[w, h]], axis=0)
+        self.origins = np.append(self.origins, [bbox], axis=0)
+        self.hits = np.append(self.hits, np.int32(1))
+        self.misses = np.append(self.misses, np.int32(0))
+        self.active = np.append(self.active, False)
+        return tracker
+
+    def update_trackers(self, trackers, frame):
+        if len(self.trackers) == 0:
+            return []
+
+        # Predict all the tracks in one go, x = Fx and P = FPF' + Q
+        self.states = self.states @ KalmanTrackerEngine.TRANSITION.T
+        self.covariances = KalmanTrackerEngine.TRANSITION @ self.covariances @ KalmanTrackerEngine.TRANSITION.T + self.process_noise
+
+        # A track that has gone without a detection for too many frames in a row has failed
+        results = {}
+        for tracker, bbox, ok in zip(self.trackers, self._bboxes().tolist(), (self.misses < self.max_misses).tolist()):
+            results[tracker.id] = (ok, tuple(bbox))
+        return [results[tracker.id] for tracker in trackers]
+
+    def apply_detections(self, track_associations):
+        if len(self.trackers) == 0:
+            return
+
+        # With the legacy association a tracker can be matched with several detections, the last one wins
+        detections = {tracker.index: bbox for tracker, bbox in track_associations}
+        matched = np.zeros(len(self.trackers), bool)
+        if len(detections) > 0:
+            rows = np.fromiter(detections.keys(), np.intp, len(detections))
+            boxes = np.array(list(detections.values()), np.float64)
+            centres = boxes[:, 0:2] + boxes[:, 2:4] / 2
+
+            # Correct the matched tracks in one go, K = PH'(HPH' + R)^-1, x = x + K(z - Hx) and P = P - KHP
+            covariances = self.covariances[rows]
+            gains = covariances[:, :, 0:2] @ np.linalg.inv(covariances[:, 0:2, 0:2] + self.measurement_noise)
+            self.states[rows] += (gains @ (centres - self.states[rows, 0:2])[:, :, np.newaxis])[:, :, 0]
+            self.covariances[rows] = covariances - gains @ covariances[:, 0:2, :]
+            self.sizes[rows] = boxes[:, 2:4]
+            matched[rows] = True
+
+        self.hits[matched] += 1
+        self.misses[matched] = 0
+        self.misses[~matched] += 1
+
+        bboxes = self._bboxes()
+
+        # A target becomes active once it has been detected often enough, with track validation it also has to have moved
+        # out of the bbox it was first detected in. Once active it stays active, it's only lost while it is coasting.
+        confirmed = self.hits >= self.min_hits
+        if self.settings['enable_track_validation']:
+            confirmed &= _disjoint(bboxes, self.origins)
+        self.active |= confirmed
+        tracking_states = np.where(self.active, np.where(matched, Tracker.ACTIVE_TARGET, Tracker.LOST_TARGET), Tracker.PROVISIONARY_TARGET)
+
+        predictor_center_points = [None] * len(self.trackers)
+        if self.settings['track_prediction_enabled']:
+            predictor_center_points = [tuple(point) for point in (self.states[:, 0:2] + self.states[:, 2:4]).astype(int).tolist()]
+
+        for tracker, bbox, tracking_state, predictor_center_point in zip(self.trackers, bboxes.tolist(), tracking_states.tolist(), predictor_center_points):
+            tracker.apply_state(tuple(bbox), tracking_state, predictor_center_point)
+
+    def remove_trackers(self, trackers):
+        if len(trackers) == 0:
+            return
+
+        ids = {tracker.id for tracker in trackers}
+        keep = np.array([tracker.id not in ids for tracker in self.trackers], bool)
+        self.trackers = [tracker for tracker in self.trackers if tracker.id not in ids]
+        for index, tracker in enumerate(self.trackers):
+            tracker.index = index
+
+        self.states = self.states[keep]
+        self.covariances = self.covariances[keep]
+        self.sizes = self.sizes[keep]
+        self.origins = self.origins[keep]
+        self.hits = self.hits[keep]
+        self.misses = self.misses[keep]
+        self.active = self.active[keep]
+
+    def close(self):
+        self.remove_trackers(self.trackers)
+
+    # private function to get the current bboxes of all the tracks as an (n, 4) int array of (x1,y1,w,h)
+    def _bboxes(self):
+        corners = np.rint(self.states[:, 0:2] - self.sizes / 2)
+        return np.concatenate((corners, self.sizes), axis=1).astype(int)
+
+##########################################################################################################################
+# A track of the kalman engine, its state lives in the arrays of the engine. It is a Tracker so that all the utility    #
+# functions used by listeners and visualizers work.                                                                      #
+##########################################################################################################################
+class KalmanTracker(Tracker):
+
+    __slots__ = ('index',)
+
+    def __init__(self, settings, id, bbox, index):
+        # Deliberately not calling Tracker.__init__, there is no cv2 tracker and the validation is done by the engine
+        self.settings = settings
+        self.id = id
+        self.index = index
+        self.bboxes = TrackHistory.Create(settings, 4)
+        self.bboxes.append(bbox)
+        self.tracking_state = Tracker.PROVISIONARY_TARGET
+        self.center_points = TrackHistory.Create(settings, 5)
+        self.predictor_center_points = TrackHistory.Create(settings, 2)
+
+    def update(self, frame):
+        raise Exception(f"Kalman tracker {self.id} can only be updated through the kalman tracker engine")
+
+    # apply the state of the track once the detections of the frame have been applied to it
+    def apply_state(self, bbox, tracking_state, predictor_center_point):
+        self.bboxes.append(bbox)
+        self.tracking_state = tracking_state
+        if self.settings['track_plotting_enabled']:
+            self.center_points.append(self.get_center() + self.bbox_color())
+        if predictor_center_point is not None:
+            self.predictor_center_points.append(predictor_center_point)
+
+# Utility function to determine which pairs of bboxes in two (n, 4) arrays of (x1,y1,w,h) do not overlap at all, the corners
+# are inclusive just like utils.bbox_overlap
+def _disjoint(boxes1, boxes2):
+    x_left = np.maximum(boxes1[:, 0], boxes2[:, 0])
+    y_top = np.maximum(boxes1[:, 1], boxes2[:, 1])
+    x_right = np.minimum(boxes1[:, 0] + boxes1[:, 2], boxes2[:, 0] + boxes2[:, 2])
+    y_bottom = np.minimum(boxes1[:, 1] + boxes1[:, 3], boxes2[:, 1] + boxes2[:, 3])
+    return (x_right < x_left) | (y_bottom < y_top)
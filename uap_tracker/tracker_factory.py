@@ -19,11 +19,13 @@ import uap_tracker.utils as utils
 ###############################################################################################################
 class TrackerFactory():
 
-    # Static factory select method to determine what tracker algorithm to use
+    # Static factory select method to determine what tracker algorithm to use, this is the configured tracker type unless
+    # another one is asked for
     @staticmethod
-    def create(settings):
+    def create(settings, tracker_type=None):
 
-        tracker_type = settings['tracker_type']
+        if tracker_type is None:
+            tracker_type = settings['tracker_type']
 
         tracker = None
         (major_ver, minor_ver, subminor_ver) = utils.get_cv_version()
@@ -41,7 +43,11 @@ class TrackerFactory():
         if tracker_type == 'GOTURN':
             tracker = cv2.TrackerGOTURN_create()
         if tracker_type == 'MOSSE':
-            tracker = cv2.TrackerMOSSE_create()
+            # From OpenCV 4.5.1 MOSSE only lives on in the legacy module
+            if hasattr(cv2, 'TrackerMOSSE_create'):
+                tracker = cv2.TrackerMOSSE_create()
+            else:
+                tracker = cv2.legacy.TrackerMOSSE_create()
         if tracker_type == "CSRT":
             if int(major_ver) >= 4 and int(minor_ver) >= 5 and int(subminor_ver) > 0:
                 param_handler = cv2.TrackerCSRT_Params()
@@ -46,9 +46,12 @@ def get_writer(output_filename, width, height):
 
 # Utility function to convert jey points in to a bounding box
 # The bounding box is used for track validation (if enabled) and will be displayed by the visualiser
-# as it tracks a point of interest (blob) on the frame
-def kp_to_bbox(kp):
+# as it tracks a point of interest (blob) on the frame, the offset is added to the key point when it was detected in a
+# region of a larger frame
+def kp_to_bbox(kp, offset=(0, 0)):
     (x, y) = kp.pt
+    x += offset[0]
+    y += offset[1]
     size = kp.size
     scale = 6
     #print(f'kp_to_bbox x, y:{(x, y)}, size:{size}, scale:{scale}, new size:{scale * size}')
@@ -164,22 +167,18 @@ def add_bbox_to_image(bbox, frame, tracker_id, font_size, color, settings):
 
 # Utility function to standardise the drawing of the track center point onto a frame
 def add_track_points_to_image(tracker, frame):
-    bbox = get_sized_bbox_from_tracker(tracker)
-    center_points = tracker.center_points
-    for center_point in center_points:
-        if not is_point_contained_in_bbox(bbox, center_point[0]):
-            cv2.circle(frame, center_point[0], radius=1, color=center_point[1], thickness=2)
+    center_points = tracker.center_points.long_term_values()
+    outside = ~are_points_contained_in_bbox(get_sized_bbox_from_tracker(tracker), center_points)
+    for x, y, b, g, r in center_points[outside].tolist():
+        cv2.circle(frame, (x, y), radius=1, color=(b, g, r), thickness=2)
 
-# Utility function to standardise the drawing of the track line onto a frame
+# Utility function to standardise the drawing of the track line onto a frame, a segment is drawn in the colour of the point
+# it starts from
 def add_track_line_to_image(tracker, frame):
-    bbox = get_sized_bbox_from_tracker(tracker)
-    center_points = tracker.center_points
-    previous_point = None
-    for center_point in center_points:
-        if not previous_point is None:
-            if not is_point_contained_in_bbox(bbox, center_point[0]):
-                cv2.line(frame, previous_point[0], center_point[0], previous_point[1], thickness=2)
-        previous_point = center_point
+    center_points = tracker.center_points.long_term_values()
+    outside = ~are_points_contained_in_bbox(get_sized_bbox_from_tracker(tracker), center_points[1:])
+    for (x1, y1, b, g, r), (x2, y2) in zip(center_points[:-1][outside].tolist(), center_points[1:, 0:2][outside].tolist()):
+        cv2.line(frame, (x1, y1), (x2, y2), (b, g, r), thickness=2)
 
 # Utility function to standardise the drawing of bbox center point onto a frame
 def add_center_point_to_image(tracker, frame):
@@ -188,7 +187,10 @@ def add_center_point_to_image(tracker, frame):
 
 # Utility function to standardise the drawing of prediction point onto a frame
 def add_predicted_point_to_image(tracker, frame):
-    predicted_center_point = tracker.predictor_center_points[-1]
+    # A target that was only just detected has not been predicted yet
+    if len(tracker.predictor_center_points) == 0:
+        return
+    predicted_center_point = tracker.predictor_center_points.last()
     cv2.circle(frame, predicted_center_point, radius=1, color=(255, 0, 0), thickness=2)
 
 # Utility function to deletrmine if a point overlaps a bouding box
@@ -197,6 +199,11 @@ def is_point_contained_in_bbox(bbox, point):
     x0, y0 = point
     return x <= x0 < x + w and y <= y0 < y + h
 
+# Utility function to determine which of the points in an array of rows that start with (x, y) overlap a bounding box
+def are_points_contained_in_bbox(bbox, points):
+    x, y, w, h = bbox
+    return (x <= points[:, 0]) & (points[:, 0] < x + w) & (y <= points[:, 1]) & (points[:, 1] < y + h)
+
 # Utility function to get the sized bbox from tracker for display
 def get_sized_bbox_from_tracker(tracker):
     return get_sized_bbox(tracker.get_bbox(), tracker.settings)
@@ -226,6 +233,11 @@ def zoom_and_clip(frame, center, zoom_level):
 # Utility function to clip out the center part of a frame. This is mainly used by the fish-eye mask
 # to remove masked ("black") parts of the frame
 def clip_at_center(frame, center, width, height, new_width, new_height):
+    top, bottom, left, right = clip_at_center_bounds(center, width, height, new_width, new_height)
+    return frame[top:bottom, left:right]
+
+# Utility function to work out the bounds (top, bottom, left, right) of the region that clip_at_center clips to
+def clip_at_center_bounds(center, width, height, new_width, new_height):
     x, y = center
     half_width = int(new_width/2)
     half_height = int(new_height/2)
@@ -238,7 +250,15 @@ def clip_at_center(frame, center, width, height, new_width, new_height):
     bottom = min(y+half_height, height)
     bottom = max(new_height, bottom)
 
-    return frame[top:bottom, left:right]
+    return top, bottom, left, right
+
+# Utility function to clear the parts of a frame outside of the region of interest (x1,y1,w,h)
+def zero_outside_roi(frame, roi):
+    x, y, w, h = roi
+    frame[:y] = 0
+    frame[y+h:] = 0
+    frame[y:y+h, :x] = 0
+    frame[y:y+h, x+w:] = 0
 
 # Utility function to combine 4 frames into a single frame, mainly used by a visualiser
 def combine_frames_2x2(top_left, top_right, bottom_left, bottom_right):
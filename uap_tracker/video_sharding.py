@@ -0,0 +1,203 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import os
+import cv2
+import json
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import uap_tracker.utils as utils
+from uap_tracker.event_publisher import EventPublisher
+from uap_tracker.video_tracker import VideoTracker
+from uap_tracker.controller import ShardVideoController
+from uap_tracker.camera import get_video_capture
+
+#######################################################################################################################
+# Sharded processing of a single (long) video file. The video is split into time shards which are processed in        #
+# parallel by worker processes. Each shard starts a warm-up window before its real range so that the background        #
+# subtractor and trackers have settled, tracks that cross a shard boundary are then merged by overlap / centre distance #
+# and the results are written out as a single STF annotations file.                                                    #
+#                                                                                                                      #
+# NOTE: Track validation is based on wall clock time, so a sharded run will be very close to but not always identical  #
+# to a serial run.                                                                                                     #
+#######################################################################################################################
+
+##########################################################################################################
+# Listener that records the bboxes of all the active trackers per frame so that they can be stitched    #
+# together once all the shards have been processed. It writes no video, so it's cheap to run in a shard. #
+##########################################################################################################
+class TrackRecorder():
+
+    def __init__(self):
+        # track_id -> list of (frame_id, bbox, timestamp)
+        self.tracks = {}
+
+    def trackers_updated_callback(self, video_tracker):
+        frame_id = video_tracker.get_frame_count()
+        # The timestamp is the time the frame was processed in epoch seconds, the same as the STF writer of a serial run
+        timestamp = time.time()
+        for tracker in filter(lambda x: x.is_tracking(), video_tracker.get_live_trackers()):
+            bbox = tuple(int(v) for v in utils.get_sized_bbox_from_tracker(tracker))
+            self.tracks.setdefault(tracker.id, []).append((frame_id, bbox, timestamp))
+
+    def finish(self, total_trackers_started, total_trackers_finished):
+        pass
+
+# Split the video into shards, returns a list of (warmup_start_frame, start_frame, end_frame) in capture frame indices. The
+# last shard has an end frame of None so that it runs until the end of the stream, frame counts are rarely exact.
+def plan_shards(total_frames, shard_count, warmup_frames):
+    shard_count = max(1, min(shard_count, total_frames))
+    shard_length = total_frames // shard_count
+    shards = []
+    for i in range(shard_count):
+        start_frame = i * shard_length
+        end_frame = (i + 1) * shard_length if i < shard_count - 1 else None
+        warmup_start_frame = max(0, start_frame - warmup_frames)
+        shards.append((warmup_start_frame, start_frame, end_frame))
+    return shards
+
+# Process a single video file in shards and write the stitched annotations into the output directory
+def process_file_sharded(full_path, output_dir, app_settings):
+    root_name = os.path.splitext(os.path.basename(full_path))[0]
+
+    video = get_video_capture(app_settings, full_path)
+    if not video.isOpened():
+        print(f"Could not open video {full_path}")
+        return False
+    total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = video.get(cv2.CAP_PROP_FPS)
+    video.release()
+
+    if fps <= 0:
+        fps = 30
+    warmup_frames = int(app_settings['shard_warmup_seconds'] * fps)
+    shards = plan_shards(total_frames, app_settings['shard_count'], warmup_frames)
+    print(f"Processing {full_path} ({total_frames} frames) in {len(shards)} shards with a warm-up of {warmup_frames} frames")
+
+    # spawn rather than fork, OpenCV and its thread pools do not survive a fork very well
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(_process_shard_task, full_path, shard, app_settings) for shard in shards]
+        shard_tracks = [future.result() for future in futures]
+
+    annotations = stitch_shards(shards, shard_tracks, app_settings)
+
+    shard_output_dir = os.path.join(output_dir, root_name)
+    if not os.path.isdir(shard_output_dir):
+        os.mkdir(shard_output_dir)
+    filename = os.path.join(shard_output_dir, 'annotations.json')
+    with open(filename, 'w') as outfile:
+        json.dump(annotations, outfile, indent=2)
+    print(f"Finished processing {full_path}, {len(annotations['track_labels'])} tracks written to {filename}")
+    return True
+
+# Entry point for a shard worker process
+def _process_shard_task(full_path, shard, app_settings):
+    warmup_start_frame, start_frame, end_frame = shard
+    cv2.setNumThreads(app_settings['batch_worker_cv_threads'])
+
+    video = get_video_capture(app_settings, full_path)
+    if not video.isOpened():
+        raise Exception(f"Could not open video {full_path}")
+
+    recorder = TrackRecorder()
+    events = EventPublisher()
+    events.listen(recorder)
+    video_tracker = VideoTracker(app_settings, events, None)
+    controller = ShardVideoController(video, video_tracker, warmup_start_frame, start_frame, end_frame)
+    controller.run()
+    video.release()
+    return recorder.tracks
+
+# Stitch the tracks of all the shards together. Each shard owns the frames of its real range, warm-up frames are only used to
+# match the tracks that cross the boundary with the previous shard. Returns the annotations in STF format.
+def stitch_shards(shards, shard_tracks, settings):
+    next_track_id = 1
+    frames = {}
+    track_labels = {}
+    # global track id of the tracks of the previous shard, keyed by the shard local track id
+    previous_global_ids = {}
+    previous_tracks = {}
+
+    for i, ((_, start_frame, end_frame), tracks) in enumerate(zip(shards, shard_tracks)):
+        # convert capture frame indices into frame counts, the init frame (index 0) never gets a frame count
+        first_frame_id = start_frame - 1 if i > 0 else -1
+        last_frame_id = end_frame - 1 if end_frame is not None else None
+
+        matches = {}
+        if i > 0:
+            matches = _match_boundary_tracks(previous_tracks, tracks, first_frame_id, settings)
+
+        global_ids = {}
+        for track_id, entries in tracks.items():
+            owned = [e for e in entries if e[0] >= first_frame_id and (last_frame_id is None or e[0] < last_frame_id)]
+            if len(owned) == 0:
+                continue
+            if track_id in matches and matches[track_id] in previous_global_ids:
+                global_id = previous_global_ids[matches[track_id]]
+            else:
+                global_id = next_track_id
+                next_track_id += 1
+            global_ids[track_id] = global_id
+            track_labels[global_id] = 'unknown'
+            for frame_id, bbox, timestamp in owned:
+                frames.setdefault(frame_id, []).append({
+                    'bbox': bbox,
+                    'track_id': global_id,
+                    'timestamp': timestamp
+                })
+
+        previous_global_ids = global_ids
+        previous_tracks = {track_id: [e for e in entries if last_frame_id is None or e[0] < last_frame_id] for track_id, entries in tracks.items()}
+
+    return {
+        'track_labels': track_labels,
+        'frames': [{'frame': frame_id, 'annotations': frames[frame_id]} for frame_id in sorted(frames.keys())]
+    }
+
+# Match the tracks at the end of the previous shard with those at the start of the next one. Where both shards have seen the
+# same frame (the warm-up window of the next shard) we compare the bboxes on the last frame they have in common, otherwise the
+# last bbox of the previous track is compared with the first owned bbox of the next track. Returns next_id -> previous_id.
+def _match_boundary_tracks(previous_tracks, next_tracks, boundary_frame_id, settings):
+    max_gap = settings['shard_merge_max_frame_gap']
+    max_distance = settings['min_centre_point_distance_between_bboxes']
+    min_iou = settings['shard_merge_min_iou']
+
+    candidates = []
+    for previous_id, previous_entries in previous_tracks.items():
+        if len(previous_entries) == 0 or previous_entries[-1][0] < boundary_frame_id - 1 - max_gap:
+            continue
+        previous_by_frame = {e[0]: e[1] for e in previous_entries}
+        for next_id, next_entries in next_tracks.items():
+            owned = [e for e in next_entries if e[0] >= boundary_frame_id]
+            if len(owned) == 0 or owned[0][0] > boundary_frame_id + max_gap:
+                continue
+            common = [e for e in next_entries if e[0] < boundary_frame_id and e[0] in previous_by_frame]
+            if len(common) > 0:
+                previous_bbox = previous_by_frame[common[-1][0]]
+                next_bbox = common[-1][1]
+            else:
+                previous_bbox = previous_entries[-1][1]
+                next_bbox = owned[0][1]
+            distance = utils.calc_centre_point_distance(previous_bbox, next_bbox)
+            if utils.bbox_overlap(previous_bbox, next_bbox) > min_iou or distance < max_distance:
+                candidates.append((distance, previous_id, next_id))
+
+    # Greedy one to one assignment, closest pairs first
+    matches = {}
+    matched_previous = set()
+    for distance, previous_id, next_id in sorted(candidates):
+        if next_id in matches or previous_id in matched_previous:
+            continue
+        matches[next_id] = previous_id
+        matched_previous.add(previous_id)
+    return matches
@@ -11,10 +11,13 @@
 # all copies or substantial portions of the Software.
 
 import numpy as np
-from threading import Thread
+from threading import Lock
 from uap_tracker.stopwatch import Stopwatch
 import uap_tracker.utils as utils
-from uap_tracker.tracker import Tracker
+import uap_tracker.association as association
+from uap_tracker.tracker_engine import TrackerEngine
+from uap_tracker.spatial_grid import SpatialGrid
+from uap_tracker.frame_pipeline import FramePipeline
 
 ################################################################################################
 # This class is pretty much considered the application part of the Simple Tracker application. #
@@ -37,11 +40,20 @@ class VideoTracker():
         self.total_trackers_finished = 0
         self.total_trackers_started = 0
         self.live_trackers = []
+        self.track_associations = []
         self.events = events
         self.visualizer = visualizer
         self.frame_output = None
         self.frame_masked_background = None
         self.frames = {}
+        self.lazy_frames = {}
+        self.lazy_frames_lock = Lock()
+        self.frame_timestamp = None
+        self.frame_proc = None
+        self.frame_result = None
+        self.pipeline = None
+        self.tracker_engine = TrackerEngine.Select(self.settings)
+        self.tracker_grid = SpatialGrid(self.settings['tracker_grid_cell_size'])
 
         print(
             f"Initializing Tracker:\n  resize_frame:{self.settings['resize_frame']}\n  resize_dimension:{self.settings['resize_dimension']}\n  noise_reduction: {self.settings['noise_reduction']}\n  mask_type:{self.settings['mask_type']}\n  mask_pct:{self.settings['mask_pct']}\n  sensitivity:{self.settings['detection_sensitivity']}\n  max_active_trackers:{self.settings['max_active_trackers']}\n  tracker_type:{self.settings['tracker_type']}\n  blob_detector_type:{self.settings['blob_detector_type']}")
@@ -57,12 +69,15 @@ class VideoTracker():
         else:
             return trackers
 
-    # function to create trackers from extracted bboxes
-    def create_trackers_from_bboxes(self, tracker_type, bboxes, frame):
-        for bbox in bboxes:
+    # function to create trackers from extracted bboxes with the tracker engine
+    def create_trackers_from_bboxes(self, bboxes, frame):
+        for bbox in association.as_bbox_tuples(bboxes):
+            # Hit max trackers?
+            if len(self.live_trackers) >= self.settings['max_active_trackers']:
+                break
             # Initialize tracker with first frame and bounding box
-            if not utils.is_bbox_being_tracked(self.live_trackers, bbox):
-                self.create_and_add_tracker(tracker_type, frame, bbox)
+            if not self.tracker_grid.is_bbox_being_tracked(bbox):
+                self.create_and_add_tracker(frame, bbox)
 
     # function to create an add the tracker to the list of active trackers
     def create_and_add_tracker(self, frame, bbox):
@@ -70,39 +85,53 @@ class VideoTracker():
             raise Exception("null bbox")
 
         self.total_trackers_started += 1
-        tracker = Tracker(self.settings, self.total_trackers_started, frame, bbox)
-        tracker.update(frame)
+        tracker = self.tracker_engine.create_tracker(self.total_trackers_started, frame, bbox)
         self.live_trackers.append(tracker)
+        self.tracker_grid.insert(tracker)
 
     # function to update existing trackers and and it a target is not tracked then create a new tracker to track the target
     #
-    # trackers are run on seperate threads in the hope to speed up the applicaiton by taking advantage of parallelism
+    # trackers are updated by the tracker engine, either in batches on a long lived pool of threads or in worker processes,
+    # in the hope to speed up the applicaiton by taking advantage of parallelism
     def update_trackers(self, bboxes, frame):
 
-        unmatched_bboxes = bboxes.copy()
-        failed_trackers = []
-        tracker_count = len(self.live_trackers)
+        bboxes = association.as_bbox_tuples(bboxes)
+        results = self.tracker_engine.update_trackers(self.live_trackers, frame)
 
-        threads = [None] * tracker_count
-        results = [None] * tracker_count
+        if self.settings['track_association'] == 'legacy':
+            unmatched_bboxes = self._associate_legacy(bboxes, results)
+        else:
+            unmatched_bboxes = self._associate_global(bboxes, results)
+        self.tracker_engine.apply_detections(self.track_associations)
 
-        # Mike: We can do the tracker updates in parallel
-        # This will not work due to the GIL, need to split this processing using a different approach
-        for i in range(tracker_count):
-            tracker = self.live_trackers[i]
-            threads[i] = Thread(target=self.update_tracker_task, args=(tracker, frame, results, i))
-            threads[i].start()
+        # remove failed trackers from live tracking
+        failed_trackers = [tracker for tracker, (ok, bbox) in zip(self.live_trackers, results) if not ok]
+        for tracker in failed_trackers:
+            self.live_trackers.remove(tracker)
+            self.total_trackers_finished += 1
+        self.tracker_engine.remove_trackers(failed_trackers)
 
-        # Mike: We got to wait for the threads to join before we proceed
-        for i in range(tracker_count):
-            threads[i].join()
+        # The trackers have moved, so the spatial index of their bboxes is rebuilt before new trackers are added
+        self.tracker_grid.rebuild(self.live_trackers)
 
-        for i in range(tracker_count):
-            tracker = self.live_trackers[i]
+        # Add new detections to live tracker
+        if self.settings['track_association'] == 'legacy':
+            for new_bbox in unmatched_bboxes:
+                # Hit max trackers?
+                if len(self.live_trackers) < self.settings['max_active_trackers']:
+                    if not self.tracker_grid.is_bbox_being_tracked(new_bbox):
+                        self.create_and_add_tracker(frame, new_bbox)
+        else:
+            self._create_trackers_for_unmatched(unmatched_bboxes, frame)
+
+    # function to match the detections with the trackers one pair at a time, every detection near a tracker is matched with
+    # it. Returns the detections that did not match any tracker
+    def _associate_legacy(self, bboxes, results):
+        unmatched_bboxes = bboxes.copy()
+        self.track_associations = []
+
+        for i in range(len(self.live_trackers)):
             ok, bbox = results[i]
-            if not ok:
-                # Tracking failure
-                failed_trackers.append(tracker)
 
             # Try to match the new detections with this tracker
             for new_bbox in bboxes:
@@ -110,30 +139,48 @@ class VideoTracker():
                     # ensure the centre 
                     if utils.calc_centre_point_distance(bbox, new_bbox) < self.settings['min_centre_point_distance_between_bboxes']:
                         unmatched_bboxes.remove(new_bbox)
+                        self.track_associations.append((self.live_trackers[i], new_bbox))
 
-        # remove failed trackers from live tracking
-        for tracker in failed_trackers:
-            self.live_trackers.remove(tracker)
-            self.total_trackers_finished += 1
+        return unmatched_bboxes
 
-        # Add new detections to live tracker
-        for new_bbox in unmatched_bboxes:
+    # function to match the detections with the trackers in one go, the distances between all the trackers and detections
+    # are calculated as a matrix and each tracker that is still tracking is assigned at most one detection. Detections near a
+    # tracker that were not assigned to it are fragments of the same target and will not get a tracker of their own.
+    # Returns the detections that did not match any tracker
+    def _associate_global(self, bboxes, results):
+        tracker_boxes = association.as_bbox_array([bbox for ok, bbox in results])
+        detection_boxes = association.as_bbox_array(bboxes)
+        can_match = [ok for ok, bbox in results]
+
+        matches, unmatched = association.associate(tracker_boxes, detection_boxes, self.settings['min_centre_point_distance_between_bboxes'], can_match)
+
+        self.track_associations = [(self.live_trackers[i], bboxes[j]) for i, j in matches]
+        return [bboxes[j] for j in unmatched]
+
+    # function to create trackers for the detections that did not match a tracker, as long as they do not overlap with a target
+    # that is already being tracked, including the ones created for the previous detections
+    def _create_trackers_for_unmatched(self, unmatched_bboxes, frame):
+        for bbox in unmatched_bboxes:
             # Hit max trackers?
-            if len(self.live_trackers) < self.settings['max_active_trackers']:
-                if not utils.is_bbox_being_tracked(self.live_trackers, new_bbox):
-                    self.create_and_add_tracker(frame, new_bbox)
+            if len(self.live_trackers) >= self.settings['max_active_trackers']:
+                break
+            # The new trackers are added to the spatial index as they are created
+            if not self.tracker_grid.is_bbox_being_tracked(bbox):
+                self.create_and_add_tracker(frame, bbox)
 
     # function to initialise objects, using cuda streams apparently its important to allocated memory once versus over and over 
     # again as it improves performance
     def initialise(self, frame_proc, init_frame):
 
         # Mike: Initiliase the processor as well
+        self.frame_proc = frame_proc
         size = frame_proc.initialise(init_frame)
         size = (size[1], size[0], 3)
 
         #print(f'pre allocate size {size}')
 
-        # Mike: Preallocate the frames dictionary
+        # Preallocate the frames dictionary, these are placeholders until the first frame has been processed. The frames
+        # themselves are written into buffers from the pool of the frame processor
         self.frames = {
             self.FRAME_TYPE_GREY: np.empty(size[0:2], np.uint8),
             self.FRAME_TYPE_MASKED_BACKGROUND: np.empty(size[0:2], np.uint8),
@@ -141,26 +188,88 @@ class VideoTracker():
             self.FRAME_TYPE_ORIGINAL: np.empty(size, np.uint8)
         }
 
+        # When pipelining is enabled the preprocessing and detection stages of the next frames overlap the tracking of the
+        # current frame, the pipeline lives for as long as the processor does
+        if self.settings['pipeline_enabled']:
+            self.pipeline = FramePipeline(frame_proc, self.settings['pipeline_depth'])
+            self.pipeline.start()
+
     # main entry point of the application although it generally gets handed over to an specific implimentation of the
     # frame processor as soon as
-    def process_frame(self, frame_proc, frame, frame_count, fps, stream=None):
+    def process_frame(self, frame_proc, frame, frame_count, fps, stream=None, frame_timestamp=None):
+
+        if self.pipeline is not None:
+            # Submit the frame to the pipeline and track the oldest frame in flight once the pipeline is full, the
+            # results lag the frames that are submitted by the depth of the pipeline
+            self.pipeline.submit(frame, frame_count, fps, frame_timestamp)
+            if self.pipeline.is_full():
+                self._track_pipelined_frame()
+            return
 
         self.fps = fps
         self.frame_count = frame_count
+        self.frame_timestamp = frame_timestamp
         self.frames[self.FRAME_TYPE_ANNOTATED] = None
 
         with Stopwatch(mask='Frame '+str(frame_count)+': Took {s:0.4f} seconds to process', enable=self.settings['enable_stopwatch']):
 
-            bboxes = frame_proc.process_frame(self, frame, frame_count, fps, stream)
+            self.frame_result = frame_proc.detect_frame(frame_proc.preprocess_frame(frame, frame_count, stream), stream)
+            frame_proc.track_frame(self, self.frame_result, stream)
+
+            self._publish_frame()
+
+            # The listeners and visualizers are done with the frame, its buffers can be reused for the next frame
+            self._release_frame()
 
-            if self.events is not None:
-                self.events.publish_process_frame(self)
+    # the tracking stage of the pipeline, this runs on the calling thread as visualizers need to be run on the main thread
+    def _track_pipelined_frame(self):
+        self.frame_result, fps, frame_timestamp = self.pipeline.collect()
+
+        self.fps = fps
+        self.frame_count = self.frame_result.frame_count
+        self.frame_timestamp = frame_timestamp
+        self.frames[self.FRAME_TYPE_ANNOTATED] = None
 
-            if self.visualizer is not None:
-                self.visualizer.Visualize(self)
+        with Stopwatch(mask='Frame '+str(self.frame_count)+': Took {s:0.4f} seconds to track', enable=self.settings['enable_stopwatch']):
+
+            self.frame_proc.track_frame(self, self.frame_result, self.pipeline.stream)
+
+            self._publish_frame()
+
+            self._release_frame()
+
+    # publish the current frame to the listeners and visualizers
+    def _publish_frame(self):
+        if self.events is not None:
+            self.events.publish_process_frame(self)
+
+        if self.visualizer is not None:
+            self.visualizer.Visualize(self)
+
+    # release the buffers of the current frame back into the pool of the frame processor
+    def _release_frame(self):
+        self.lazy_frames = {}
+        self.frame_result.release_buffers()
+        self.frame_result = None
 
     # essentially shutdown the tracking applicaiton and clean up after yourself
     def finalise(self):
+        if self.pipeline is not None:
+            # Flush the frames that are still in flight before we finalise
+            while self.pipeline.has_pending():
+                self._track_pipelined_frame()
+            self.pipeline.stop()
+            self.pipeline = None
+
+        # The trackers that are still alive end here, even those started by the frames flushed out of the pipeline. The tracker
+        # engine is closed so they can't carry on into the next camera iteration.
+        self.total_trackers_finished += len(self.live_trackers)
+        self.tracker_engine.remove_trackers(self.live_trackers)
+        self.live_trackers = []
+        self.tracker_grid.rebuild(self.live_trackers)
+
+        self.tracker_engine.close()
+
         if self.events is not None:
             self.events.publish_finalise(
                 self.total_trackers_started, self.total_trackers_finished)
@@ -168,6 +277,7 @@ class VideoTracker():
     # called from listeners / visualizers
     # returns named image for current frame
     def get_image(self, frame_name):
+        self._load_lazy_image(frame_name)
         frame = None
         if frame_name in self.frames:
             frame = self.frames[frame_name]
@@ -178,7 +288,12 @@ class VideoTracker():
     def get_annotated_image(self, active_trackers_only=True):
         annotated_frame = self.get_image(self.FRAME_TYPE_ANNOTATED)
         if annotated_frame is None:
-            annotated_frame = self.frames[self.FRAME_TYPE_ORIGINAL].copy()
+            original_frame = self.get_image(self.FRAME_TYPE_ORIGINAL)
+            if self.frame_result is not None:
+                annotated_frame = self.frame_result.acquire_buffer(original_frame.shape, original_frame.dtype)
+                np.copyto(annotated_frame, original_frame)
+            else:
+                annotated_frame = original_frame.copy()
             if active_trackers_only:
                 for tracker in self.active_trackers():
                     utils.add_bbox_to_image(tracker.get_bbox(), annotated_frame, tracker.id, 1, tracker.bbox_color(), self.settings)
@@ -200,12 +315,28 @@ class VideoTracker():
 
     # utility function to add a frame to the dictionary for usage by listeners / visualizers
     def add_image(self, frame_name, frame):
+        self.lazy_frames.pop(frame_name, None)
         self.frames[frame_name] = frame
 
+    # utility function to add a frame that is only worked out when a listener / visualizer asks for it, the loader is called
+    # without arguments and returns the frame
+    def add_lazy_image(self, frame_name, loader):
+        self.lazy_frames[frame_name] = loader
+
+    # private function to work out a lazy frame if it has not been worked out yet
+    def _load_lazy_image(self, frame_name):
+        # The listeners run on their own threads, the first one to ask works the frame out and the others wait for it
+        with self.lazy_frames_lock:
+            loader = self.lazy_frames.pop(frame_name, None)
+            if loader is not None:
+                self.frames[frame_name] = loader()
+
     # funtions mainly called from listeners / visualizers
 
     # returns all images for current frame
     def get_images(self):
+        for frame_name in list(self.lazy_frames.keys()):
+            self._load_lazy_image(frame_name)
         return self.frames
 
     def get_fps(self):
@@ -214,9 +345,17 @@ class VideoTracker():
     def get_frame_count(self):
         return self.frame_count
 
+    # returns true if the current frame is idle, nothing changed and nothing is being tracked so nothing was detected on it
+    def is_frame_idle(self):
+        return self.frame_result is not None and self.frame_result.idle
+
+    # returns the media timestamp (in milliseconds) of the current frame, if the source provides one
+    def get_frame_timestamp(self):
+        return self.frame_timestamp
+
     def get_live_trackers(self):
         return self.live_trackers
 
-    # Mike: Identifying tasks that can be called on seperate threads to try and speed this sucker up
-    def update_tracker_task(self, tracker, frame, results, index):
-        results[index] = tracker.update(frame)
+    # returns the detections that were matched with a tracker on the current frame as a list of (tracker, bbox) tuples
+    def get_track_associations(self):
+        return self.track_associations
@@ -0,0 +1,115 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import numpy as np
+
+#####################################################################################################################################
+# NumPy implementation of the weighted moving variance background subtractor of the bgslibrary (BGS_WMV) and pysky360 (SKY_WMV).  #
+# The model is the last three frames, the mean and variance of each pixel are weighted 0.5 for the current frame, 0.3 for the     #
+# previous one and 0.2 for the one before that. A pixel is foreground when its weighted standard deviation is above the threshold.#
+# The frames are kept in a float32 ring buffer and all the intermediate results are written into buffers that are allocated when #
+# the first frame comes in, so there are no allocations per frame. The apply interface is the same as the other subtractors and    #
+# the model can be snapshotted with get_state / set_state, see the BackgroundModelStore.                                          #
+#####################################################################################################################################
+class WeightedMovingVariance():
+
+    WEIGHTS = (0.5, 0.3, 0.2)
+
+    def __init__(self, threshold=15):
+        self.threshold = threshold
+        # With weights that add up to one the weighted variance is the sum over each pair of frames of w_i * w_j times their
+        # squared difference. Scaled up by 100 the pair weights (0.15, 0.1 and 0.06) are whole numbers, so for 8 bit frames all
+        # the sums are whole numbers that a float32 holds exactly.
+        self.pair_weights = (round(self.WEIGHTS[0] * self.WEIGHTS[1] * 100), round(self.WEIGHTS[0] * self.WEIGHTS[2] * 100), round(self.WEIGHTS[1] * self.WEIGHTS[2] * 100))
+        # The libraries round the standard deviation to 8 bit before they threshold it, comparing the variance against the
+        # square of the rounding boundary gives the same mask without the square root. The rounding is half to even, so a
+        # standard deviation of exactly threshold + 0.5 only rounds up past the threshold when the threshold is odd.
+        self.variance_threshold = (threshold + 0.5) ** 2 * 100
+        self.is_above_threshold = np.greater_equal if threshold % 2 == 1 else np.greater
+        self.frames = None
+        self.index = 0
+        self.frame_count = 0
+        self.squared_difference = None
+        self.previous_squared_difference = None
+        self.variance = None
+        self.scratch = None
+        self.foreground_mask = None
+
+    # returns the foreground mask of the frame, 255 for foreground and 0 for background. The mask is empty until the model has
+    # seen three frames.
+    def apply(self, frame):
+        if self.frames is None or self.frames.shape[1:] != frame.shape:
+            self._allocate(frame.shape)
+
+        current = self.frames[self.index]
+        previous = self.frames[(self.index - 1) % len(self.WEIGHTS)]
+        before_previous = self.frames[(self.index - 2) % len(self.WEIGHTS)]
+        np.copyto(current, frame, casting='unsafe')
+        self.index = (self.index + 1) % len(self.WEIGHTS)
+        self.frame_count += 1
+
+        # The difference between the previous two frames was already worked out for the previous frame, so only the
+        # differences with the current frame are new
+        self.squared_difference, self.previous_squared_difference = self.previous_squared_difference, self.squared_difference
+        if self.frame_count >= 2:
+            np.subtract(current, previous, out=self.squared_difference)
+            np.square(self.squared_difference, out=self.squared_difference)
+
+        if self.frame_count < len(self.WEIGHTS):
+            return self.foreground_mask
+
+        np.subtract(current, before_previous, out=self.variance)
+        np.square(self.variance, out=self.variance)
+        np.multiply(self.variance, self.pair_weights[1], out=self.variance)
+        self._add_weighted(self.squared_difference, self.pair_weights[0])
+        self._add_weighted(self.previous_squared_difference, self.pair_weights[2])
+
+        # The comparison writes 0 / 1 straight into the bytes of the mask, which are then scaled up to 0 / 255
+        self.is_above_threshold(self.variance, self.variance_threshold, out=self.foreground_mask.view(np.bool_))
+        np.multiply(self.foreground_mask, 255, out=self.foreground_mask)
+        return self.foreground_mask
+
+    # returns the model as a dict of numpy arrays
+    def get_state(self):
+        if self.frames is None:
+            return {}
+        return {'frames': self.frames.copy(), 'index': np.array(self.index), 'frame_count': np.array(self.frame_count)}
+
+    # restore the model from a dict returned by get_state
+    def set_state(self, state):
+        if 'frames' not in state:
+            return
+        self._allocate(state['frames'].shape[1:])
+        np.copyto(self.frames, state['frames'])
+        self.index = int(state['index'])
+        self.frame_count = int(state['frame_count'])
+        if self.frame_count >= 2:
+            previous = self.frames[(self.index - 1) % len(self.WEIGHTS)]
+            before_previous = self.frames[(self.index - 2) % len(self.WEIGHTS)]
+            np.subtract(previous, before_previous, out=self.squared_difference)
+            np.square(self.squared_difference, out=self.squared_difference)
+
+    # private function to add the weighted squared difference to the variance
+    def _add_weighted(self, squared_difference, weight):
+        np.multiply(squared_difference, weight, out=self.scratch)
+        np.add(self.variance, self.scratch, out=self.variance)
+
+    # private function to allocate the ring buffer and the intermediate buffers for frames of the given shape
+    def _allocate(self, shape):
+        self.frames = np.zeros((len(self.WEIGHTS),) + tuple(shape), np.float32)
+        self.index = 0
+        self.frame_count = 0
+        self.squared_difference = np.empty(shape, np.float32)
+        self.previous_squared_difference = np.empty(shape, np.float32)
+        self.variance = np.empty(shape, np.float32)
+        self.scratch = np.empty(shape, np.float32)
+        self.foreground_mask = np.zeros(shape, np.uint8)
@@ -0,0 +1,89 @@
+# Original work Copyright (c) 2022 Sky360
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+
+import argparse
+import time
+import cv2
+import numpy as np
+from uap_tracker.weighted_moving_variance import WeightedMovingVariance
+
+try:
+    import pysky360 as sky360
+except ImportError:
+    sky360 = None
+
+# Benchmark of the NumPy weighted moving variance background subtractor (NP_WMV) against the pysky360 one (SKY_WMV). Both are
+# fed the same grey frames of a video, the throughput of each is reported along with how much their foreground masks differ.
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Compare the NP_WMV background subtractor with SKY_WMV.')
+
+    parser.add_argument('-f', '--file', help='Path to the video file to read the frames from')
+    parser.add_argument('--frames', type=int, default=300, help='Max number of frames to process')
+    parser.add_argument('--dimension', type=int, default=0, help='Resize the frames so that the largest dimension is this size')
+    parser = parser.parse_args(args)
+
+    if parser.file is None:
+        raise ValueError('Must provide --file to read the frames from,')
+
+    frames = read_grey_frames(parser.file, parser.frames, parser.dimension)
+    if len(frames) == 0:
+        raise ValueError(f'Unable to read any frames from {parser.file}')
+    print(f"Read {len(frames)} frames of h x w = {frames[0].shape[0]} x {frames[0].shape[1]}")
+
+    np_masks, np_seconds = run(WeightedMovingVariance(), frames)
+    report('NP_WMV', len(frames), np_seconds)
+
+    if sky360 is None:
+        print('pysky360 is not installed, SKY_WMV can not be compared.')
+        return
+
+    sky_masks, sky_seconds = run(sky360.WeightedMovingVariance(), frames)
+    report('SKY_WMV', len(frames), sky_seconds)
+    print(f"NP_WMV is {sky_seconds / np_seconds:0.2f}x the speed of SKY_WMV")
+
+    # Compare the foreground pixels of the masks, the libraries don't all use 255 for the foreground
+    different = [np.count_nonzero((np_mask > 0) != (sky_mask > 0)) for np_mask, sky_mask in zip(np_masks, sky_masks)]
+    foreground = sum(np.count_nonzero(sky_mask) for sky_mask in sky_masks)
+    print(f"Foreground mask pixels that differ: {sum(different)} of {foreground} SKY_WMV foreground pixels, "
+          f"identical frames: {different.count(0)} of {len(frames)}")
+
+# Utility function to read the frames of a video as grey frames
+def read_grey_frames(path, max_frames, dimension):
+    frames = []
+    capture = cv2.VideoCapture(path)
+    while len(frames) < max_frames:
+        success, frame = capture.read()
+        if not success:
+            break
+        if dimension > 0:
+            h, w = frame.shape[:2]
+            scale = dimension / max(w, h)
+            frame = cv2.resize(frame, (round(w * scale), round(h * scale)))
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    capture.release()
+    return frames
+
+# Utility function to run the background subtractor over the frames, returns a tuple of (masks, seconds)
+def run(background_subtractor, frames):
+    masks = []
+    start = time.perf_counter()
+    for frame in frames:
+        # NP_WMV reuses its mask buffer so the masks are copied, for both of them so that the timing stays fair
+        masks.append(background_subtractor.apply(frame).copy())
+    return masks, time.perf_counter() - start
+
+# Utility function to print the throughput of a background subtractor
+def report(name, frame_count, seconds):
+    print(f"{name}: {frame_count / seconds:0.1f} fps ({seconds * 1000 / frame_count:0.2f} ms per frame)")
+
+if __name__ == '__main__':
+    main()